@@ -10,6 +10,8 @@ User.assert_can...
 import datetime
 from django.db import transaction
 from askbot.models import Repute
+from askbot.models.repute import votes_of_day, upvote_reputation_of_day
+from askbot.models.repute import update_counters_after_commit
 #from askbot.models import Problem
 from askbot.models import signals
 from askbot.conf import settings as askbot_settings
@@ -17,6 +19,19 @@ from askbot.conf import settings as askbot_settings
 ###########################################
 ## actions and reputation changes event
 ###########################################
+def save_vote(vote):
+    """saves the vote and counts it in the votes
+    of the day, if it is a new one"""
+    is_new = vote.pk is None
+    vote.save()
+    if is_new:
+        votes_of_day.add(vote.user_id, 1, vote.voted_at.date())
+
+def delete_vote(vote):
+    """deletes the vote and removes it from the votes of the day"""
+    vote.delete()
+    votes_of_day.add(vote.user_id, -1, vote.voted_at.date())
+
 @transaction.commit_on_success
 def onFlaggedItem(post, user, timestamp=None):
     if timestamp is None:
@@ -255,11 +270,12 @@ def onProblemAcceptCanceled(problem, user, timestamp=None):
                reputation=user.reputation)
     reputation.save()
 
+@update_counters_after_commit
 @transaction.commit_on_success
 def onUpVoted(vote, post, user, timestamp=None):
     if timestamp is None:
         timestamp = datetime.datetime.now()
-    vote.save()
+    save_vote(vote)
 
     if post.post_type != 'comment':
         post.vote_up_count = int(post.vote_up_count) + 1
@@ -288,12 +304,18 @@ def onUpVoted(vote, post, user, timestamp=None):
                        reputation_type=1,
                        reputation=author.reputation)
             reputation.save()
+            upvote_reputation_of_day.add(
+                author.id,
+                askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE,
+                timestamp.date()
+            )
 
+@update_counters_after_commit
 @transaction.commit_on_success
 def onUpVotedCanceled(vote, post, user, timestamp=None):
     if timestamp is None:
         timestamp = datetime.datetime.now()
-    vote.delete()
+    delete_vote(vote)
 
     if post.post_type != 'comment':
         post.vote_up_count = int(post.vote_up_count) - 1
@@ -325,12 +347,18 @@ def onUpVotedCanceled(vote, post, user, timestamp=None):
             reputation=author.reputation
         )
         reputation.save()
+        upvote_reputation_of_day.add(
+            author.id,
+            askbot_settings.REP_LOSS_FOR_RECEIVING_UPVOTE_CANCELATION,
+            timestamp.date()
+        )
 
+@update_counters_after_commit
 @transaction.commit_on_success
 def onDownVoted(vote, post, user, timestamp=None):
     if timestamp is None:
         timestamp = datetime.datetime.now()
-    vote.save()
+    save_vote(vote)
 
     post.vote_down_count = int(post.vote_down_count) + 1
     post.points = int(post.points) - 1
@@ -366,11 +394,12 @@ def onDownVoted(vote, post, user, timestamp=None):
                    reputation=user.reputation)
         reputation.save()
 
+@update_counters_after_commit
 @transaction.commit_on_success
 def onDownVotedCanceled(vote, post, user, timestamp=None):
     if timestamp is None:
         timestamp = datetime.datetime.now()
-    vote.delete()
+    delete_vote(vote)
 
     post.vote_down_count = int(post.vote_down_count) - 1
     if post.vote_down_count < 0:
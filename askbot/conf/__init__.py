@@ -35,7 +35,9 @@ def should_show_sort_by_relevance():
     """True if configuration support sorting
     exercises by search relevance
     """
-    return ('postgresql_psycopg2' in askbot.get_database_engine_name())
+    from askbot.search import inverted_index
+    return ('postgresql_psycopg2' in askbot.get_database_engine_name()) \
+        or inverted_index.is_enabled()
 
 def get_tag_display_filter_strategy_choices():
     from askbot import const
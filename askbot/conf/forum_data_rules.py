@@ -5,6 +5,7 @@ from askbot.conf.settings_wrapper import settings
 from askbot.deps import livesettings
 from askbot import const
 from askbot.conf.super_groups import DATA_AND_FORMATTING
+from askbot.utils.markup import update_parser_settings_callback
 from django.utils.translation import ugettext as _
 
 FORUM_DATA_RULES = livesettings.ConfigurationGroup(
@@ -33,6 +34,7 @@ settings.register(
         FORUM_DATA_RULES,
         'ENABLE_VIDEO_EMBEDDING',
         default = False,
+        update_callback = update_parser_settings_callback,
         description = _('Enable embedding videos. '),
         help_text = _(
             '<em>Note: please read <a href="%(url)s">read this</a> first.</em>'
@@ -380,6 +382,22 @@ settings.register(
     )
 )
 
+settings.register(
+    livesettings.BooleanValue(
+        FORUM_DATA_RULES,
+        'EXERCISE_LIST_KEYSET_PAGINATION',
+        default=False,
+        description=_('Use fast pagination on the exercise list'),
+        help_text=_(
+            'With this option the "next page" links on the lists '
+            'sorted by activity, date or votes continue after the '
+            'last exercise of the page, instead of counting exercises '
+            'from the start, which makes deep pages fast. '
+            'The page count is then approximate.'
+        )
+    )
+)
+
 settings.register(
     livesettings.StringValue(
         FORUM_DATA_RULES,
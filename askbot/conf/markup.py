@@ -7,6 +7,7 @@ from askbot.conf.super_groups import DATA_AND_FORMATTING
 from askbot.deps.livesettings import ConfigurationGroup
 from askbot.deps.livesettings import BooleanValue, StringValue, LongStringValue
 from askbot import const
+from askbot.utils.markup import update_parser_settings_callback
 from django.utils.translation import ugettext as _
 import re
 
@@ -33,6 +34,10 @@ def regex_settings_validation(*args):
         # The regex is invalid, so we overwrite it with empty string
         return ""
 
+def auto_link_patterns_callback(old_value, new_value):
+    new_value = regex_settings_validation(old_value, new_value)
+    return update_parser_settings_callback(old_value, new_value)
+
 
 settings.register(
     BooleanValue(
@@ -47,6 +52,7 @@ settings.register(
             'implicitly turns this feature on, because '
             'underscores are heavily used in LaTeX input.'
         ),
+        update_callback = update_parser_settings_callback,
         default = False
     )
 )
@@ -63,6 +69,7 @@ settings.register(
                     ) % {
                             'url': const.DEPENDENCY_URLS['mathjax'],
                         },
+        update_callback = update_parser_settings_callback,
         default = False
     )
 )
@@ -94,6 +101,7 @@ settings.register(
             'the application  will be able to '
             'detect patterns and auto link to URLs'        
         ),
+        update_callback = update_parser_settings_callback,
         default = False
     )
 )
@@ -115,7 +123,7 @@ settings.register(
             ' Please look up more information about regular'
             ' expressions elsewhere.'
         ),
-        update_callback=regex_settings_validation,
+        update_callback=auto_link_patterns_callback,
         default = ''
         )
     )
@@ -136,6 +144,7 @@ settings.register(
             ' and the entry in the post #123'
             ' will produce link to the bug 123 in the redhat bug tracker.'
         ),
+        update_callback = update_parser_settings_callback,
         default = ''
     )
 )
@@ -146,3 +146,23 @@ settings.register(
         description = _('Name for the Anonymous user')
     )
 )
+
+LAST_SEEN_UPDATE_MODE_CHOICES = (
+    ('sync', _('on every page view')),
+    ('buffered', _('in batches'))
+)
+
+settings.register(
+    livesettings.StringValue(
+        USER_SETTINGS,
+        'LAST_SEEN_UPDATE_MODE',
+        default = 'sync',
+        choices = LAST_SEEN_UPDATE_MODE_CHOICES,
+        description = _('Save time of the last visit of the users'),
+        help_text = _(
+            'In batches - the time is written to the database '
+            'once in a minute for all users that visited the site, '
+            'the first visit of the day is always saved right away'
+        )
+    )
+)
@@ -278,6 +278,23 @@ RESPONSE_ACTIVITY_TYPES_FOR_DISPLAY = (
 #    TYPE_ACTIVITY_FAVORITE,
 )
 
+#activities counted in the denormalized response counters of the users
+RESPONSE_ACTIVITY_TYPES_FOR_COUNTS = RESPONSE_ACTIVITY_TYPES_FOR_DISPLAY + (
+    TYPE_ACTIVITY_MENTION,
+)
+
+#activities shown on the "recent" tab of the user profile
+USER_TIMELINE_ACTIVITY_TYPES = (
+    TYPE_ACTIVITY_ASK_EXERCISE,
+    TYPE_ACTIVITY_PROBLEM,
+    TYPE_ACTIVITY_COMMENT_EXERCISE,
+    TYPE_ACTIVITY_COMMENT_PROBLEM,
+    TYPE_ACTIVITY_UPDATE_EXERCISE,
+    TYPE_ACTIVITY_UPDATE_PROBLEM,
+    TYPE_ACTIVITY_MARK_PROBLEM,
+    TYPE_ACTIVITY_PRIZE,
+)
+
 RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES = {
     TYPE_ACTIVITY_COMMENT_EXERCISE: 'exercise_comment',
     TYPE_ACTIVITY_COMMENT_PROBLEM: 'problem_comment',
@@ -20,6 +20,10 @@ from askbot.utils.file_utils import store_file
 from askbot.utils.html import absolutize_urls
 
 from bs4 import BeautifulSoup
+
+#how many messages are sent through one smtp session
+MESSAGES_PER_CONNECTION = 100
+
 #todo: maybe send_mail functions belong to models
 #or the future API
 def prefix_the_subject_line(subject):
@@ -94,6 +98,28 @@ def clean_html_email(email_body):
 
     return '\n\n'.join(phrases)
 
+def build_message(
+            subject_line = None,
+            body_text = None,
+            from_email = django_settings.DEFAULT_FROM_EMAIL,
+            recipient_list = None,
+            headers = None,
+        ):
+    """returns html email message with the plain text
+    alternative, ready to be sent"""
+    assert(subject_line is not None)
+    body_text = absolutize_urls(body_text)
+    subject_line = prefix_the_subject_line(subject_line)
+    msg = mail.EmailMultiAlternatives(
+                    subject_line,
+                    clean_html_email(body_text),
+                    from_email,
+                    recipient_list,
+                    headers = headers
+                )
+    msg.attach_alternative(body_text, "text/html")
+    return msg
+
 def send_mail(
             subject_line = None,
             body_text = None,
@@ -117,18 +143,14 @@ def send_mail(
 
     if raise_on_failure is True, exceptions.EmailNotSent is raised
     """
-    body_text = absolutize_urls(body_text)
     try:
-        assert(subject_line is not None)
-        subject_line = prefix_the_subject_line(subject_line)
-        msg = mail.EmailMultiAlternatives(
-                        subject_line,
-                        clean_html_email(body_text),
-                        from_email,
-                        recipient_list,
-                        headers = headers
-                    )
-        msg.attach_alternative(body_text, "text/html")
+        msg = build_message(
+                    subject_line = subject_line,
+                    body_text = body_text,
+                    from_email = from_email,
+                    recipient_list = recipient_list,
+                    headers = headers
+                )
         msg.send()
         if related_object is not None:
             assert(activity_type is not None)
@@ -137,6 +159,42 @@ def send_mail(
         if raise_on_failure == True:
             raise exceptions.EmailNotSent(unicode(error))
 
+def send_messages(messages, chunk_size = MESSAGES_PER_CONNECTION):
+    """sends prepared email messages through one connection,
+    which is re-opened after every ``chunk_size`` messages
+    and after a failure
+
+    failures do not interrupt the sending, they are logged
+    and returned as a list of (message, error) tuples
+    """
+    failures = list()
+    connection = mail.get_connection()
+    for start in xrange(0, len(messages), chunk_size):
+        chunk = messages[start:start + chunk_size]
+        try:
+            connection.open()
+        except Exception, error:
+            logging.critical(unicode(error))
+            failures.extend([(message, error) for message in chunk])
+            continue
+        try:
+            for message in chunk:
+                message.connection = connection
+                try:
+                    message.send()
+                except Exception, error:
+                    logging.critical(unicode(error))
+                    failures.append((message, error))
+                    #the session may be broken after an error
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception, error:
+                        logging.critical(unicode(error))
+        finally:
+            connection.close()
+    return failures
+
 def mail_moderators(
             subject_line = '',
             body_text = '',
@@ -0,0 +1,62 @@
+"""measures the time of converting the stored post texts
+to html with the markdown parser reused by ``askbot.utils.markup.get_parser``
+and with a parser configured anew for every text, as it was done before
+
+python manage.py benchmark_markup_parser --posts=200 --repeat=5
+"""
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand, CommandError
+from askbot.models import Post
+from askbot.utils import markup
+
+class Command(NoArgsCommand):
+    help = 'Benchmarks markdown conversion of the stored posts'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--posts',
+            action = 'store',
+            type = 'int',
+            dest = 'posts',
+            default = 200,
+            help = 'number of the most recent posts to convert'
+        ),
+        make_option('--repeat',
+            action = 'store',
+            type = 'int',
+            dest = 'repeat',
+            default = 5,
+            help = 'number of times the posts are converted'
+        ),
+    )
+
+    def handle_noargs(self, **options):
+        texts = list(
+            Post.objects.exclude(
+                text = ''
+            ).order_by(
+                '-added_at'
+            ).values_list(
+                'text', flat = True
+            )[:options['posts']]
+        )
+        if len(texts) == 0:
+            raise CommandError('there are no posts to convert')
+        repeat = options['repeat']
+
+        start = time.time()
+        for idx in xrange(repeat):
+            old_html = [markup.create_parser().convert(text) for text in texts]
+        old_time = (time.time() - start) / repeat
+
+        start = time.time()
+        for idx in xrange(repeat):
+            new_html = [markup.get_parser().convert(text) for text in texts]
+        new_time = (time.time() - start) / repeat
+
+        if old_html != new_html:
+            raise CommandError('the two parsers give different html')
+
+        print 'conversion of %d posts, average of %d runs' % (len(texts), repeat)
+        print 'new parser per post: %.2f ms' % (old_time * 1000)
+        print 'reused parser: %.2f ms' % (new_time * 1000)
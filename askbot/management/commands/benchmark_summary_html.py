@@ -0,0 +1,93 @@
+"""measures the time of filling the tag urls into
+the cached exercise summaries of one listing page,
+with the single pass substitution used by ``Thread.get_summary_html``
+and with the former search and replace loop
+
+python manage.py benchmark_summary_html --threads=50 --repeat=20
+"""
+import re
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand, CommandError
+from askbot import const
+from askbot.models import Thread
+from askbot.search.state_manager import SearchState
+
+def fill_tag_urls_by_search_and_replace(html, search_state):
+    """the substitution as it was done before"""
+    regex = re.compile(
+        r'<<<(%s)>>>' % const.TAG_REGEX_BARE,
+        re.UNICODE
+    )
+    while True:
+        match = regex.search(html)
+        if not match:
+            break
+        seq = match.group(0)
+        tag = match.group(1)
+        full_url = search_state.add_tag(tag).full_url()
+        html = html.replace(seq, full_url)
+    return html
+
+def get_search_state():
+    """search state of a typical request - with one selected tag"""
+    search_state = SearchState.get_empty()
+    return search_state.add_tag('benchmark')
+
+
+class Command(NoArgsCommand):
+    help = 'Benchmarks filling tag urls into the exercise summaries'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--threads',
+            action = 'store',
+            type = 'int',
+            dest = 'threads',
+            default = 50,
+            help = 'number of threads on the listing page'
+        ),
+        make_option('--repeat',
+            action = 'store',
+            type = 'int',
+            dest = 'repeat',
+            default = 20,
+            help = 'number of times the listing is rendered'
+        ),
+    )
+
+    def handle_noargs(self, **options):
+        threads = list(
+            Thread.objects.order_by('-last_activity_at')[:options['threads']]
+        )
+        if len(threads) == 0:
+            raise CommandError('there are no threads to render')
+        repeat = options['repeat']
+
+        #make sure that both variants work with the cached summaries
+        Thread.objects.precache_summary_html(threads)
+        summaries = [thread.get_cached_summary_html() for thread in threads]
+
+        start = time.time()
+        for idx in xrange(repeat):
+            search_state = get_search_state()
+            old_html = [
+                fill_tag_urls_by_search_and_replace(html, search_state)
+                for html in summaries
+            ]
+        old_time = (time.time() - start) / repeat
+
+        start = time.time()
+        for idx in xrange(repeat):
+            search_state = get_search_state()#new memo on each request
+            new_html = [
+                thread.get_summary_html(search_state = search_state)
+                for thread in threads
+            ]
+        new_time = (time.time() - start) / repeat
+
+        if old_html != new_html:
+            raise CommandError('the two substitutions give different html')
+
+        print 'listing of %d threads, average of %d runs' % (len(threads), repeat)
+        print 'search and replace loop: %.2f ms' % (old_time * 1000)
+        print 'single pass substitution: %.2f ms' % (new_time * 1000)
@@ -0,0 +1,126 @@
+"""measures the time of recording the inbox notifications
+about a new problem posted to a thread with many participants,
+with the multi-row insert of the audit records and set-based
+update of the response counters used by ``Post.issue_update_notifications``
+and with the former row by row saves and recounts
+
+All data created by the benchmark is rolled back.
+
+python manage.py benchmark_update_notifications --followers=2000
+"""
+import datetime
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from askbot import const
+from askbot import models
+
+def add_recipients_row_by_row(activity, recipients):
+    """the fan-out as it was done before"""
+    for recipient in recipients:
+        aas = models.ActivityAuditStatus(user = recipient, activity = activity)
+        aas.save()
+    for recipient in recipients:
+        recipient.update_response_counts()
+
+def add_recipients_in_bulk(activity, recipients):
+    activity.add_recipients(recipients)
+    models.increment_new_response_counts(recipients)
+
+class Command(NoArgsCommand):
+    help = 'Benchmarks recording of notifications about a new problem'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--followers',
+            action = 'store',
+            type = 'int',
+            dest = 'followers',
+            default = 2000,
+            help = 'number of users participating in the thread'
+        ),
+    )
+
+    def create_thread(self, followers):
+        """creates exercise commented by ``followers`` users,
+        all of them will receive notifications about a new problem
+        """
+        author = models.User.objects.create_user(
+                                        'benchmark-author',
+                                        'benchmark-author@example.com'
+                                    )
+        exercise = author.post_exercise(
+                                    title = 'benchmark exercise',
+                                    body_text = 'benchmark exercise text',
+                                    tags = 'benchmark'
+                                )
+        timestamp = datetime.datetime.now()
+        for idx in xrange(followers):
+            user = models.User.objects.create_user(
+                                    'benchmark-follower-%d' % idx,
+                                    'benchmark-follower-%d@example.com' % idx
+                                )
+            #comments are saved directly, so that the setup
+            #does not itself send the notifications
+            models.Post(
+                post_type = 'comment',
+                thread = exercise.thread,
+                parent = exercise,
+                author = user,
+                added_at = timestamp,
+                text = 'benchmark comment',
+                html = 'benchmark comment'
+            ).save()
+        return author, exercise
+
+    def time_fan_out(self, add_recipients, exercise, recipients):
+        activity = models.Activity(
+                            user = exercise.author,
+                            active_at = datetime.datetime.now(),
+                            content_object = exercise,
+                            activity_type = const.TYPE_ACTIVITY_PROBLEM,
+                            exercise = exercise
+                        )
+        activity.save()
+        start = time.time()
+        add_recipients(activity, recipients)
+        return time.time() - start
+
+    def handle_noargs(self, **options):
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            author, exercise = self.create_thread(options['followers'])
+            recipients = list(
+                models.User.objects.filter(
+                    username__startswith = 'benchmark-follower-'
+                )
+            )
+
+            old_time = self.time_fan_out(
+                                add_recipients_row_by_row,
+                                exercise,
+                                recipients
+                            )
+            new_time = self.time_fan_out(
+                                add_recipients_in_bulk,
+                                exercise,
+                                recipients
+                            )
+
+            start = time.time()
+            models.Post.objects.create_new_problem(
+                                thread = exercise.thread,
+                                author = author,
+                                added_at = datetime.datetime.now(),
+                                text = 'benchmark problem'
+                            )
+            problem_time = time.time() - start
+        finally:
+            transaction.rollback()
+            transaction.leave_transaction_management()
+
+        print 'notifications to %d recipients' % len(recipients)
+        print 'row by row saves and recounts: %.2f ms' % (old_time * 1000)
+        print 'bulk insert and counter update: %.2f ms' % (new_time * 1000)
+        print 'posting of the problem: %.2f ms' % (problem_time * 1000)
@@ -0,0 +1,14 @@
+"""recalculates the lists of similar threads
+shown on the exercise page
+
+python manage.py build_similar_threads
+"""
+from django.core.management.base import NoArgsCommand
+from askbot.models import ThreadSimilarity
+
+class Command(NoArgsCommand):
+    def handle_noargs(self, **options):
+        print "Rebuilding similar threads"
+        ThreadSimilarity.objects.rebuild()
+        count = ThreadSimilarity.objects.count()
+        print "%d similar threads stored" % count
@@ -0,0 +1,14 @@
+"""rebuilds the index of tag selections used to find
+subscribers to the tags of the new posts
+
+python manage.py build_tag_subscriber_index
+"""
+from django.core.management.base import NoArgsCommand
+from askbot.models import TagSubscriberIndex
+
+class Command(NoArgsCommand):
+    def handle_noargs(self, **options):
+        print "Rebuilding tag subscriber index"
+        TagSubscriberIndex.objects.rebuild()
+        count = TagSubscriberIndex.objects.count()
+        print "%d entries indexed" % count
@@ -1,23 +1,24 @@
 from django.core.management.base import NoArgsCommand
 from django.db import transaction
 from askbot import models
-from askbot.utils.console import ProgressBar
 from askbot.conf import settings as askbot_settings
+from askbot.utils.db import filter_in_chunks
 import sys
 
 class Command(NoArgsCommand):
     @transaction.commit_manually
     def handle_noargs(self, **options):
-        tags = models.Tag.objects.all()
-        message = 'Searching for unused tags:'
-        total = tags.count()
-        tags = tags.iterator()
+        print 'Searching for unused tags:'
+        #tags without threads are found with one query
+        #and deleted in chunks
+        unused_tags = models.Tag.objects.filter(threads__isnull = True)
+        unused_tag_ids = list(unused_tags.values_list('id', flat = True))
         deleted_tags = list()
-        for tag in ProgressBar(tags, total, message):
-            if not tag.threads.exists():
-                deleted_tags.append(tag.name)
-                tag.delete()
+        for tags in filter_in_chunks(unused_tags, 'id', unused_tag_ids):
+            deleted_tags.extend(tags.values_list('name', flat = True))
+            tags.delete()
             transaction.commit()
+        transaction.commit()
 
         if deleted_tags:
             found_count = len(deleted_tags)
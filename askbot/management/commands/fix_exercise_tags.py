@@ -77,3 +77,8 @@ class Command(NoArgsCommand):
             print '%d problem exercises found, tag records restored' % found_count
         else:
             print 'Did not find any problems'
+
+        #the use counts are adjusted incrementally by the retagging,
+        #so after the repairs all of them are counted again
+        models.Tag.objects.update_use_counts(models.Tag.objects.all())
+        transaction.commit()
@@ -0,0 +1,25 @@
+"""builds the index of the built-in full text search,
+enabled by ``ENABLE_BUILTIN_SEARCH = True`` in the settings.py,
+from the existing threads and users
+"""
+from django.core.management.base import NoArgsCommand
+from askbot.models import Thread, User
+from askbot.search import inverted_index
+from askbot.utils.console import ProgressBar
+
+class Command(NoArgsCommand):
+    help = 'Rebuilds the index of the built-in full text search'
+
+    def handle_noargs(self, **options):
+        inverted_index.SearchPosting.objects.all().delete()
+        inverted_index.SearchDocument.objects.all().delete()
+
+        message = 'Indexing threads'
+        count = Thread.objects.count()
+        for thread in ProgressBar(Thread.objects.iterator(), count, message):
+            inverted_index.index_thread(thread)
+
+        message = 'Indexing users'
+        count = User.objects.count()
+        for user in ProgressBar(User.objects.iterator(), count, message):
+            inverted_index.index_user(user)
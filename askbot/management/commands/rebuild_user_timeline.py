@@ -0,0 +1,31 @@
+"""builds the entries shown on the "recent" tab
+of the user profiles from the existing activities
+"""
+from django.core.management.base import NoArgsCommand
+from askbot import const
+from askbot.models import Activity, UserTimelineEntry
+from askbot.utils.console import ProgressBar
+from askbot.utils.db import bulk_create
+
+BATCH_SIZE = 500
+
+class Command(NoArgsCommand):
+    help = 'Rebuilds the activity timelines of the user profiles'
+
+    def handle_noargs(self, **options):
+        UserTimelineEntry.objects.all().delete()
+
+        activities = Activity.objects.filter(
+                    activity_type__in = const.USER_TIMELINE_ACTIVITY_TYPES
+                )
+        message = 'Building user timelines'
+        count = activities.count()
+        entries = list()
+        for activity in ProgressBar(activities.iterator(), count, message):
+            entry = UserTimelineEntry.objects.build_for_activity(activity)
+            if entry is not None:
+                entries.append(entry)
+            if len(entries) == BATCH_SIZE:
+                bulk_create(entries)
+                entries = list()
+        bulk_create(entries)
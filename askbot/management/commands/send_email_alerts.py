@@ -1,10 +1,14 @@
+import collections
 import datetime
+import time
+from optparse import make_option
 from django.core.management.base import NoArgsCommand
 from django.core.urlresolvers import reverse
 from django.db import connection
-from django.db.models import Q, F
 from askbot.models import User, Post, PostRevision, Thread
-from askbot.models import Activity, EmailFeedSetting
+from askbot.models import Activity, ActivityAuditStatus, EmailFeedSetting
+from askbot.models import ExerciseView, PostToGroup, Tag
+from askbot.models import get_user_tag_filters
 from django.utils.translation import ugettext as _
 from django.utils.translation import ungettext
 from django.conf import settings as django_settings
@@ -13,20 +17,19 @@ from django.utils.datastructures import SortedDict
 from django.contrib.contenttypes.models import ContentType
 from askbot import const
 from askbot import mail
+from askbot.utils.db import bulk_create, filter_in_chunks
 from askbot.utils.slug import slugify
 
 DEBUG_THIS_COMMAND = False
 
-def get_all_origin_posts(mentions):
-    origin_posts = set()
-    for mention in mentions:
-        post = mention.content_object
-        origin_posts.add(post.get_origin_post())
-    return list(origin_posts)
+DEFAULT_BATCH_SIZE = 200
+#exercises are read in chunks of this size when looking
+#for matches of the tag-filtered "all exercises" subscriptions
+EXERCISE_SCAN_CHUNK_SIZE = 500
 
 #todo: refactor this as class
 def extend_exercise_list(
-                    src, dst, cutoff_time = None, 
+                    src, dst, cutoff_time = None,
                     limit=False, add_mention=False,
                     add_comment = False
                 ):
@@ -73,421 +76,864 @@ def format_action_count(string, number, output):
     if number > 0:
         output.append(_(string) % {'num':number})
 
-class Command(NoArgsCommand):
-    def handle_noargs(self, **options):
-        if askbot_settings.ENABLE_EMAIL_ALERTS:
-            try:
-                try:
-                    self.send_email_alerts()
-                except Exception, e:
-                    print e
-            finally:
-                connection.close()
 
-    def get_updated_exercises_for_user(self, user):
-        """
-        retreive relevant exercise updates for the user
-        according to their subscriptions and recorded exercise
-        views
+class PhaseTimer(object):
+    """accumulates wall clock time spent in named phases,
+    only one phase runs at a time
+    """
+    def __init__(self):
+        self.timings = SortedDict()
+        self.phase = None
+        self.started_at = None
+
+    def start(self, phase):
+        self.stop()
+        self.phase = phase
+        self.started_at = time.time()
+
+    def stop(self):
+        if self.phase is None:
+            return
+        elapsed = time.time() - self.started_at
+        self.timings[self.phase] = self.timings.get(self.phase, 0) + elapsed
+        self.phase = None
+
+    def format_report(self):
+        lines = list()
+        for phase, elapsed in self.timings.items():
+            lines.append('%-12s %9.3fs' % (phase, elapsed))
+        lines.append('%-12s %9.3fs' % ('total', sum(self.timings.values())))
+        return '\n'.join(lines)
+
+
+class DigestBatch(object):
+    """calculates email digests for a block of users
+
+    The data is read with a fixed number of set-based queries
+    per block - feed settings, exercise views, email update
+    activity records, candidate exercises and the news about them,
+    and the digests are then assembled in memory, following
+    the same rules as the one-user-at-a-time version of the mailer did.
+    """
+    def __init__(self, users, timer = None):
+        self.users = SortedDict([(user.id, user) for user in users])
+        self.timer = timer or PhaseTimer()
+        self.now = datetime.datetime.now()
+        self.post_content_type = ContentType.objects.get_for_model(Post)
+        self.max_alerts = askbot_settings.MAX_ALERTS_PER_EMAIL
+        #user id --> {feed type: cutoff time} of feeds ripe for sending
+        self.ripe_feeds = SortedDict()
+        #user id --> {exercise id: earliest view time}
+        self.views = collections.defaultdict(dict)
+        #thread id --> exercise post, with the thread preloaded
+        self.exercises = dict()
+        #(user id, exercise id) --> (activity id, active_at)
+        self.email_activity = dict()
+        #user id --> time of the previous "all exercises" report or None
+        self.q_all_reported_at = dict()
+
+    def get_digests(self):
+        """returns list of (user, exercise list) tuples,
+        exercise list is an ordered dictionary keyed
+        by the exercise posts, the same as returned by
+        :meth:`Command.get_updated_exercises_for_user`
         """
+        self.timer.start('feeds')
+        self.load_feeds()
+        if len(self.ripe_feeds) == 0:
+            self.timer.stop()
+            return list()
 
-        user_feeds = EmailFeedSetting.objects.filter(
-                                                subscriber=user
-                                            ).exclude(
-                                                frequency__in=('n', 'i')
-                                            )
+        self.timer.start('views')
+        self.load_views()
 
-        should_proceed = False
-        for feed in user_feeds:
-            if feed.should_send_now() == True:
-                should_proceed = True
-                break
-
-        #shortcircuit - if there is no ripe feed to work on for this user
-        if should_proceed == False:
-            return {}
+        self.timer.start('candidates')
+        digests = self.collect_candidates()
 
-        #these are placeholders for separate query sets per exercise group
-        #there are four groups - one for each EmailFeedSetting.feed_type
-        #and each group has subtypes A and B
-        #that's because of the strange thing commented below
-        #see note on Q and F objects marked with todo tag
-        q_sel_A = None
-        q_sel_B = None
-
-        q_ask_A = None
-        q_ask_B = None
-
-        q_ans_A = None
-        q_ans_B = None
-
-        q_all_A = None
-        q_all_B = None
-
-        #base exercise query set for this user
-        #basic things - not deleted, not closed, not too old
-        #not last edited by the same user
-        base_qs = Post.objects.get_exercises().exclude(
-                                thread__last_activity_by=user
-                            ).exclude(
-                                thread__last_activity_at__lt=user.date_joined#exclude old stuff
-                            ).exclude(
-                                deleted=True
-                            ).exclude(
-                                thread__closed=True
-                            ).order_by('-thread__last_activity_at')
+        self.timer.start('activity')
+        self.load_email_activity(digests)
 
-        if askbot_settings.ENABLE_CONTENT_MODERATION:
-            base_qs = base_qs.filter(approved = True)
-        #todo: for some reason filter on did not work as expected ~Q(viewed__who=user) | 
-        #      Q(viewed__who=user,viewed__when__lt=F('thread__last_activity_at'))
-        #returns way more exercises than you might think it should
-        #so because of that I've created separate query sets Q_set2 and Q_set3
-        #plus two separate queries run faster!
-
-        #build two two queries based
-
-        #exercises that are not seen by the user at all
-        not_seen_qs = base_qs.filter(~Q(viewed__who=user))
-        #exercises that were seen, but before last modification
-        seen_before_last_mod_qs = base_qs.filter(
-                                    Q(
-                                        viewed__who=user,
-                                        viewed__when__lt=F('thread__last_activity_at')
-                                    )
-                                )
+        self.timer.start('news')
+        self.count_news(digests)
 
-        #shorten variables for convenience
-        Q_set_A = not_seen_qs
-        Q_set_B = seen_before_last_mod_qs
+        self.timer.start('save')
+        self.save_email_activity(digests)
+        self.timer.stop()
 
-        for feed in user_feeds:
-            if feed.feed_type == 'm_and_c':
-                #alerts on mentions and comments are processed separately
-                #because comments to exercises do not trigger change of last_updated
-                #this may be changed in the future though, see
-                #http://askbot.org/en/exercise/96/
-                continue
+        return [(self.users[user_id], q_list) for user_id, q_list in digests]
 
-            #each group of updates represented by the corresponding
-            #query set has it's own cutoff time
-            #that cutoff time is computed for each user individually
-            #and stored as a parameter "cutoff_time"
-
-            #we won't send email for a given exercise if an email has been
-            #sent after that cutoff_time
-            if feed.should_send_now():
-                if DEBUG_THIS_COMMAND == False:
-                    feed.mark_reported_now()
-                cutoff_time = feed.get_previous_report_cutoff_time() 
-
-                if feed.feed_type == 'q_sel':
-                    q_sel_A = Q_set_A.filter(thread__followed_by=user)
-                    q_sel_A.cutoff_time = cutoff_time #store cutoff time per query set
-                    q_sel_B = Q_set_B.filter(thread__followed_by=user)
-                    q_sel_B.cutoff_time = cutoff_time #store cutoff time per query set
-
-                elif feed.feed_type == 'q_ask':
-                    q_ask_A = Q_set_A.filter(author=user)
-                    q_ask_A.cutoff_time = cutoff_time
-                    q_ask_B = Q_set_B.filter(author=user)
-                    q_ask_B.cutoff_time = cutoff_time
-
-                elif feed.feed_type == 'q_ans':
-                    q_ans_A = Q_set_A.filter(thread__posts__author=user, thread__posts__post_type='problem')
-                    q_ans_A = q_ans_A[:askbot_settings.MAX_ALERTS_PER_EMAIL]
-                    q_ans_A.cutoff_time = cutoff_time
-
-                    q_ans_B = Q_set_B.filter(thread__posts__author=user, thread__posts__post_type='problem')
-                    q_ans_B = q_ans_B[:askbot_settings.MAX_ALERTS_PER_EMAIL]
-                    q_ans_B.cutoff_time = cutoff_time
-
-                elif feed.feed_type == 'q_all':
-                    q_all_A = user.get_tag_filtered_exercises(Q_set_A)
-                    q_all_B = user.get_tag_filtered_exercises(Q_set_B)
-
-                    q_all_A = q_all_A[:askbot_settings.MAX_ALERTS_PER_EMAIL]
-                    q_all_B = q_all_B[:askbot_settings.MAX_ALERTS_PER_EMAIL]
-                    q_all_A.cutoff_time = cutoff_time
-                    q_all_B.cutoff_time = cutoff_time
-
-        #build ordered list exercises for the email report
-        q_list = SortedDict()
-
-        #todo: refactor q_list into a separate class?
-        extend_exercise_list(q_sel_A, q_list)
-        extend_exercise_list(q_sel_B, q_list)
-
-        #build list of comment and mention responses here
-        #it is separate because posts are not marked as changed
-        #when people add comments
-        #mention responses could be collected in the loop above, but
-        #it is inconvenient, because feed_type m_and_c bundles the two
-        #also we collect metadata for these here
-        try:
-            feed = user_feeds.get(feed_type='m_and_c')
-            if feed.should_send_now():
-                cutoff_time = feed.get_previous_report_cutoff_time()
-                comments = Post.objects.get_comments().filter(
-                                            added_at__lt = cutoff_time,
-                                        ).exclude(
-                                            author = user
-                                        )
-                q_commented = list() 
-                for c in comments:
-                    post = c.parent
-                    if post.author != user:
-                        continue
-
-                    #skip is post was seen by the user after
-                    #the comment posting time
-                    q_commented.append(post.get_origin_post())
+    def load_feeds(self):
+        """reads feed settings of all users in the block,
+        adds the missing subscriptions, finds the ripe feeds
+        and marks them as reported, all in three queries
+        """
+        from askbot import forms#need to avoid circular dependency
+        form = forms.EditUserEmailFeedsForm()
+        need_feed_types = form.get_db_model_subscription_type_names()
 
+        feeds_by_user = collections.defaultdict(dict)
+        feeds = EmailFeedSetting.objects.filter(
+                                    subscriber__id__in = self.users.keys()
+                                )
+        for feed in feeds:
+            feeds_by_user[feed.subscriber_id][feed.feed_type] = feed
+
+        new_feeds = list()
+        for user_id in self.users.keys():
+            user_feeds = feeds_by_user[user_id]
+            for feed_type in need_feed_types:
+                if feed_type in user_feeds:
+                    continue
+                attr_key = 'DEFAULT_NOTIFICATION_DELIVERY_SCHEDULE_%s' % feed_type.upper()
+                feed = EmailFeedSetting(
+                                subscriber_id = user_id,
+                                feed_type = feed_type,
+                                frequency = getattr(askbot_settings, attr_key)
+                            )
+                user_feeds[feed_type] = feed
+                new_feeds.append(feed)
+
+        reported_feed_ids = list()
+        for user_id in self.users.keys():
+            user_feeds = feeds_by_user[user_id]
+            ripe_feeds = dict()
+            for feed in user_feeds.values():
+                if feed.frequency in ('n', 'i'):
+                    continue
+                if feed.should_send_now() == False:
+                    continue
+                ripe_feeds[feed.feed_type] = feed.get_previous_report_cutoff_time()
+                if feed.feed_type == 'q_all':
+                    self.q_all_reported_at[user_id] = feed.reported_at
+                #comments and mentions feed is never marked as reported
+                if feed.feed_type == 'm_and_c' or DEBUG_THIS_COMMAND:
+                    continue
+                if feed.id is None:
+                    feed.reported_at = self.now
+                else:
+                    reported_feed_ids.append(feed.id)
+            if ripe_feeds:
+                self.ripe_feeds[user_id] = ripe_feeds
+
+        bulk_create(new_feeds)
+        for feeds in filter_in_chunks(
+                        EmailFeedSetting.objects.all(), 'id', reported_feed_ids
+                    ):
+            feeds.update(reported_at = self.now)
+
+    def get_users_with_ripe_feed(self, feed_type):
+        return [
+            user_id for user_id, ripe_feeds in self.ripe_feeds.items()
+            if feed_type in ripe_feeds
+        ]
+
+    def load_views(self):
+        """reads all exercise views of the users who are
+        about to receive email, only the earliest view time
+        is needed to tell apart the exercises
+        that were seen before the last modification
+        """
+        view_data = ExerciseView.objects.filter(
+                                    who__id__in = self.ripe_feeds.keys()
+                                ).values_list('who', 'exercise', 'when')
+        for user_id, exercise_id, viewed_at in view_data:
+            user_views = self.views[user_id]
+            if exercise_id not in user_views or viewed_at < user_views[exercise_id]:
+                user_views[exercise_id] = viewed_at
+
+    def load_exercises(self, thread_ids):
+        """adds to the exercise cache posts of the given threads"""
+        thread_ids = set(thread_ids) - set(self.exercises.keys())
+        exercises = Post.objects.get_exercises().select_related('thread')
+        for exercise_chunk in filter_in_chunks(exercises, 'thread__id', thread_ids):
+            for exercise in exercise_chunk:
+                self.exercises[exercise.thread_id] = exercise
+
+    def get_exercise_set(self, user, exercise):
+        """returns 'A' if exercise was not seen by the user at all,
+        'B' if it was seen before the last modification
+        and ``None`` if exercise is not eligible for the
+        report - same as the base query set of the mailer
+        """
+        thread = exercise.thread
+        if thread.last_activity_by_id == user.id:
+            return None
+        if thread.last_activity_at < user.date_joined:
+            return None
+        if exercise.deleted or thread.closed:
+            return None
+        if askbot_settings.ENABLE_CONTENT_MODERATION and not exercise.approved:
+            return None
+        viewed_at = self.views[user.id].get(exercise.id)
+        if viewed_at is None:
+            return 'A'
+        if viewed_at < thread.last_activity_at:
+            return 'B'
+        return None
+
+    def split_exercises(self, user, thread_ids, limit = None):
+        """returns exercise sets A and B made of exercises
+        of the given threads, most recently active first"""
+        exercises = [
+            self.exercises[thread_id] for thread_id in thread_ids
+            if thread_id in self.exercises
+        ]
+        exercises.sort(
+            key = lambda q: (q.thread.last_activity_at, q.id),
+            reverse = True
+        )
+        exercise_sets = {'A': list(), 'B': list()}
+        for exercise in exercises:
+            set_name = self.get_exercise_set(user, exercise)
+            if set_name:
+                exercise_sets[set_name].append(exercise)
+        if limit:
+            return exercise_sets['A'][:limit], exercise_sets['B'][:limit]
+        return exercise_sets['A'], exercise_sets['B']
+
+    def collect_candidates(self):
+        """returns list of (user id, exercise list) tuples
+        with the exercise lists ordered by the subscription type,
+        the way the email report shows them
+        """
+        followed = collections.defaultdict(set)
+        sel_users = self.get_users_with_ripe_feed('q_sel')
+        if sel_users:
+            follow_data = Thread.followed_by.through.objects.filter(
+                                            user__id__in = sel_users
+                                        ).values_list('user', 'thread')
+            for user_id, thread_id in follow_data:
+                followed[user_id].add(thread_id)
+
+        asked = collections.defaultdict(set)
+        ask_users = self.get_users_with_ripe_feed('q_ask')
+        if ask_users:
+            ask_data = Post.objects.get_exercises().filter(
+                                            author__id__in = ask_users
+                                        ).values_list('author', 'thread')
+            for user_id, thread_id in ask_data:
+                asked[user_id].add(thread_id)
+
+        answered = collections.defaultdict(set)
+        ans_users = self.get_users_with_ripe_feed('q_ans')
+        if ans_users:
+            ans_data = Post.objects.filter(
+                                            post_type = 'problem',
+                                            author__id__in = ans_users
+                                        ).values_list('author', 'thread')
+            for user_id, thread_id in ans_data:
+                answered[user_id].add(thread_id)
+
+        commented, mentioned = self.collect_comments_and_mentions()
+
+        thread_ids = set()
+        for thread_map in (followed, asked, answered, mentioned):
+            for user_thread_ids in thread_map.values():
+                thread_ids.update(user_thread_ids)
+        for user_comments in commented.values():
+            thread_ids.update(user_comments)
+        self.load_exercises(thread_ids)
+
+        tag_filtered = self.scan_tag_filtered_exercises()
+
+        digests = list()
+        for user_id, ripe_feeds in self.ripe_feeds.items():
+            user = self.users[user_id]
+            q_list = SortedDict()
+
+            if 'q_sel' in ripe_feeds:
+                q_sel_A, q_sel_B = self.split_exercises(user, followed[user_id])
+                cutoff_time = ripe_feeds['q_sel']
+                extend_exercise_list(q_sel_A, q_list, cutoff_time = cutoff_time)
+                extend_exercise_list(q_sel_B, q_list, cutoff_time = cutoff_time)
+
+            if 'm_and_c' in ripe_feeds:
+                cutoff_time = ripe_feeds['m_and_c']
+                #comments are added without the A/B filtering
+                q_commented = [
+                    self.exercises[thread_id] for thread_id in commented[user_id]
+                    if thread_id in self.exercises
+                ]
                 extend_exercise_list(
                                 q_commented,
                                 q_list,
                                 cutoff_time = cutoff_time,
                                 add_comment = True
                             )
-
-                mentions = Activity.objects.get_mentions(
-                                                    mentioned_at__lt = cutoff_time,
-                                                    mentioned_whom = user
+                q_mentions_A, q_mentions_B = self.split_exercises(
+                                                    user, mentioned[user_id]
                                                 )
+                extend_exercise_list(
+                                q_mentions_A,
+                                q_list,
+                                cutoff_time = cutoff_time,
+                                add_mention = True
+                            )
+                extend_exercise_list(
+                                q_mentions_B,
+                                q_list,
+                                cutoff_time = cutoff_time,
+                                add_mention = True
+                            )
 
-                #print 'have %d mentions' % len(mentions)
-                #MM = Activity.objects.filter(activity_type = const.TYPE_ACTIVITY_MENTION)
-                #print 'have %d total mentions' % len(MM)
-                #for m in MM:
-                #    print m
-
-                mention_posts = get_all_origin_posts(mentions)
-                q_mentions_id = [q.id for q in mention_posts]
-
-                q_mentions_A = Q_set_A.filter(id__in = q_mentions_id)
-                q_mentions_A.cutoff_time = cutoff_time
-                extend_exercise_list(q_mentions_A, q_list, add_mention=True)
-
-                q_mentions_B = Q_set_B.filter(id__in = q_mentions_id)
-                q_mentions_B.cutoff_time = cutoff_time
-                extend_exercise_list(q_mentions_B, q_list, add_mention=True)
-        except EmailFeedSetting.DoesNotExist:
-            pass
-
-        if user.email_tag_filter_strategy == const.INCLUDE_INTERESTING:
-            extend_exercise_list(q_all_A, q_list)
-            extend_exercise_list(q_all_B, q_list)
-
-        extend_exercise_list(q_ask_A, q_list, limit=True)
-        extend_exercise_list(q_ask_B, q_list, limit=True)
+            q_all_A, q_all_B = tag_filtered.get(user_id, (None, None))
+            q_all_cutoff_time = ripe_feeds.get('q_all')
+            if user.email_tag_filter_strategy == const.INCLUDE_INTERESTING:
+                extend_exercise_list(q_all_A, q_list, cutoff_time = q_all_cutoff_time)
+                extend_exercise_list(q_all_B, q_list, cutoff_time = q_all_cutoff_time)
+
+            if 'q_ask' in ripe_feeds:
+                q_ask_A, q_ask_B = self.split_exercises(user, asked[user_id])
+                cutoff_time = ripe_feeds['q_ask']
+                extend_exercise_list(q_ask_A, q_list, cutoff_time = cutoff_time, limit=True)
+                extend_exercise_list(q_ask_B, q_list, cutoff_time = cutoff_time, limit=True)
+
+            if 'q_ans' in ripe_feeds:
+                q_ans_A, q_ans_B = self.split_exercises(
+                                            user,
+                                            answered[user_id],
+                                            limit = self.max_alerts
+                                        )
+                cutoff_time = ripe_feeds['q_ans']
+                extend_exercise_list(q_ans_A, q_list, cutoff_time = cutoff_time, limit=True)
+                extend_exercise_list(q_ans_B, q_list, cutoff_time = cutoff_time, limit=True)
 
-        extend_exercise_list(q_ans_A, q_list, limit=True)
-        extend_exercise_list(q_ans_B, q_list, limit=True)
+            if user.email_tag_filter_strategy == const.EXCLUDE_IGNORED:
+                extend_exercise_list(
+                    q_all_A, q_list, cutoff_time = q_all_cutoff_time, limit=True
+                )
+                extend_exercise_list(
+                    q_all_B, q_list, cutoff_time = q_all_cutoff_time, limit=True
+                )
 
-        if user.email_tag_filter_strategy == const.EXCLUDE_IGNORED:
-            extend_exercise_list(q_all_A, q_list, limit=True)
-            extend_exercise_list(q_all_B, q_list, limit=True)
+            if q_list:
+                digests.append((user_id, q_list))
+        return digests
 
-        ctype = ContentType.objects.get_for_model(Post)
-        EMAIL_UPDATE_ACTIVITY = const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT
+    def collect_comments_and_mentions(self):
+        """returns two dictionaries keyed by user id:
+        * thread ids of the commented posts authored by the user, one item
+          per comment
+        * set of thread ids of the posts mentioning the user
+        """
+        commented = collections.defaultdict(list)
+        mentioned = collections.defaultdict(set)
+        mc_users = self.get_users_with_ripe_feed('m_and_c')
+        if len(mc_users) == 0:
+            return commented, mentioned
+
+        cutoff_times = dict(
+            [(user_id, self.ripe_feeds[user_id]['m_and_c']) for user_id in mc_users]
+        )
+        latest_cutoff_time = max(cutoff_times.values())
+
+        comment_data = Post.objects.get_comments().filter(
+                                    parent__author__id__in = mc_users,
+                                    added_at__lt = latest_cutoff_time
+                                ).exclude(
+                                    parent__post_type__in = ('tag_wiki', 'reject_reason')
+                                ).order_by(
+                                    'id'
+                                ).values_list(
+                                    'author', 'added_at', 'parent__author', 'parent__thread'
+                                )
+        for author_id, added_at, parent_author_id, thread_id in comment_data:
+            if author_id == parent_author_id:
+                continue
+            if added_at >= cutoff_times[parent_author_id]:
+                continue
+            commented[parent_author_id].append(thread_id)
+
+        mention_data = ActivityAuditStatus.objects.filter(
+                                    user__id__in = mc_users,
+                                    activity__activity_type = const.TYPE_ACTIVITY_MENTION,
+                                    activity__active_at__lt = latest_cutoff_time,
+                                    activity__is_auditted = False,
+                                    activity__content_type = self.post_content_type
+                                ).values_list(
+                                    'user', 'activity__active_at', 'activity__object_id'
+                                )
+        mentions = list()
+        for user_id, mentioned_at, post_id in mention_data:
+            if mentioned_at < cutoff_times[user_id]:
+                mentions.append((user_id, post_id))
+
+        post_threads = dict()
+        posts = Post.objects.exclude(
+                            post_type__in = ('tag_wiki', 'reject_reason')
+                        ).filter(
+                            thread__isnull = False
+                        )
+        post_ids = set([post_id for user_id, post_id in mentions])
+        for post_chunk in filter_in_chunks(posts, 'id', post_ids):
+            post_threads.update(post_chunk.values_list('id', 'thread'))
+        for user_id, post_id in mentions:
+            if post_id in post_threads:
+                mentioned[user_id].add(post_threads[post_id])
+
+        return commented, mentioned
+
+    def get_tag_filter(self, user, tag_filter):
+        """returns a tuple of (include, tag ids, wildcards)
+        describing the email tag filter of the user with
+        the tag selections ``tag_filter``, or ``None``,
+        if the filter lets through all exercises
+        """
+        strategy = user.email_tag_filter_strategy
+        if strategy == const.EXCLUDE_IGNORED:
+            include = False
+            reason = 'bad'
+        elif strategy == const.INCLUDE_INTERESTING:
+            include = True
+            if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
+                reason = 'subscribed'
+            else:
+                reason = 'good'
+        else:
+            return None
+        return (
+            include,
+            tag_filter.get_tag_ids(reason),
+            tag_filter.get_wildcards(reason)
+        )
+
+    def scan_tag_filtered_exercises(self):
+        """reads exercises most recently active first and
+        picks exercise sets A and B for each user with a ripe
+        "all exercises" subscription, filtered by user's tag selections
+
+        reading stops when all sets are full or when the remaining
+        exercises are older than the previous report (or the joining
+        date) of every user waiting for more - the older exercises
+        were offered in the earlier reports
+        """
+        result = dict()
+        all_users = self.get_users_with_ripe_feed('q_all')
+        if len(all_users) == 0:
+            return result
+
+        user_tag_filters = get_user_tag_filters(
+                            [self.users[user_id] for user_id in all_users]
+                        )
+        tag_filters = dict()
+        scan_cutoffs = dict()
+        for user_id in all_users:
+            user = self.users[user_id]
+            tag_filters[user_id] = self.get_tag_filter(
+                                            user, user_tag_filters[user_id]
+                                        )
+            reported_at = self.q_all_reported_at.get(user_id)
+            if reported_at is None:
+                scan_cutoffs[user_id] = user.date_joined
+            else:
+                scan_cutoffs[user_id] = max(user.date_joined, reported_at)
+            result[user_id] = (list(), list())
 
-        #up to this point we still don't know if emails about
-        #collected exercises were sent recently
-        #the next loop examines activity record and decides
-        #for each exercise, whether it needs to be included or not
-        #into the report
+        exercises = Post.objects.get_exercises().filter(
+                                    deleted = False,
+                                    thread__closed = False
+                                )
+        if askbot_settings.ENABLE_CONTENT_MODERATION:
+            exercises = exercises.filter(approved = True)
+        exercises = exercises.select_related(
+                                    'thread'
+                                ).order_by('-thread__last_activity_at', '-id')
+
+        tag_names = dict()
+        waiting_users = set(all_users)
+        offset = 0
+        while waiting_users:
+            chunk = list(exercises[offset:offset + EXERCISE_SCAN_CHUNK_SIZE])
+            offset += EXERCISE_SCAN_CHUNK_SIZE
+            if len(chunk) == 0:
+                break
 
-        for q, meta_data in q_list.items():
-            #this loop edits meta_data for each exercise
-            #so that user will receive counts on new edits new problems, etc
-            #and marks exercises that need to be skipped
-            #because an email about them was sent recently enough
+            thread_tags = collections.defaultdict(list)
+            tag_data = Thread.tags.through.objects.filter(
+                                    thread__id__in = [q.thread_id for q in chunk]
+                                ).values_list('thread', 'tag')
+            for thread_id, tag_id in tag_data:
+                thread_tags[thread_id].append(tag_id)
+            unknown_tag_ids = set()
+            for tag_ids in thread_tags.values():
+                unknown_tag_ids.update(tag_ids)
+            unknown_tag_ids -= set(tag_names.keys())
+            if unknown_tag_ids:
+                tag_names.update(
+                    Tag.objects.filter(
+                        id__in = unknown_tag_ids
+                    ).values_list('id', 'name')
+                )
 
-            #also it keeps a record of latest email activity per exercise per user
-            try:
-                #todo: is it possible to use content_object here, instead of
-                #content type and object_id pair?
-                update_info = Activity.objects.get(
-                                            user=user,
-                                            content_type=ctype,
-                                            object_id=q.id,
-                                            activity_type=EMAIL_UPDATE_ACTIVITY
-                                        )
-                emailed_at = update_info.active_at
-            except Activity.DoesNotExist:
-                update_info = Activity(
-                                        user=user, 
-                                        content_object=q, 
-                                        activity_type=EMAIL_UPDATE_ACTIVITY
+            for exercise in chunk:
+                tag_ids = thread_tags[exercise.thread_id]
+                for user_id in list(waiting_users):
+                    if exercise.thread.last_activity_at < scan_cutoffs[user_id]:
+                        waiting_users.remove(user_id)
+                        continue
+                    user = self.users[user_id]
+                    set_name = self.get_exercise_set(user, exercise)
+                    if set_name is None:
+                        continue
+                    tag_filter = tag_filters[user_id]
+                    if tag_filter:
+                        include, selected_tag_ids, wildcards = tag_filter
+                        matched = False
+                        for tag_id in tag_ids:
+                            if tag_id in selected_tag_ids:
+                                matched = True
+                                break
+                            name = tag_names.get(tag_id, '')
+                            for wildcard in wildcards:
+                                if name.startswith(wildcard[:-1]):
+                                    matched = True
+                                    break
+                            if matched:
+                                break
+                        if matched != include:
+                            continue
+                    q_all_A, q_all_B = result[user_id]
+                    if set_name == 'A':
+                        if len(q_all_A) < self.max_alerts:
+                            q_all_A.append(exercise)
+                    elif len(q_all_B) < self.max_alerts:
+                        q_all_B.append(exercise)
+                    if len(q_all_A) >= self.max_alerts \
+                        and len(q_all_B) >= self.max_alerts:
+                        waiting_users.remove(user_id)
+
+        return result
+
+    def load_email_activity(self, digests):
+        """reads records of the previously sent email updates
+        about all the collected exercises"""
+        exercise_ids = set()
+        for user_id, q_list in digests:
+            exercise_ids.update([q.id for q in q_list.keys()])
+
+        activities = Activity.objects.filter(
+                                user__id__in = [user_id for user_id, q_list in digests],
+                                content_type = self.post_content_type,
+                                activity_type = const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT
+                            )
+        for activity_chunk in filter_in_chunks(activities, 'object_id', exercise_ids):
+            activity_data = activity_chunk.values_list(
+                                        'id', 'user', 'object_id', 'active_at'
                                     )
-                emailed_at = datetime.datetime(1970, 1, 1)#long time ago
-            except Activity.MultipleObjectsReturned:
-                raise Exception(
-                                'server error - multiple exercise email activities '
-                                'found per user-exercise pair'
+            for activity_id, user_id, exercise_id, active_at in activity_data:
+                key = (user_id, exercise_id)
+                if key in self.email_activity:
+                    raise Exception(
+                            'server error - multiple exercise email activities '
+                            'found per user-exercise pair'
+                        )
+                self.email_activity[key] = (activity_id, active_at)
+
+    def count_news(self, digests):
+        """edits meta data of each exercise so that the user
+        will receive counts on new edits, new problems, etc.
+        and marks exercises that need to be skipped
+        because an email about them was sent recently enough
+        """
+        long_time_ago = datetime.datetime(1970, 1, 1)
+
+        to_count = list()
+        for user_id, q_list in digests:
+            for q, meta_data in q_list.items():
+                activity = self.email_activity.get((user_id, q.id))
+                if activity is None:
+                    emailed_at = long_time_ago
+                else:
+                    emailed_at = activity[1]
+                #skip exercise if we need to wait longer because
+                #the delay before the next email has not yet elapsed
+                #or if last email was sent after the most recent modification
+                if emailed_at > meta_data['cutoff_time'] \
+                    or emailed_at > q.thread.last_activity_at:
+                    meta_data['skip'] = True
+                    continue
+                to_count.append((user_id, q, meta_data, emailed_at))
+
+        if len(to_count) == 0:
+            return
+
+        earliest_emailed_at = min([item[3] for item in to_count])
+        exercise_ids = set([item[1].id for item in to_count])
+        thread_ids = set([item[1].thread_id for item in to_count])
+
+        #revisions are ordered latest first
+        exercise_revisions = collections.defaultdict(list)
+        revisions = PostRevision.objects.filter(
+                                    revised_at__gt = earliest_emailed_at
+                                ).order_by('-revision')
+        for revision_chunk in filter_in_chunks(revisions, 'post__id', exercise_ids):
+            revision_data = revision_chunk.values_list('post', 'author', 'revised_at')
+            for post_id, author_id, revised_at in revision_data:
+                exercise_revisions[post_id].append((author_id, revised_at))
+
+        thread_problems = collections.defaultdict(list)
+        #visibility of problems by groups is checked below
+        problems = Post.objects.filter(
+                                    post_type = 'problem',
+                                    added_at__gt = earliest_emailed_at,
+                                    deleted = False
                                 )
-
-            cutoff_time = meta_data['cutoff_time']#cutoff time for the exercise
-
-            #skip exercise if we need to wait longer because
-            #the delay before the next email has not yet elapsed
-            #or if last email was sent after the most recent modification
-            if emailed_at > cutoff_time or emailed_at > q.thread.last_activity_at:
-                meta_data['skip'] = True
-                continue
-
-            #collect info on all sorts of news that happened after
-            #the most recent emailing to the user about this exercise
-            q_rev = q.revisions.filter(revised_at__gt=emailed_at)
-            q_rev = q_rev.exclude(author=user)
-
+        for problem_chunk in filter_in_chunks(problems, 'thread__id', thread_ids):
+            problem_data = problem_chunk.values_list('id', 'thread', 'author', 'added_at')
+            for problem_id, thread_id, author_id, added_at in problem_data:
+                thread_problems[thread_id].append((problem_id, author_id, added_at))
+
+        problem_ids = list()
+        for problem_list in thread_problems.values():
+            problem_ids.extend([problem[0] for problem in problem_list])
+
+        problem_revision_authors = collections.defaultdict(list)
+        revisions = PostRevision.objects.all()
+        for revision_chunk in filter_in_chunks(revisions, 'post__id', problem_ids):
+            for post_id, author_id in revision_chunk.values_list('post', 'author'):
+                problem_revision_authors[post_id].append(author_id)
+
+        problem_groups = None
+        user_groups = None
+        if askbot_settings.GROUPS_ENABLED:
+            problem_groups = collections.defaultdict(set)
+            post_groups = PostToGroup.objects.all()
+            for post_group_chunk in filter_in_chunks(post_groups, 'post__id', problem_ids):
+                for post_id, group_id in post_group_chunk.values_list('post', 'group'):
+                    problem_groups[post_id].add(group_id)
+            user_groups = collections.defaultdict(set)
+            membership_data = User.groups.through.objects.filter(
+                                user__id__in = self.ripe_feeds.keys()
+                            ).values_list('user', 'group')
+            for user_id, group_id in membership_data:
+                user_groups[user_id].add(group_id)
+
+        for user_id, q, meta_data, emailed_at in to_count:
+            q_rev = [
+                revised_at for author_id, revised_at in exercise_revisions[q.id]
+                if revised_at > emailed_at and author_id != user_id
+            ]
             #now update all sorts of metadata per exercise
             meta_data['q_rev'] = len(q_rev)
-            if len(q_rev) > 0 and q.added_at == q_rev[0].revised_at:
+            if len(q_rev) > 0 and q.added_at == q_rev[0]:
                 meta_data['q_rev'] = 0
                 meta_data['new_q'] = True
             else:
                 meta_data['new_q'] = False
-                
-            new_ans = Post.objects.get_problems(user).filter(
-                                            thread=q.thread,
-                                            added_at__gt=emailed_at,
-                                            deleted=False,
-                                        )
-            new_ans = new_ans.exclude(author=user)
-            meta_data['new_ans'] = len(new_ans)
-
-            ans_ids = Post.objects.get_problems(user).filter(
-                                            thread=q.thread,
-                                            added_at__gt=emailed_at,
-                                            deleted=False,
-                                        ).values_list(
-                                            'id', flat = True
-                                        )
-            ans_rev = PostRevision.objects.filter(post__id__in = ans_ids)
-            ans_rev = ans_rev.exclude(author=user).distinct()
-            meta_data['ans_rev'] = len(ans_rev)
+
+            new_ans = 0
+            ans_rev = 0
+            for problem_id, author_id, added_at in thread_problems[q.thread_id]:
+                if added_at <= emailed_at:
+                    continue
+                if user_groups is not None \
+                    and not (problem_groups[problem_id] & user_groups[user_id]):
+                    continue
+                if author_id != user_id:
+                    new_ans += 1
+                for revision_author_id in problem_revision_authors[problem_id]:
+                    if revision_author_id != user_id:
+                        ans_rev += 1
+            meta_data['new_ans'] = new_ans
+            meta_data['ans_rev'] = ans_rev
 
             comments = meta_data.get('comments', 0)
             mentions = meta_data.get('mentions', 0)
 
-            #print meta_data
             #finally skip exercise if there are no news indeed
-            if len(q_rev) + len(new_ans) + len(ans_rev) + comments + mentions == 0:
+            if len(q_rev) + new_ans + ans_rev + comments + mentions == 0:
                 meta_data['skip'] = True
-                #print 'skipping'
             else:
                 meta_data['skip'] = False
-                #print 'not skipping'
-                update_info.active_at = datetime.datetime.now() 
-                if DEBUG_THIS_COMMAND == False:
-                    update_info.save() #save exercise email update activity 
-        #q_list is actually an ordered dictionary
-        #print 'user %s gets %d' % (user.username, len(q_list.keys()))
-        #todo: sort exercise list by update time
-        return q_list 
-
-    def send_email_alerts(self):
+
+    def save_email_activity(self, digests):
+        """updates time stamps of the existing email update records
+        with one query and inserts the missing ones in bulk"""
+        if DEBUG_THIS_COMMAND:
+            return
+        updated_ids = list()
+        new_activities = list()
+        for user_id, q_list in digests:
+            for q, meta_data in q_list.items():
+                if meta_data['skip']:
+                    continue
+                activity = self.email_activity.get((user_id, q.id))
+                if activity is None:
+                    new_activities.append(
+                        Activity(
+                            user_id = user_id,
+                            content_type = self.post_content_type,
+                            object_id = q.id,
+                            activity_type = const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT,
+                            active_at = self.now
+                        )
+                    )
+                else:
+                    updated_ids.append(activity[0])
+
+        for activities in filter_in_chunks(Activity.objects.all(), 'id', updated_ids):
+            activities.update(active_at = self.now)
+        bulk_create(new_activities)
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+            make_option('--batch-size',
+                action='store',
+                type='int',
+                dest='batch_size',
+                default=DEFAULT_BATCH_SIZE,
+                help='Number of users whose digests are '
+                    'calculated together, default is %d' % DEFAULT_BATCH_SIZE
+                ),
+            )
+
+    def handle_noargs(self, **options):
+        if askbot_settings.ENABLE_EMAIL_ALERTS:
+            try:
+                try:
+                    timer = self.send_email_alerts(
+                                batch_size = options.get('batch_size') \
+                                                or DEFAULT_BATCH_SIZE
+                            )
+                    if int(options.get('verbosity', 1)) > 1:
+                        print timer.format_report()
+                except Exception, e:
+                    print e
+            finally:
+                connection.close()
+
+    def get_updated_exercises_for_user(self, user):
+        """
+        retreive relevant exercise updates for the user
+        according to their subscriptions and recorded exercise
+        views
+        """
+        digests = DigestBatch([user]).get_digests()
+        if len(digests) == 0:
+            return {}
+        return digests[0][1]
+
+    def send_email_alerts(self, batch_size = DEFAULT_BATCH_SIZE):
+        """sends email digests, users are processed
+        in blocks of ``batch_size``, returns the phase timer
+        """
+        timer = PhaseTimer()
+        last_user_id = 0
+        while True:
+            timer.start('users')
+            users = list(
+                User.objects.filter(
+                    id__gt = last_user_id
+                ).order_by('id')[:batch_size]
+            )
+            if len(users) == 0:
+                break
+            last_user_id = users[-1].id
+
+            for user, q_list in DigestBatch(users, timer).get_digests():
+                timer.start('email')
+                self.send_email_digest(user, q_list)
+        timer.stop()
+        return timer
+
+    def send_email_digest(self, user, q_list):
         #does not change the database, only sends the email
         #todo: move this to template
-        for user in User.objects.all():
-            user.add_missing_askbot_subscriptions()
-            #todo: q_list is a dictionary, not a list
-            q_list = self.get_updated_exercises_for_user(user)
-            if len(q_list.keys()) == 0:
-                continue
-            num_q = 0
-            for exercise, meta_data in q_list.items():
+        #todo: q_list is a dictionary, not a list
+        num_q = 0
+        for exercise, meta_data in q_list.items():
+            if meta_data['skip']:
+                del q_list[exercise]
+            else:
+                num_q += 1
+        if num_q > 0:
+            url_prefix = askbot_settings.APP_URL
+
+            #threads are preloaded together with the exercises
+            threads = [qq.thread for qq in q_list.keys()]
+            tag_summary = Thread.objects.get_tag_summary_from_threads(threads)
+
+            exercise_count = len(q_list.keys())
+
+            subject_line = ungettext(
+                '%(exercise_count)d updated exercise about %(topics)s',
+                '%(exercise_count)d updated exercises about %(topics)s',
+                exercise_count
+            ) % {
+                'exercise_count': exercise_count,
+                'topics': tag_summary
+            }
+
+            #todo: send this to special log
+            #print 'have %d updated exercises for %s' % (num_q, user.username)
+            text = ungettext(
+                '<p>Dear %(name)s,</p><p>The following exercise has been updated '
+                '%(sitename)s</p>',
+                '<p>Dear %(name)s,</p><p>The following %(num)d exercises have been '
+                'updated on %(sitename)s:</p>',
+                num_q
+            ) % {
+                'num':num_q,
+                'name':user.username,
+                'sitename': askbot_settings.APP_SHORT_NAME
+            }
+
+            text += '<ul>'
+            items_added = 0
+            items_unreported = 0
+            for q, meta_data in q_list.items():
+                act_list = []
                 if meta_data['skip']:
-                    del q_list[exercise]
-                else:
-                    num_q += 1
-            if num_q > 0:
-                url_prefix = askbot_settings.APP_URL
-
-                threads = Thread.objects.filter(id__in=[qq.thread_id for qq in q_list.keys()])
-                tag_summary = Thread.objects.get_tag_summary_from_threads(threads)
-
-                exercise_count = len(q_list.keys())
-
-                subject_line = ungettext(
-                    '%(exercise_count)d updated exercise about %(topics)s',
-                    '%(exercise_count)d updated exercises about %(topics)s',
-                    exercise_count
-                ) % {
-                    'exercise_count': exercise_count,
-                    'topics': tag_summary
-                }
-
-                #todo: send this to special log
-                #print 'have %d updated exercises for %s' % (num_q, user.username)
-                text = ungettext(
-                    '<p>Dear %(name)s,</p><p>The following exercise has been updated '
-                    '%(sitename)s</p>',
-                    '<p>Dear %(name)s,</p><p>The following %(num)d exercises have been '
-                    'updated on %(sitename)s:</p>',
-                    num_q
-                ) % {
-                    'num':num_q,
-                    'name':user.username,
-                    'sitename': askbot_settings.APP_SHORT_NAME
-                }
-
-                text += '<ul>'
-                items_added = 0
-                items_unreported = 0
-                for q, meta_data in q_list.items():
-                    act_list = []
-                    if meta_data['skip']:
-                        continue
-                    if items_added >= askbot_settings.MAX_ALERTS_PER_EMAIL:
-                        items_unreported = num_q - items_added #may be inaccurate actually, but it's ok
-                        
-                    else:
-                        items_added += 1
-                        if meta_data['new_q']:
-                            act_list.append(_('new exercise'))
-                        format_action_count('%(num)d rev', meta_data['q_rev'],act_list)
-                        format_action_count('%(num)d ans', meta_data['new_ans'],act_list)
-                        format_action_count('%(num)d ans rev',meta_data['ans_rev'],act_list)
-                        act_token = ', '.join(act_list)
-                        text += '<li><a href="%s?sort=latest">%s</a> <font color="#777777">(%s)</font></li>' \
-                                    % (url_prefix + q.get_absolute_url(), q.thread.title, act_token)
-                text += '</ul>'
-                text += '<p></p>'
-                #if len(q_list.keys()) >= askbot_settings.MAX_ALERTS_PER_EMAIL:
-                #    text += _('There may be more exercises updated since '
-                #                'you have logged in last time as this list is '
-                #                'abridged for your convinience. Please visit '
-                #                'the askbot and see what\'s new!<br>'
-                #              )
-
-                link = url_prefix + reverse(
-                                        'user_subscriptions', 
-                                        kwargs = {
-                                            'id': user.id,
-                                            'slug': slugify(user.username)
-                                        }
-                                    )
+                    continue
+                if items_added >= askbot_settings.MAX_ALERTS_PER_EMAIL:
+                    items_unreported = num_q - items_added #may be inaccurate actually, but it's ok
 
-                text += _(
-                    '<p>Please remember that you can always <a '
-                    'href="%(email_settings_link)s">adjust</a> frequency of the email updates or '
-                    'turn them off entirely.<br/>If you believe that this message was sent in an '
-                    'error, please email about it the forum administrator at %(admin_email)s.</'
-                    'p><p>Sincerely,</p><p>Your friendly %(sitename)s server.</p>'
-                ) % {
-                    'email_settings_link': link,
-                    'admin_email': django_settings.ADMINS[0][1],
-                    'sitename': askbot_settings.APP_SHORT_NAME
-                }
-                if DEBUG_THIS_COMMAND == True:
-                    recipient_email = django_settings.ADMINS[0][1]
                 else:
-                    recipient_email = user.email
+                    items_added += 1
+                    if meta_data['new_q']:
+                        act_list.append(_('new exercise'))
+                    format_action_count('%(num)d rev', meta_data['q_rev'],act_list)
+                    format_action_count('%(num)d ans', meta_data['new_ans'],act_list)
+                    format_action_count('%(num)d ans rev',meta_data['ans_rev'],act_list)
+                    act_token = ', '.join(act_list)
+                    text += '<li><a href="%s?sort=latest">%s</a> <font color="#777777">(%s)</font></li>' \
+                                % (url_prefix + q.get_absolute_url(), q.thread.title, act_token)
+            text += '</ul>'
+            text += '<p></p>'
+            #if len(q_list.keys()) >= askbot_settings.MAX_ALERTS_PER_EMAIL:
+            #    text += _('There may be more exercises updated since '
+            #                'you have logged in last time as this list is '
+            #                'abridged for your convinience. Please visit '
+            #                'the askbot and see what\'s new!<br>'
+            #              )
+
+            link = url_prefix + reverse(
+                                    'user_subscriptions',
+                                    kwargs = {
+                                        'id': user.id,
+                                        'slug': slugify(user.username)
+                                    }
+                                )
 
-                mail.send_mail(
-                    subject_line = subject_line,
-                    body_text = text,
-                    recipient_list = [recipient_email]
-                )
+            text += _(
+                '<p>Please remember that you can always <a '
+                'href="%(email_settings_link)s">adjust</a> frequency of the email updates or '
+                'turn them off entirely.<br/>If you believe that this message was sent in an '
+                'error, please email about it the forum administrator at %(admin_email)s.</'
+                'p><p>Sincerely,</p><p>Your friendly %(sitename)s server.</p>'
+            ) % {
+                'email_settings_link': link,
+                'admin_email': django_settings.ADMINS[0][1],
+                'sitename': askbot_settings.APP_SHORT_NAME
+            }
+            if DEBUG_THIS_COMMAND == True:
+                recipient_email = django_settings.ADMINS[0][1]
+            else:
+                recipient_email = user.email
+
+            mail.send_mail(
+                subject_line = subject_line,
+                body_text = text,
+                recipient_list = [recipient_email]
+            )
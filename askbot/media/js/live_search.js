@@ -96,7 +96,8 @@ var liveSearch = function(query_string) {
         }
         var ac = new AutoCompleter({
             url: askbot['urls']['get_tag_list'],
-            preloadData: true,
+            matchSubset: false,
+            filterResults: false,
             minChars: 1,
             useCache: true,
             matchInside: true,
@@ -1281,7 +1281,8 @@ var exerciseRetagger = function(){
         //populate input
         var tagAc = new AutoCompleter({
             url: askbot['urls']['get_tag_list'],
-            preloadData: true,
+            matchSubset: false,
+            filterResults: false,
             minChars: 1,
             useCache: true,
             matchInside: true,
@@ -3057,7 +3058,8 @@ TagEditor.prototype.decorate = function(element) {
                 me.clearNewTagInput();
             }
         },
-        preloadData: true,
+        matchSubset: false,
+        filterResults: false,
         minChars: 1,
         useCache: true,
         matchInside: true,
@@ -369,7 +369,8 @@ function pickedTags(){
             setupTagFilterControl('email');
             var ac = new AutoCompleter({
                 url: askbot['urls']['get_tag_list'],
-                preloadData: true,
+                matchSubset: false,
+                filterResults: false,
                 minChars: 1,
                 useCache: true,
                 matchInside: true,
@@ -38,14 +38,20 @@ from askbot.models.exercise import Thread
 from askbot.skins import utils as skin_utils
 from askbot.mail import messages
 from askbot.models.exercise import ExerciseView, AnonymousExercise
+from askbot.models.exercise import exercise_view_buffer
+from askbot.models.exercise import ThreadSimilarity
 from askbot.models.exercise import DraftExercise
 from askbot.models.exercise import FavoriteExercise
-from askbot.models.tag import Tag, MarkedTag
+from askbot.models.exercise import bump_search_content_version
+from askbot.models.tag import Tag, MarkedTag, TagSubscriberIndex
 from askbot.models.tag import get_global_group
 from askbot.models.tag import get_group_names
 from askbot.models.tag import get_groups
 from askbot.models.tag import format_personal_group_name
+from askbot.models.tag import get_user_tag_filter, get_user_tag_filters
+from askbot.models.tag import expire_user_tag_filter
 from askbot.models.user import EmailFeedSetting, ActivityAuditStatus, Activity
+from askbot.models.user import UserTimelineEntry
 from askbot.models.user import GroupMembership
 from askbot.models.user import Group
 from askbot.models.post import Post, PostRevision
@@ -56,9 +62,15 @@ from askbot.models.post import DraftSolution
 from askbot.models.reply_by_email import ReplyAddress
 from askbot.models import signals
 from askbot.models.badges import award_badges_signal, get_badge, BadgeData
+from askbot.models.badges import init_badges
 from askbot.models.repute import Award, Repute, Vote
 from askbot.models.widgets import AskWidget, ExerciseWidget
+from askbot.search import inverted_index
+from askbot.search import tag_completion
+from askbot.search.inverted_index import SearchDocument, SearchPosting
 from askbot import auth
+from askbot.utils.db import bulk_update, filter_in_chunks
+from askbot.utils.db import WriteBehindBuffer
 from askbot.utils.decorators import auto_now_timestamp
 from askbot.utils.slug import slugify
 from askbot.utils.html import sanitize_html
@@ -102,7 +114,13 @@ def get_users_by_text_query(search_query, users_query_set = None):
         import askbot
         if users_query_set is None:
             users_query_set = User.objects.all()
-        if 'postgresql_psycopg2' in askbot.get_database_engine_name():
+        if inverted_index.is_enabled():
+            return inverted_index.run_full_text_search(
+                                    users_query_set,
+                                    inverted_index.SearchDocument.USER,
+                                    search_query
+                                )
+        elif 'postgresql_psycopg2' in askbot.get_database_engine_name():
             from askbot.search import postgresql
             return postgresql.run_full_text_search(users_query_set, search_query)
         else:
@@ -298,6 +316,11 @@ def user_get_marked_tags(self, reason):
         user_selections__reason = reason
     )
 
+def user_get_tag_filter(self):
+    """returns :class:`~askbot.models.tag.UserTagFilter`
+    with the tag selections of the user"""
+    return get_user_tag_filter(self)
+
 MARKED_TAG_PROPERTY_MAP = {
     'good': 'interesting_tags',
     'bad': 'ignored_tags',
@@ -1231,14 +1254,7 @@ def user_get_unused_votes_today(self):
     """returns number of votes that are
     still available to the user today
     """
-    today = datetime.date.today()
-    one_day_interval = (today, today + datetime.timedelta(1))
-
-    used_votes = Vote.objects.filter(
-                                user = self,
-                                voted_at__range = one_day_interval
-                            ).count()
-
+    used_votes = Vote.objects.get_votes_count_today_from_user(self)
     available_votes = askbot_settings.MAX_VOTES_PER_USER_PER_DAY - used_votes
     return max(0, available_votes)
 
@@ -1407,6 +1423,9 @@ def user_mark_tags(
                 marked_ts.update(reason=reason)
             cleaned_tagnames = tagnames
 
+    TagSubscriberIndex.objects.update_user_tags(self)
+    expire_user_tag_filter(self)
+
     return cleaned_tagnames, cleaned_wildcards
 
 @auto_now_timestamp
@@ -2122,24 +2141,17 @@ def user_visit_exercise(self, exercise = None, timestamp = None):
     if timestamp is None:
         timestamp = datetime.datetime.now()
 
-    try:
-        ExerciseView.objects.filter(
-            who=self, exercise=exercise
-        ).update(
-            when = timestamp
-        )
-    except ExerciseView.DoesNotExist:
-        ExerciseView(
-            who=self,
-            exercise=exercise,
-            when = timestamp
-        ).save()
+    #the view records are written in bulk by the buffer
+    exercise_view_buffer.add((self.id, exercise.id), timestamp)
+
+    is_admin = self.is_moderator() or self.is_administrator()
+    if self.new_response_count == 0 and not is_admin:
+        return#there is nothing to clear
 
     #filter memo objects on response activities directed to the qurrent user
     #that refer to the children of the currently
     #viewed exercise and clear them for the current user
-    ACTIVITY_TYPES = const.RESPONSE_ACTIVITY_TYPES_FOR_DISPLAY
-    ACTIVITY_TYPES += (const.TYPE_ACTIVITY_MENTION,)
+    ACTIVITY_TYPES = const.RESPONSE_ACTIVITY_TYPES_FOR_COUNTS
 
     audit_records = ActivityAuditStatus.objects.filter(
                         user = self,
@@ -2157,7 +2169,7 @@ def user_visit_exercise(self, exercise = None, timestamp = None):
 
     #finally, mark admin memo objects if applicable
     #the admin response counts are not denormalized b/c they are easy to obtain
-    if self.is_moderator() or self.is_administrator():
+    if is_admin:
         audit_records.filter(
                 activity__activity_type = const.TYPE_ACTIVITY_MARK_OFFENSIVE
         ).update(
@@ -2421,40 +2433,28 @@ def user_get_tag_filtered_exercises(self, exercises = None):
     if exercises is None:
         exercises = Post.objects.get_exercises()
 
+    tag_filter = self.get_tag_filter()
     if self.email_tag_filter_strategy == const.EXCLUDE_IGNORED:
-
-        ignored_tags = Tag.objects.filter(
-                                user_selections__reason = 'bad',
-                                user_selections__user = self
+        ignored_filter = tag_filter.get_thread_filter('bad')
+        if ignored_filter is not None:
+            ignored_threads = Thread.objects.filter(ignored_filter)
+            exercises = exercises.exclude(
+                                thread__in = ignored_threads.values('id')
                             )
-
-        wk = self.ignored_tags.strip().split()
-        ignored_by_wildcards = Tag.objects.get_by_wildcards(wk)
-
-        return exercises.exclude(
-                        thread__tags__in = ignored_tags
-                    ).exclude(
-                        thread__tags__in = ignored_by_wildcards
-                    ).distinct()
+        return exercises.distinct()
     elif self.email_tag_filter_strategy == const.INCLUDE_INTERESTING:
         if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
             reason = 'subscribed'
-            wk = self.subscribed_tags.strip().split()
         else:
             reason = 'good'
-            wk = self.interesting_tags.strip().split()
-
-        selected_tags = Tag.objects.filter(
-                                user_selections__reason = reason,
-                                user_selections__user = self
-                            )
 
-        selected_by_wildcards = Tag.objects.get_by_wildcards(wk)
-
-        tag_filter = models.Q(thread__tags__in = list(selected_tags)) \
-                    | models.Q(thread__tags__in = list(selected_by_wildcards))
-
-        return exercises.filter( tag_filter ).distinct()
+        selected_filter = tag_filter.get_thread_filter(reason)
+        if selected_filter is None:
+            return exercises.none()
+        selected_threads = Thread.objects.filter(selected_filter)
+        return exercises.filter(
+                        thread__in = selected_threads.values('id')
+                    ).distinct()
     else:
         return exercises
 
@@ -2834,8 +2834,7 @@ def user_get_flags_for_post(self, post):
 def user_update_response_counts(user):
     """Recount number of responses to the user.
     """
-    ACTIVITY_TYPES = const.RESPONSE_ACTIVITY_TYPES_FOR_DISPLAY
-    ACTIVITY_TYPES += (const.TYPE_ACTIVITY_MENTION,)
+    ACTIVITY_TYPES = const.RESPONSE_ACTIVITY_TYPES_FOR_COUNTS
 
     user.new_response_count = ActivityAuditStatus.objects.filter(
                                     user = user,
@@ -2849,6 +2848,19 @@ def user_update_response_counts(user):
                                 ).count()
     user.save()
 
+def increment_new_response_counts(users):
+    """adds one new response to the counters of all ``users``
+    with a single UPDATE per chunk of users - for the case
+    when all of them have become recipients of one new activity.
+    The counters of the given user objects are updated as well.
+    """
+    users = list(users)
+    user_ids = [user.id for user in users]
+    for user_chunk in filter_in_chunks(User.objects.all(), 'id', user_ids):
+        user_chunk.update(new_response_count = models.F('new_response_count') + 1)
+    for user in users:
+        user.new_response_count += 1
+
 
 def user_receive_reputation(self, num_points):
     new_points = self.reputation + num_points
@@ -2901,6 +2913,8 @@ def user_update_wildcard_tag_selections(
     self.ignored_tags = ' '.join(ignored)
     self.subscribed_tags = ' '.join(subscribed)
     self.save()
+    TagSubscriberIndex.objects.update_user_wildcards(self)
+    expire_user_tag_filter(self)
     return new_tags
 
 
@@ -2984,6 +2998,7 @@ User.add_to_class('get_default_avatar_url', user_get_default_avatar_url)
 User.add_to_class('get_gravatar_url', user_get_gravatar_url)
 User.add_to_class('get_or_create_fake_user', user_get_or_create_fake_user)
 User.add_to_class('get_marked_tags', user_get_marked_tags)
+User.add_to_class('get_tag_filter', user_get_tag_filter)
 User.add_to_class('get_marked_tag_names', user_get_marked_tag_names)
 User.add_to_class('get_groups', user_get_groups)
 User.add_to_class('get_foreign_groups', user_get_foreign_groups)
@@ -3129,34 +3144,26 @@ User.add_to_class(
 )
 
 #todo: move this to askbot/mail ?
-def format_instant_notification_email(
-                                        to_user = None,
+def get_instant_notification_shared_data(
                                         from_user = None,
                                         post = None,
-                                        reply_address = None,
-                                        alt_reply_address = None,
                                         update_type = None,
-                                        template = None,
                                     ):
-    """
-    returns text of the instant notification body
-    and subject line
+    """returns dictionary with the parts of the instant
+    notification that are the same for all recipients:
+
+    * subject_line
+    * content_preview - without the full thread summary,
+      which depends on the groups of the recipient
+    * user_action
+    * post_url
+    * origin_post_title
 
-    that is built when post is updated
     only update_types in const.RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES
     are supported
     """
     site_url = askbot_settings.APP_URL
     origin_post = post.get_origin_post()
-    #todo: create a better method to access "sub-urls" in user views
-    user_subscriptions_url = site_url + \
-                                reverse(
-                                    'user_subscriptions',
-                                    kwargs = {
-                                        'id': to_user.id,
-                                        'slug': slugify(to_user.username)
-                                    }
-                                )
 
     if update_type == 'exercise_comment':
         assert(isinstance(post, Post) and post.is_comment())
@@ -3205,10 +3212,6 @@ def format_instant_notification_email(
     #add indented summaries for the parent posts
     content_preview += post.format_for_email_as_parent_thread_summary()
 
-    content_preview += '<p>======= Full thread summary =======</p>'
-
-    content_preview += post.thread.format_for_email(user=to_user)
-
     if update_type == 'post_shared':
         user_action = _('%(user)s shared a %(post_link)s.')
     elif post.is_comment():
@@ -3243,6 +3246,62 @@ def format_instant_notification_email(
         #'post_link': '%s <a href="%s">>>></a>' % (_(post.post_type), post_url)
     }
 
+    return {
+        'subject_line': _('"%(title)s"') % {'title': origin_post.thread.title},
+        'content_preview': content_preview,
+        'user_action': user_action,
+        'post_url': post_url,
+        'origin_post_title': origin_post.thread.title,
+    }
+
+def format_instant_notification_email(
+                                        to_user = None,
+                                        from_user = None,
+                                        post = None,
+                                        reply_address = None,
+                                        alt_reply_address = None,
+                                        update_type = None,
+                                        template = None,
+                                        shared_data = None,
+                                        thread_summary = None,
+                                    ):
+    """
+    returns text of the instant notification body
+    and subject line
+
+    that is built when post is updated
+    only update_types in const.RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES
+    are supported
+
+    ``shared_data`` - output of :func:`get_instant_notification_shared_data`
+    and ``thread_summary`` - output of ``post.thread.format_for_email()``
+    may be passed, when the same update is sent to many users
+    """
+    site_url = askbot_settings.APP_URL
+    if shared_data is None:
+        shared_data = get_instant_notification_shared_data(
+                                            from_user = from_user,
+                                            post = post,
+                                            update_type = update_type
+                                        )
+    if thread_summary is None:
+        thread_summary = post.thread.format_for_email(user=to_user)
+
+    #todo: create a better method to access "sub-urls" in user views
+    user_subscriptions_url = site_url + \
+                                reverse(
+                                    'user_subscriptions',
+                                    kwargs = {
+                                        'id': to_user.id,
+                                        'slug': slugify(to_user.username)
+                                    }
+                                )
+
+    content_preview = shared_data['content_preview']
+    content_preview += '<p>======= Full thread summary =======</p>'
+    content_preview += thread_summary
+
+    user_action = shared_data['user_action']
     can_reply = to_user.can_post_by_email()
 
     if can_reply:
@@ -3273,13 +3332,13 @@ def format_instant_notification_email(
         'can_reply': can_reply,
         'content_preview': content_preview,#post.get_snippet()
         'update_type': update_type,
-        'post_url': post_url,
-        'origin_post_title': origin_post.thread.title,
+        'post_url': shared_data['post_url'],
+        'origin_post_title': shared_data['origin_post_title'],
         'user_subscriptions_url': user_subscriptions_url,
         'reply_separator': reply_separator,
         'reply_address': reply_address
     }
-    subject_line = _('"%(title)s"') % {'title': origin_post.thread.title}
+    subject_line = shared_data['subject_line']
 
     content = template.render(Context(update_data))
 
@@ -3370,12 +3429,44 @@ def send_instant_notifications_about_activity_in_post(
         log_id = None
 
 
+    #parts of the message that are the same for all recipients
+    #are rendered once, the thread summary - once per set of groups
+    template = get_template('email/instant_notification.html')
+    shared_data = get_instant_notification_shared_data(
+                                        from_user = update_activity.user,
+                                        post = post,
+                                        update_type = update_type
+                                    )
+    recipients = [user for user in recipients if not user.is_blocked()]
+    user_groups = collections.defaultdict(set)
+    post_group_ids = set()
+    if askbot_settings.GROUPS_ENABLED:
+        membership_data = User.groups.through.objects.filter(
+                                user__id__in = [user.id for user in recipients]
+                            ).values_list('user', 'group')
+        for user_id, group_id in membership_data:
+            user_groups[user_id].add(group_id)
+        thread_id = post.thread_id
+        post_group_ids = Thread.objects.get_post_group_ids([thread_id])[thread_id]
+        exercise_author_id = origin_post.author_id
+    thread_summaries = dict()
+
+    messages = list()
     for user in recipients:
-        if user.is_blocked():
-            continue
-
         reply_address, alt_reply_address = get_reply_to_addresses(user, post)
 
+        #the summary is shared by the users who see the same
+        #posts of the thread, like the cached post data
+        if askbot_settings.GROUPS_ENABLED:
+            summary_key = (
+                frozenset(user_groups[user.id] & post_group_ids),
+                user.id == exercise_author_id
+            )
+        else:
+            summary_key = None
+        if summary_key not in thread_summaries:
+            thread_summaries[summary_key] = post.thread.format_for_email(user=user)
+
         subject_line, body_text = format_instant_notification_email(
                             to_user = user,
                             from_user = update_activity.user,
@@ -3383,26 +3474,38 @@ def send_instant_notifications_about_activity_in_post(
                             reply_address = reply_address,
                             alt_reply_address = alt_reply_address,
                             update_type = update_type,
-                            template = get_template('email/instant_notification.html')
+                            template = template,
+                            shared_data = shared_data,
+                            thread_summary = thread_summaries[summary_key]
                         )
 
-        headers['Reply-To'] = reply_address
+        message_headers = dict(headers)
+        message_headers['Reply-To'] = reply_address
         try:
-            mail.send_mail(
-                subject_line=subject_line,
-                body_text=body_text,
-                recipient_list=[user.email],
-                related_object=origin_post,
-                activity_type=const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT,
-                headers=headers,
-                raise_on_failure=True
+            message = mail.build_message(
+                subject_line = subject_line,
+                body_text = body_text,
+                recipient_list = [user.email],
+                headers = message_headers
             )
-        except askbot_exceptions.EmailNotSent, error:
+        except Exception, error:
             logger.debug(
                 '%s, error=%s, logId=%s' % (user.email, error, log_id)
             )
-        else:
-            logger.debug('success %s, logId=%s' % (user.email, log_id))
+            continue
+        messages.append(message)
+
+    failures = mail.send_messages(messages)
+
+    failed_messages = set()
+    for message, error in failures:
+        failed_messages.add(message)
+        logger.debug(
+            '%s, error=%s, logId=%s' % (', '.join(message.to), error, log_id)
+        )
+    for message in messages:
+        if message not in failed_messages:
+            logger.debug('success %s, logId=%s' % (', '.join(message.to), log_id))
 
 
 def notify_author_of_published_revision(
@@ -3464,6 +3567,17 @@ def record_post_update_activity(
     )
 
 
+def init_badge_data(app, **kwargs):
+    """creates the badge records in the new database"""
+    if app.__name__ == __name__:
+        init_badges()
+
+def record_user_timeline_entry(instance, created, **kwargs):
+    """adds the new activity to the "recent" tab
+    of the user profile"""
+    if created and not kwargs.get('raw', False):
+        UserTimelineEntry.objects.create_for_activity(instance)
+
 def record_award_event(instance, created, **kwargs):
     """
     After we awarded a badge to user, we need to
@@ -3481,8 +3595,14 @@ def record_award_event(instance, created, **kwargs):
         activity.save()
         activity.add_recipients([instance.user])
 
+        #badge data objects are shared within the process,
+        #so the count is incremented in the database
+        BadgeData.objects.filter(
+            id = instance.badge_id
+        ).update(
+            awarded_count = models.F('awarded_count') + 1
+        )
         instance.badge.awarded_count += 1
-        instance.badge.save()
 
         badge = get_badge(instance.badge.slug)
 
@@ -3538,14 +3658,54 @@ def record_problem_accepted(instance, created, **kwargs):
                                 )
         activity.add_recipients(recipients)
 
+def update_last_seen(visits):
+    """sets ``last_seen`` of many users at once,
+    ``visits`` is a dictionary of user ids and times of their visits.
+    Times older than the ones already stored are not written.
+    """
+    bulk_update(User, 'last_seen', visits, only_greater = True)
+
+#collects times of the user visits in this process,
+#only the latest visit of each user is written
+last_seen_buffer = WriteBehindBuffer(update_last_seen)
+
 def record_user_visit(user, timestamp, **kwargs):
     """
     when user visits any pages, we update the last_seen and
     consecutive_days_visit_count
+
+    Visits within the same day as the previous one are
+    written right away or buffered, depending on the
+    ``LAST_SEEN_UPDATE_MODE`` setting, the first visit
+    of the day is always written right away.
     """
     prev_last_seen = user.last_seen or datetime.datetime.now()
     user.last_seen = timestamp
-    if (user.last_seen - prev_last_seen).days == 1:
+
+    if timestamp.date() <= prev_last_seen.date():
+        if askbot_settings.LAST_SEEN_UPDATE_MODE == 'buffered':
+            last_seen_buffer.add(user.id, timestamp)
+        else:
+            #somehow it saves on the query as compared to user.save()
+            User.objects.filter(id = user.id).update(last_seen = timestamp)
+        return
+
+    #the day has changed since the previous visit
+    updates = {'last_seen': timestamp}
+    is_next_day = (timestamp.date() - prev_last_seen.date()).days == 1
+    if is_next_day:
+        updates['consecutive_days_visit_count'] = \
+            models.F('consecutive_days_visit_count') + 1
+
+    #condition on the previous day - so that of the concurrent
+    #requests only one counts the new day
+    start_of_day = datetime.datetime.combine(timestamp.date(), datetime.time())
+    updated_count = User.objects.filter(
+                                id = user.id,
+                                last_seen__lt = start_of_day
+                            ).update(**updates)
+
+    if is_next_day and updated_count == 1:
         user.consecutive_days_visit_count += 1
         award_badges_signal.send(None,
             event = 'site_visit',
@@ -3553,8 +3713,6 @@ def record_user_visit(user, timestamp, **kwargs):
             context_object = user,
             timestamp = timestamp
         )
-    #somehow it saves on the query as compared to user.save()
-    User.objects.filter(id = user.id).update(last_seen = timestamp)
 
 
 def record_vote(instance, created, **kwargs):
@@ -3667,6 +3825,79 @@ def record_update_tags(thread, tags, user, timestamp, **kwargs):
                 )
     activity.save()
 
+def update_similar_threads(thread, **kwargs):
+    """refreshes the precomputed similar threads
+    of the thread with the updated tags and of its neighbours
+    """
+    ThreadSimilarity.objects.update_for_thread(thread)
+
+def update_thread_search_index(thread = None, post = None, instance = None, **kwargs):
+    """reindexes the thread in the built-in search
+    when its posts or tags change"""
+    if not inverted_index.is_enabled():
+        return
+    if thread is None:
+        post = post or instance
+        thread = post.thread
+    inverted_index.index_thread(thread)
+
+def remove_thread_from_search_index(instance, **kwargs):
+    if inverted_index.is_enabled():
+        inverted_index.remove_document(
+            inverted_index.SearchDocument.THREAD, instance.id
+        )
+
+def update_user_search_index(instance, raw = False, **kwargs):
+    """indexes the user name and profile in the built-in search,
+    postings are rewritten only when the text changes"""
+    if inverted_index.is_enabled() and not raw:
+        inverted_index.index_user(instance)
+
+def remove_user_from_search_index(instance, **kwargs):
+    if inverted_index.is_enabled():
+        inverted_index.remove_document(
+            inverted_index.SearchDocument.USER, instance.id
+        )
+
+def remember_tag_completion_state(instance, **kwargs):
+    instance._completion_state = tag_completion.get_tag_state(instance)
+
+def update_tag_completions(instance, created = False, **kwargs):
+    """expires the tag completions when a tag is
+    added, renamed, accepted or deleted, but not
+    when just its use count changes"""
+    state = tag_completion.get_tag_state(instance)
+    if created or state != getattr(instance, '_completion_state', None):
+        tag_completion.expire_index()
+    instance._completion_state = state
+
+def remove_tag_completions(**kwargs):
+    tag_completion.expire_index()
+
+def remember_indexed_tag_name(instance, **kwargs):
+    instance._indexed_name = instance.name
+
+def rename_tag_in_subscriber_index(instance, created, raw = False, **kwargs):
+    """the tag selections are indexed by the tag names"""
+    old_name = getattr(instance, '_indexed_name', None)
+    if not created and not raw and old_name and old_name != instance.name:
+        TagSubscriberIndex.objects.rename_tag(old_name, instance.name)
+    instance._indexed_name = instance.name
+
+def remove_tag_from_subscriber_index(instance, **kwargs):
+    TagSubscriberIndex.objects.remove_tag(instance.name)
+
+def reset_user_tag_filter(instance, created, **kwargs):
+    """ids of the deleted users may be reused,
+    so the tag filters of the new users start clean"""
+    if created:
+        expire_user_tag_filter(instance)
+
+def expire_cached_search_results(**kwargs):
+    """the cached results of the exercise searches
+    expire when posts, threads or tags change"""
+    bump_search_content_version()
+
 def record_favorite_exercise(instance, created, **kwargs):
     """
     when user add the exercise in him favorite exercises list.
@@ -3861,7 +4092,10 @@ django_signals.pre_save.connect(calculate_gravatar_hash, sender=User)
 django_signals.post_save.connect(add_missing_subscriptions, sender=User)
 django_signals.post_save.connect(add_user_to_global_group, sender=User)
 django_signals.post_save.connect(add_user_to_personal_group, sender=User)
+django_signals.post_save.connect(reset_user_tag_filter, sender=User)
+django_signals.post_syncdb.connect(init_badge_data)
 django_signals.post_save.connect(record_award_event, sender=Award)
+django_signals.post_save.connect(record_user_timeline_entry, sender=Activity)
 django_signals.post_save.connect(notify_award_message, sender=Award)
 django_signals.post_save.connect(record_problem_accepted, sender=Post)
 django_signals.post_save.connect(record_vote, sender=Vote)
@@ -3880,12 +4114,40 @@ signals.delete_exercise_or_problem.connect(record_delete_exercise, sender=Post)
 signals.flag_offensive.connect(record_flag_offensive, sender=Post)
 signals.remove_flag_offensive.connect(remove_flag_offensive, sender=Post)
 signals.tags_updated.connect(record_update_tags)
+signals.tags_updated.connect(update_similar_threads)
 signals.user_registered.connect(greet_new_user)
 signals.user_updated.connect(record_user_full_updated, sender=User)
 signals.user_logged_in.connect(complete_pending_tag_subscriptions)#todo: add this to fake onlogin middleware
 signals.user_logged_in.connect(post_anonymous_askbot_content)
 signals.post_updated.connect(record_post_update_activity)
 
+#the built-in search index
+signals.post_updated.connect(update_thread_search_index)
+signals.delete_exercise_or_problem.connect(update_thread_search_index, sender=Post)
+signals.tags_updated.connect(update_thread_search_index)
+django_signals.post_delete.connect(remove_thread_from_search_index, sender=Thread)
+django_signals.post_save.connect(update_user_search_index, sender=User)
+django_signals.post_delete.connect(remove_user_from_search_index, sender=User)
+
+#the tag completions
+django_signals.post_init.connect(remember_tag_completion_state, sender=Tag)
+django_signals.post_save.connect(update_tag_completions, sender=Tag)
+django_signals.post_delete.connect(remove_tag_completions, sender=Tag)
+
+#the index of the tag selections
+django_signals.post_init.connect(remember_indexed_tag_name, sender=Tag)
+django_signals.post_save.connect(rename_tag_in_subscriber_index, sender=Tag)
+django_signals.post_delete.connect(remove_tag_from_subscriber_index, sender=Tag)
+
+#the cached search results
+django_signals.post_save.connect(expire_cached_search_results, sender=Post)
+django_signals.post_delete.connect(expire_cached_search_results, sender=Post)
+django_signals.post_save.connect(expire_cached_search_results, sender=Thread)
+django_signals.post_delete.connect(expire_cached_search_results, sender=Thread)
+django_signals.post_save.connect(expire_cached_search_results, sender=Tag)
+django_signals.post_delete.connect(expire_cached_search_results, sender=Tag)
+signals.tags_updated.connect(expire_cached_search_results)
+
 #probably we cannot use post-save here the point of this is
 #to tell when the revision becomes publicly visible, not when it is saved
 signals.post_revision_published.connect(notify_author_of_published_revision)
@@ -3900,6 +4162,7 @@ __all__ = [
         'FavoriteExercise',
         'AnonymousExercise',
         'DraftExercise',
+        'ThreadSimilarity',
 
         'AnonymousProblem',
         'DraftProblem',
@@ -3915,6 +4178,7 @@ __all__ = [
         'Vote',
         'PostFlagReason',
         'MarkedTag',
+        'TagSubscriberIndex',
 
         'BadgeData',
         'Award',
@@ -3922,6 +4186,7 @@ __all__ = [
 
         'Activity',
         'ActivityAuditStatus',
+        'UserTimelineEntry',
         'EmailFeedSetting',
         'GroupMembership',
         'Group',
@@ -3930,6 +4195,9 @@ __all__ = [
 
         'ReplyAddress',
 
+        'SearchDocument',
+        'SearchPosting',
+
         'get_model',
         'get_group_names',
         'get_groups'
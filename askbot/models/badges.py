@@ -21,6 +21,9 @@ corresponding event name, actor (user object), context_object and optionally
 """
 #FIXME: Make work with new post_types
 import datetime
+from celery.signals import task_postrun
+from django.conf import settings as django_settings
+from django.core.signals import request_finished
 from django.template.defaultfilters import slugify
 from django.contrib.contenttypes.models import ContentType
 from django.utils.translation import ugettext as _
@@ -31,8 +34,24 @@ from askbot.models.exercise import FavoriteExercise as Fave#name collision
 from askbot.models.post import Post
 from askbot import const
 from askbot.conf import settings as askbot_settings
+from askbot.utils.db import WriteBehindBuffer
 from askbot.utils.decorators import auto_now_timestamp
 
+#BadgeData objects by slug, loaded once per process
+_badge_data_map = dict()
+
+def get_badge_data(slug):
+    """returns ``BadgeData`` object for the badge,
+    from the map of all of them in this process"""
+    if len(_badge_data_map) == 0:
+        for data in BadgeData.objects.all():
+            _badge_data_map[data.slug] = data
+    data = _badge_data_map.get(slug)
+    if data is None:
+        data, created = BadgeData.objects.get_or_create(slug = slug)
+        _badge_data_map[slug] = data
+    return data
+
 class Badge(object):
     """base class for the badges
 
@@ -60,8 +79,7 @@ class Badge(object):
         self.css_class = const.BADGE_CSS_CLASSES[self.level]
 
     def get_stored_data(self):
-        data, created = BadgeData.objects.get_or_create(slug = self.key)
-        return data
+        return get_badge_data(self.key)
 
     @property
     def awarded_count(self):
@@ -90,8 +108,9 @@ class Badge(object):
     def award(self, recipient = None, context_object = None, timestamp = None):
         """do award, the recipient was proven to deserve"""
 
+        badge = self.get_stored_data()
         if self.multiple == False:
-            if recipient.badges.filter(slug = self.key).count() != 0:
+            if Award.objects.filter(user = recipient, badge = badge).exists():
                 return False
         else:
             content_type = ContentType.objects.get_for_model(context_object)
@@ -99,13 +118,12 @@ class Badge(object):
                 'user': recipient,
                 'object_id': context_object.id,
                 'content_type': content_type,
-                'badge__slug': self.key,
+                'badge': badge,
             }
             #multiple badge is not re-awarded for the same post
-            if Award.objects.filter(**filters).count() != 0:
+            if Award.objects.filter(**filters).exists():
                 return False
 
-        badge = self.get_stored_data()
         award = Award(
                     user = recipient,
                     badge = badge,
@@ -886,6 +904,8 @@ def init_badges():
     BadgeData.objects.exclude(
         slug__in = map(slugify, BADGES.keys())
     ).delete()
+    #the map is loaded again from the database in use
+    _badge_data_map.clear()
 
 award_badges_signal = Signal(
                         providing_args=[
@@ -896,18 +916,51 @@ award_badges_signal = Signal(
 #event - string name of the event, e.g 'downvote'
 #context_object - database object related to the event, e.g. exercise
 
+def evaluate_badge_events(events):
+    """considers the badges for the events - tuples
+    (event, actor, context_object, timestamp)
+    """
+    for event, actor, context_object, timestamp in events:
+        for badge in EVENTS_TO_BADGES[event]:
+            badge_instance = badge()
+            badge_instance.consider_award(actor, context_object, timestamp)
+
+def send_badge_events(queued_events):
+    """sends the queued events to the celery worker,
+    ``queued_events`` is a dictionary with keys - tuples
+    (event, actor id, content type id, object id) and
+    values - timestamps of the events
+    """
+    from askbot import tasks
+    events = [key + (timestamp,) for key, timestamp in queued_events.items()]
+    tasks.evaluate_badge_events_celery_task.delay(events)
+
+#badge events of this process, repeated events with the same
+#actor and object are considered once, as of the earliest of them
+badge_event_queue = WriteBehindBuffer(send_badge_events, merge = min)
+
+def send_queued_badge_events(**kwargs):
+    badge_event_queue.flush()
+
+#events are sent to the worker after each request and task
+request_finished.connect(send_queued_badge_events)
+task_postrun.connect(send_queued_badge_events)
+
 @auto_now_timestamp
 def award_badges(event = None, actor = None,
                 context_object = None, timestamp = None, **kwargs):
     """function that is called when signal `award_badges_signal` is sent
     """
-    try:
-        consider_badges = EVENTS_TO_BADGES[event]
-    except KeyError:
+    if event not in EVENTS_TO_BADGES:
         raise NotImplementedError('event "%s" is not implemented' % event)
 
-    for badge in consider_badges:
-        badge_instance = badge()
-        badge_instance.consider_award(actor, context_object, timestamp)
+    if django_settings.CELERY_ALWAYS_EAGER:
+        #there is no worker to wait for
+        evaluate_badge_events([(event, actor, context_object, timestamp)])
+        return
+
+    content_type = ContentType.objects.get_for_model(context_object)
+    key = (event, actor.id, content_type.id, context_object.id)
+    badge_event_queue.add(key, timestamp)
 
 award_badges_signal.connect(award_badges)
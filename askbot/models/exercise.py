@@ -1,4 +1,5 @@
 import datetime
+import math
 import operator
 import re
 
@@ -28,13 +29,142 @@ from askbot.models.post import PostToGroup
 from askbot.models.user import Group, PERSONAL_GROUP_NAME_PREFIX
 from askbot.models import signals
 from askbot import const
+from askbot.utils.cache import get_cache_version, bump_cache_version
+from askbot.utils.db import bulk_create, bulk_update, filter_in_chunks
+from askbot.utils.db import WriteBehindBuffer
 from askbot.utils.lists import LazyList
 from askbot.utils import mysql
 from askbot.utils.slug import slugify
 from askbot.skins.loaders import get_template #jinja2 template loading enviroment
+from askbot.search import inverted_index
 from askbot.search.state_manager import DummySearchState
 
+#tag placeholders in the cached exercise summaries,
+#replaced with the search urls by Thread.get_summary_html()
+SUMMARY_TAG_PLACEHOLDER_RE = re.compile(
+    r'<<<(%s)>>>' % const.TAG_REGEX_BARE,
+    re.UNICODE
+)
+
+def get_visible_group_ids(user):
+    """returns ids of the groups whose posts the user can see,
+    or ``None`` when the groups are disabled
+    """
+    if askbot_settings.GROUPS_ENABLED == False:
+        return None
+    if user is None or user.is_anonymous():
+        return [get_global_group().id]
+    return list(user.get_groups().values_list('id', flat = True))
+
+def get_group_ids_hash(group_ids):
+    """returns a short stable signature of the set of groups
+    for use in the cache keys, ``'all'`` for ``None``
+    """
+    if group_ids is None:
+        return 'all'
+    group_ids = ','.join([str(group_id) for group_id in sorted(group_ids)])
+    return md5_constructor(group_ids).hexdigest()
+
+
+#version of the searchable content, bumped by the post and tag updates,
+#it is part of the keys of the cached search results
+SEARCH_CONTENT_VERSION_KEY = 'thread-search-content-version'
+SEARCH_RESULTS_CACHE_TIMEOUT = 60*10
+#only ids of the first threads found are cached,
+#deeper pages are read from the database
+MAX_CACHED_SEARCH_RESULTS = 1000
+
+def bump_search_content_version():
+    bump_cache_version(SEARCH_CONTENT_VERSION_KEY)
+
+def get_tag_filter_fingerprint(user):
+    """returns string which changes when the user
+    changes the tag selections which filter the search results"""
+    if user is None or user.is_anonymous():
+        return 'anonymous'
+    return '%s:%s' % (
+        user.display_tag_filter_strategy,
+        user.get_tag_filter().get_fingerprint()
+    )
+
+
+class ThreadSearchResults(object):
+    """threads found by the search, cached as the ordered
+    list of ids, works with the ``Paginator`` like the query set.
+    Only the threads of the requested slice are loaded.
+    """
+
+    def __init__(self, thread_ids, count, get_query_set):
+        self.thread_ids = thread_ids
+        self._count = count
+        #returns query set of the search, for the slices
+        #beyond the cached ids
+        self.get_query_set = get_query_set
+
+    def count(self):
+        return self._count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            threads = self[key:key + 1]
+            if len(threads) == 0:
+                raise IndexError('thread index out of range')
+            return threads[0]
+
+        stop = key.stop
+        if stop is None:
+            stop = self._count
+        if stop > len(self.thread_ids) and self._count > len(self.thread_ids):
+            return list(self.get_query_set()[key])
+
+        thread_ids = self.thread_ids[key]
+        threads = Thread.objects.in_bulk(thread_ids)
+        return [
+            threads[thread_id] for thread_id in thread_ids
+            if thread_id in threads
+        ]
+
+
+#ordering of the thread posts by the sort method
+POST_SORT_ORDER = {
+    'latest': '-added_at',
+    'oldest': 'added_at',
+    'votes': '-points'
+}
+
+def filter_visible_posts(posts, user):
+    """with the groups enabled, filters out posts
+    not belonging to the groups of the user"""
+    if askbot_settings.GROUPS_ENABLED:
+        if user is None or user.is_anonymous():
+            groups = (get_global_group(),)
+        else:
+            groups = user.get_groups()
+
+        posts = posts.filter(groups__in=groups)
+        posts = posts.distinct()#important for >1 group
+    return posts
+
+
 class ThreadQuerySet(models.query.QuerySet):
+    def with_all_tags(self, tag_ids):
+        """filters threads tagged with all of the tags, with
+        one grouped subquery instead of a join per tag"""
+        tag_ids = set(tag_ids)
+        thread_ids = Thread.tags.through.objects.filter(
+                                        tag__in = tag_ids
+                                    ).values(
+                                        'thread'
+                                    ).annotate(
+                                        tag_count = models.Count('tag')
+                                    ).filter(
+                                        tag_count = len(tag_ids)
+                                    ).values('thread')
+        return self.filter(id__in = thread_ids)
+
     def get_visible(self, user):
         """filters out threads not belonging to the user groups"""
         if user.is_authenticated():
@@ -187,7 +317,13 @@ class ThreadManager(BaseQuerySetManager):
     #            matching_exercises = Exercise.sphinx_search.query(search_query)
     #            exercise_ids = [q.id for q in matching_exercises]
     #            return qs.filter(posts__post_type='exercise', posts__deleted=False, posts__self_exercise_id__in=exercise_ids)
-            if askbot.get_database_engine_name().endswith('mysql') \
+            if inverted_index.is_enabled():
+                return inverted_index.run_full_text_search(
+                                        qs,
+                                        inverted_index.SearchDocument.THREAD,
+                                        search_query
+                                    )
+            elif askbot.get_database_engine_name().endswith('mysql') \
                 and mysql.supports_full_text_search():
                 return qs.filter(
                     models.Q(title__search = search_query) |
@@ -215,10 +351,11 @@ class ThreadManager(BaseQuerySetManager):
         from askbot.conf import settings as askbot_settings # Avoid circular import
 
         # TODO: add a possibility to see deleted exercises
-        qs = self.filter(
-                posts__post_type='exercise',
-                posts__deleted=False,
-            ) # (***) brings `askbot_post` into the SQL query, see the ordering section below
+        # the exercise post and its deletion mark are denormalized
+        # on the thread, so the posts table is not joined here
+        qs = self.filter(exercise_post__isnull=False, deleted=False)
+        #set when filters that may duplicate thread rows are applied
+        needs_distinct = False
 
         if askbot_settings.ENABLE_CONTENT_MODERATION:
             qs = qs.filter(approved = True)
@@ -234,6 +371,7 @@ class ThreadManager(BaseQuerySetManager):
         #like #tag [title: something] @user
         if search_state.stripped_query:
             qs = self.get_for_query(search_query=search_state.stripped_query, qs=qs)
+            needs_distinct = True
 
         #we run other things after full text search, because
         #FTS may break the chain of the query set calls,
@@ -252,6 +390,7 @@ class ThreadManager(BaseQuerySetManager):
                     posts__post_type='exercise',
                     posts__author__in=query_users
                 ) # TODO: unify with search_state.author ?
+                needs_distinct = True
 
         #unified tags - is list of tags taken from the tag selection
         #plus any tags added to the query string with #tag or [tag:something]
@@ -264,27 +403,31 @@ class ThreadManager(BaseQuerySetManager):
             if askbot_settings.TAG_SEARCH_INPUT_ENABLED:
                 #todo: this may be gone or disabled per option
                 #"tag_search_box_enabled"
-                existing_tags = set()
-                non_existing_tags = set()
-                #we're using a one-by-one tag retreival, b/c
-                #we want to take advantage of case-insensitive search indexes
-                #in postgresql, plus it is most likely that there will be
-                #only one or two search tags anyway
-                for tag in tags:
-                    try:
-                        tag_record = Tag.objects.get(name__iexact=tag)
-                        existing_tags.add(tag_record.name)
-                    except Tag.DoesNotExist:
-                        non_existing_tags.add(tag)
-
+                #all tags are looked up with one case-insensitive query
+                tag_records = Tag.objects.filter_by_names_iexact(tags)
+                tag_ids = dict()
+                for tag_id, tag_name in tag_records.values_list('id', 'name'):
+                    tag_ids[tag_name.lower()] = tag_id
+                non_existing_tags = set([
+                    tag for tag in tags if tag.lower() not in tag_ids
+                ])
                 meta_data['non_existing_tags'] = list(non_existing_tags)
-                tags = existing_tags
+                tag_ids = set(tag_ids.values())
+                has_missing_tags = False#they are dropped from the search
             else:
                 meta_data['non_existing_tags'] = list()
+                tag_ids = set(
+                    Tag.objects.filter(
+                        name__in = tags
+                    ).values_list('id', flat = True)
+                )
+                has_missing_tags = len(tag_ids) < len(set(tags))
 
-            #construct filter for the tag search
-            for tag in tags:
-                qs = qs.filter(tags__name=tag) # Tags or AND-ed here, not OR-ed (i.e. we fetch only threads with all tags)
+            #Tags are AND-ed here, not OR-ed (i.e. we fetch only threads with all tags)
+            if has_missing_tags:
+                qs = qs.none()
+            elif tag_ids:
+                qs = qs.with_all_tags(tag_ids)
         else:
             meta_data['non_existing_tags'] = list()
 
@@ -314,6 +457,7 @@ class ThreadManager(BaseQuerySetManager):
                 followed_users = request_user.get_followed_users()
                 favorite_filter |= models.Q(posts__post_type__in=('exercise', 'problem', 'solution'), posts__author__in=followed_users)
             qs = qs.filter(favorite_filter)
+            needs_distinct = True
 
         #user contributed exercises & problems
         if search_state.author:
@@ -325,55 +469,52 @@ class ThreadManager(BaseQuerySetManager):
             else:
                 qs = qs.filter(posts__post_type__in=('exercise', 'problem', 'solution'), posts__author=u, posts__deleted=False)
                 meta_data['author_name'] = u.username
+                needs_distinct = True
 
         #get users tag filters
         if request_user and request_user.is_authenticated():
-            #mark exercises tagged with interesting tags
-            #a kind of fancy annotation, would be nice to avoid it
-            interesting_tags = Tag.objects.filter(
-                user_selections__user = request_user,
-                user_selections__reason = 'good'
-            )
-            ignored_tags = Tag.objects.filter(
-                user_selections__user = request_user,
-                user_selections__reason = 'bad'
-            )
-            subscribed_tags = Tag.objects.none()
+            #the selections are resolved into tag ids and wildcards
+            #and cached per user
+            tag_filter = request_user.get_tag_filter()
+            use_wildcards = askbot_settings.USE_WILDCARD_TAGS
             if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
-                subscribed_tags = Tag.objects.filter(
-                    user_selections__user = request_user,
-                    user_selections__reason = 'subscribed'
-                )
-                meta_data['subscribed_tag_names'] = [tag.name for tag in subscribed_tags]
+                meta_data['subscribed_tag_names'] = list(
+                                    tag_filter.get_tag_names('subscribed')
+                                )
 
-            meta_data['interesting_tag_names'] = [tag.name for tag in interesting_tags]
-            meta_data['ignored_tag_names'] = [tag.name for tag in ignored_tags]
+            meta_data['interesting_tag_names'] = list(tag_filter.get_tag_names('good'))
+            meta_data['ignored_tag_names'] = list(tag_filter.get_tag_names('bad'))
 
-            if request_user.display_tag_filter_strategy == const.INCLUDE_INTERESTING and (interesting_tags or request_user.has_interesting_wildcard_tags()):
+            if request_user.display_tag_filter_strategy == const.INCLUDE_INTERESTING:
                 #filter by interesting tags only
-                interesting_tag_filter = models.Q(tags__in=interesting_tags)
-                if request_user.has_interesting_wildcard_tags():
-                    interesting_wildcards = request_user.interesting_tags.split()
-                    extra_interesting_tags = Tag.objects.get_by_wildcards(interesting_wildcards)
-                    interesting_tag_filter |= models.Q(tags__in=extra_interesting_tags)
-                qs = qs.filter(interesting_tag_filter)
-
-            # get the list of interesting and ignored tags (interesting_tag_names, ignored_tag_names) = (None, None)
-            if request_user.display_tag_filter_strategy == const.EXCLUDE_IGNORED and (ignored_tags or request_user.has_ignored_wildcard_tags()):
+                interesting_filter = tag_filter.get_thread_filter(
+                                                'good', use_wildcards = use_wildcards
+                                            )
+                if interesting_filter is not None:
+                    qs = qs.filter(interesting_filter)
+                    needs_distinct = True
+
+            if request_user.display_tag_filter_strategy == const.EXCLUDE_IGNORED:
                 #exclude ignored tags if the user wants to
-                qs = qs.exclude(tags__in=ignored_tags)
-                if request_user.has_ignored_wildcard_tags():
-                    ignored_wildcards = request_user.ignored_tags.split()
-                    extra_ignored_tags = Tag.objects.get_by_wildcards(ignored_wildcards)
-                    qs = qs.exclude(tags__in = extra_ignored_tags)
+                ignored_filter = tag_filter.get_thread_filter(
+                                                'bad', use_wildcards = use_wildcards
+                                            )
+                if ignored_filter is not None:
+                    ignored_threads = Thread.objects.filter(ignored_filter)
+                    qs = qs.exclude(id__in = ignored_threads.values('id'))
 
             if request_user.display_tag_filter_strategy == const.INCLUDE_SUBSCRIBED \
-                and subscribed_tags:
-                qs = qs.filter(tags__in = subscribed_tags)
-
-            if askbot_settings.USE_WILDCARD_TAGS:
-                meta_data['interesting_tag_names'].extend(request_user.interesting_tags.split())
-                meta_data['ignored_tag_names'].extend(request_user.ignored_tags.split())
+                and askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
+                subscribed_filter = tag_filter.get_thread_filter(
+                                                'subscribed', use_wildcards = False
+                                            )
+                if subscribed_filter is not None:
+                    qs = qs.filter(subscribed_filter)
+                    needs_distinct = True
+
+            if use_wildcards:
+                meta_data['interesting_tag_names'].extend(tag_filter.get_wildcards('good'))
+                meta_data['ignored_tag_names'].extend(tag_filter.get_wildcards('bad'))
 
         EXERCISE_ORDER_BY_MAP = {
             'age-desc': '-added_at',
@@ -408,11 +549,124 @@ class ThreadManager(BaseQuerySetManager):
         # qs = qs.extra(select={'ordering_key': orderby.lstrip('-')}, order_by=['-ordering_key' if orderby.startswith('-') else 'ordering_key'])
         # qs = qs.distinct()
 
-        qs = qs.only('id', 'title', 'view_count', 'problem_count', 'solution_count', 'last_activity_at', 'last_activity_by', 'closed', 'tagnames', 'accepted_problem')
+        qs = qs.only('id', 'title', 'view_count', 'problem_count', 'solution_count', 'added_at', 'last_activity_at', 'last_activity_by', 'points', 'closed', 'tagnames', 'accepted_problem', 'exercise_post', 'deleted')
 
         #print qs.query
 
-        return qs.distinct(), meta_data
+        if needs_distinct:
+            qs = qs.distinct()
+        return qs, meta_data
+
+    def get_search_cache_key(self, request_user, search_state):
+        """returns key of the cached results of the search,
+        or ``None`` if the results can't be cached
+        """
+        if search_state.scope == 'favorite':
+            #depends on the user favorites and followed users
+            return None
+        signature = repr((
+            search_state.query,
+            sorted(search_state.tags),
+            search_state.scope,
+            search_state.sort,
+            search_state.author,
+            get_tag_filter_fingerprint(request_user),
+            get_group_ids_hash(get_visible_group_ids(request_user)),
+            askbot_settings.ENABLE_CONTENT_MODERATION,
+            askbot_settings.TAG_SEARCH_INPUT_ENABLED,
+            askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED,
+            askbot_settings.USE_WILDCARD_TAGS,
+            askbot_settings.EXERCISE_WITHOUT_PROBLEM_MEANING,
+        ))
+        return 'thread-search-%s-%s' % (
+            get_cache_version(SEARCH_CONTENT_VERSION_KEY),
+            md5_constructor(signature.encode('utf-8')).hexdigest()
+        )
+
+    def run_cached_advanced_search(self, request_user, search_state):
+        """same as :meth:`run_advanced_search`, but the ids of the
+        threads found, their total count and the meta data are cached
+        until the posts or tags are updated.
+
+        Returns :class:`ThreadSearchResults` instead of the query set,
+        when the results are cached no query of the search is run.
+        """
+        def get_query_set():
+            return self.run_advanced_search(
+                            request_user = request_user,
+                            search_state = search_state
+                        )[0]
+
+        key = self.get_search_cache_key(request_user, search_state)
+        if key is None:
+            return self.run_advanced_search(
+                            request_user = request_user,
+                            search_state = search_state
+                        )
+
+        cached = cache.cache.get(key)
+        if cached is None:
+            qs, meta_data = self.run_advanced_search(
+                                request_user = request_user,
+                                search_state = search_state
+                            )
+            thread_ids = [
+                thread.id for thread in
+                qs.only('id')[:MAX_CACHED_SEARCH_RESULTS + 1]
+            ]
+            if len(thread_ids) > MAX_CACHED_SEARCH_RESULTS:
+                thread_ids = thread_ids[:MAX_CACHED_SEARCH_RESULTS]
+                count = qs.count()
+            else:
+                count = len(thread_ids)
+            cached = (thread_ids, count, meta_data)
+            cache.cache.set(key, cached, SEARCH_RESULTS_CACHE_TIMEOUT)
+
+        thread_ids, count, meta_data = cached
+        results = ThreadSearchResults(thread_ids, count, get_query_set)
+        return results, meta_data
+
+    def increase_view_counts(self, view_counts):
+        """adds numbers of views to the view counts of threads,
+        ``view_counts`` is a dictionary of thread ids and numbers of views,
+        threads with equal numbers of views are updated with one statement
+        """
+        thread_ids_by_count = dict()
+        for thread_id, count in view_counts.items():
+            thread_ids_by_count.setdefault(count, list()).append(thread_id)
+        for count, thread_ids in thread_ids_by_count.items():
+            for threads in filter_in_chunks(self.all(), 'id', thread_ids):
+                threads.update(view_count = models.F('view_count') + count)
+        #the summaries show the view counts, they are rendered
+        #again when they are read next time
+        for thread_id in view_counts:
+            bump_cache_version(Thread.SUMMARY_VERSION_KEY_TPL % thread_id)
+        #the summaries cached when the groups are disabled are not versioned
+        cache.cache.delete_many([
+            Thread.SUMMARY_CACHE_KEY_TPL % thread_id for thread_id in view_counts
+        ])
+
+    def get_post_data_for_threads(self, threads, sort_method='votes', user=None):
+        """returns dictionary of the post data of the ``threads``
+        by thread id, as calculated by ``Thread.get_post_data()``,
+        posts of all the threads are read with one query
+        """
+        posts = Post.objects.filter(thread__in=[thread.id for thread in threads])
+        posts = filter_visible_posts(posts, user)
+        posts = posts.order_by(POST_SORT_ORDER[sort_method])
+
+        posts_by_thread = dict([(thread.id, list()) for thread in threads])
+        for post in posts:
+            posts_by_thread[post.thread_id].append(post)
+
+        post_data = dict()
+        for thread in threads:
+            post_data[thread.id] = thread.get_post_data(
+                                        sort_method=sort_method,
+                                        user=user,
+                                        thread_posts=posts_by_thread[thread.id]
+                                    )
+        return post_data
 
     def precache_view_data_hack(self, threads):
         # TODO: Re-enable this when we have a good test cases to verify that it works properly.
@@ -422,9 +676,9 @@ class ThreadManager(BaseQuerySetManager):
         # Precache data only for non-cached threads - only those will be rendered
         #threads = [thread for thread in threads if not thread.summary_html_cached()]
 
-        thread_ids = [obj.id for obj in threads]
+        exercise_ids = [obj.exercise_post_id for obj in threads]
         page_exercises = Post.objects.filter(
-            post_type='exercise', thread__id__in = thread_ids
+            id__in = exercise_ids
         ).only(# pick only the used fields
             'id', 'thread', 'points', 'is_anonymous',
             'summary', 'post_type', 'deleted'
@@ -443,6 +697,68 @@ class ThreadManager(BaseQuerySetManager):
         for thread in threads:
             thread._last_activity_by_cache = user_map[thread.last_activity_by_id]
 
+    def get_post_group_ids(self, thread_ids):
+        """returns dictionary thread id --> set of ids
+        of the groups to which posts of the thread belong"""
+        group_ids = dict([(thread_id, set()) for thread_id in thread_ids])
+        post_groups = PostToGroup.objects.filter(
+                                    post__thread__id__in = thread_ids
+                                ).values_list(
+                                    'post__thread', 'group'
+                                ).distinct()
+        for thread_id, group_id in post_groups:
+            group_ids[thread_id].add(group_id)
+        return group_ids
+
+    def precache_summary_html(self, threads, visitor = None):
+        """loads summary html of the ``threads`` from the cache
+        with one ``get_many`` call, renders the missing ones
+        and stores them with one ``set_many``.
+        With groups enabled the groups of the posts
+        are read first with one query and the versions of
+        the summaries with one more ``get_many``.
+
+        The html is then returned by ``thread.get_summary_html()``
+        without further cache lookups
+        """
+        group_ids = get_visible_group_ids(visitor)
+        versions = dict()
+        if group_ids is not None:
+            thread_ids = [thread.id for thread in threads]
+            post_group_ids = self.get_post_group_ids(thread_ids)
+            version_keys = [
+                Thread.SUMMARY_VERSION_KEY_TPL % thread_id
+                for thread_id in thread_ids
+            ]
+            versions = cache.cache.get_many(version_keys)
+
+        keys = dict()
+        for thread in threads:
+            thread_group_ids = None
+            if group_ids is not None:
+                thread_group_ids = thread.get_visible_post_group_ids(
+                                        visitor,
+                                        group_ids = group_ids,
+                                        post_group_ids = post_group_ids[thread.id]
+                                    )
+            version = versions.get(Thread.SUMMARY_VERSION_KEY_TPL % thread.id)
+            keys[thread.id] = thread.get_summary_cache_key(
+                                                thread_group_ids, version = version
+                                            )
+
+        cached_html = cache.cache.get_many(keys.values())
+        rendered_html = dict()
+        for thread in threads:
+            key = keys[thread.id]
+            html = cached_html.get(key)
+            if html is None:
+                html = thread.render_summary_html(visitor)
+                rendered_html[key] = html
+            thread._summary_html_cache = html
+
+        if rendered_html:
+            cache.cache.set_many(rendered_html, const.LONG_TIME)
+
     
     #todo: this function is similar to get_response_receivers - profile this function against the other one
     def get_thread_contributors(self, thread_list):
@@ -502,6 +818,9 @@ class ThreadToGroup(models.Model):
 
 class Thread(models.Model):
     SUMMARY_CACHE_KEY_TPL = 'thread-exercise-summary-%d'
+    SUMMARY_VERSION_KEY_TPL = 'thread-exercise-summary-version-%d'
+    POST_DATA_VERSION_KEY_TPL = 'thread-data-version-%d'
+    SIMILAR_THREADS_CACHE_KEY_TPL = 'similar-threads-%s'
     PROBLEM_LIST_KEY_TPL = 'thread-problem-list-%d'
     SOLUTION_LIST_KEY_TPL = 'thread-solution-list-%d'
     #MAXTODO: Does a thread need a SOLUTION_LIST_KEY_TPL = 'thread-solution-list-%d'
@@ -539,6 +858,17 @@ class Thread(models.Model):
     #in the revisions. In the revisions there is more data about
     #approvals - by whom and when
     approved = models.BooleanField(default=True, db_index=True)
+    #denormalized data: the exercise post and its deletion mark,
+    #kept in sync by Post.save() and Post.delete(),
+    #so that the listings do not need to join the posts table
+    exercise_post = models.ForeignKey(
+                            Post,
+                            null=True,
+                            blank=True,
+                            related_name='+',
+                            on_delete=models.SET_NULL
+                        )
+    deleted = models.BooleanField(default=False, db_index=True)
     #MAXTODO: Notion of accepted has to do with Moderation which we won't support right away
     #Whole approach to moderation may need to change anyway.  This is a foreign key on one accepted
     #problem.  Our model will have multiple accepted problems per exercise.
@@ -569,7 +899,10 @@ class Thread(models.Model):
         post = getattr(self, '_exercise_cache', None)
         if post:
             return post
-        self._exercise_cache = Post.objects.get(post_type='exercise', thread=self)
+        if self.exercise_post_id:
+            self._exercise_cache = Post.objects.get(id=self.exercise_post_id)
+        else:
+            self._exercise_cache = Post.objects.get(post_type='exercise', thread=self)
         return self._exercise_cache
 
     def get_absolute_url(self):
@@ -843,17 +1176,53 @@ class Thread(models.Model):
 
     def invalidate_cached_thread_content_fragment(self):
         cache.cache.delete(self.SUMMARY_CACHE_KEY_TPL % self.id)
+        bump_cache_version(self.SUMMARY_VERSION_KEY_TPL % self.id)
 
-    def get_post_data_cache_key(self, sort_method = None):
-        return 'thread-data-%s-%s' % (self.id, sort_method)
+    def get_visible_post_group_ids(
+        self, user, group_ids = None, post_group_ids = None
+    ):
+        """returns ids of the groups through which the user
+        sees posts of the thread, ``None`` when groups are disabled.
+
+        All users with the same set see the same posts in the thread,
+        so the cached fragments are shared by them, even though
+        each user has own personal group.
+        ``group_ids`` - groups of the user and ``post_group_ids`` -
+        groups of the thread posts may be given when already known
+        """
+        if group_ids is None:
+            group_ids = get_visible_group_ids(user)
+            if group_ids is None:
+                return None
+        if post_group_ids is None:
+            post_group_ids = Thread.objects.get_post_group_ids([self.id])[self.id]
+        return set(group_ids) & set(post_group_ids)
+
+    def get_post_data_cache_key(
+        self, sort_method = None, group_ids = None, is_author = False
+    ):
+        """key of the post data cached for the visitor
+        who sees posts of the groups with ``group_ids``,
+        ``is_author`` must be ``True`` when the visitor is
+        the exercise author, because moderated threads
+        are shown differently to the author
+        """
+        return 'thread-data-%s-%s-%s-%s-%d' % (
+                        self.id,
+                        get_cache_version(self.POST_DATA_VERSION_KEY_TPL % self.id),
+                        sort_method,
+                        get_group_ids_hash(group_ids),
+                        int(is_author)
+                    )
 
     def invalidate_cached_post_data(self):
         """needs to be called when anything notable
         changes in the post data - on votes, adding,
-        deleting, editing content"""
-        #we can call delete_many() here if using Django > 1.2
-        for sort_method in const.PROBLEM_SORT_METHODS:
-            cache.cache.delete(self.get_post_data_cache_key(sort_method))
+        deleting, editing content, changing groups.
+
+        Bumps the version, so that all cached variants
+        of the post data expire at once"""
+        bump_cache_version(self.POST_DATA_VERSION_KEY_TPL % self.id)
 
     def invalidate_cached_data(self):
         self.invalidate_cached_post_data()
@@ -862,20 +1231,30 @@ class Thread(models.Model):
 
     def get_cached_post_data(self, user = None, sort_method = 'votes'):
         """returns cached post data, as calculated by
-        the method get_post_data()"""
-        if askbot_settings.GROUPS_ENABLED:
-            #temporary plug: bypass cache where groups are enabled
-            return self.get_post_data(sort_method=sort_method, user=user)
-        key = self.get_post_data_cache_key(sort_method)
+        the method get_post_data()
+
+        with groups enabled the data is cached separately
+        for each set of groups whose posts the visitor can see
+        """
+        group_ids = self.get_visible_post_group_ids(user)
+        is_author = False
+        if group_ids is not None and user and user.is_authenticated():
+            is_author = (self._exercise_post().author_id == user.id)
+
+        key = self.get_post_data_cache_key(
+                                    sort_method,
+                                    group_ids = group_ids,
+                                    is_author = is_author
+                                )
         post_data = cache.cache.get(key)
-        if not post_data:
-            post_data = self.get_post_data(sort_method)
+        if post_data is None:
+            post_data = self.get_post_data(sort_method=sort_method, user=user)
             cache.cache.set(key, post_data, const.LONG_TIME)
         return post_data
 
     #MAX: This is changed to attach solutions to problems via the 
     #set_cached_solutions method of the post class.
-    def get_post_data(self, sort_method='votes', user=None):
+    def get_post_data(self, sort_method='votes', user=None, thread_posts=None):
         """returns exercise, problems as list and a list of post ids
         for the given thread, and the list of published post ids
         (four values)
@@ -883,24 +1262,13 @@ class Thread(models.Model):
         all (both posts and the comments sorted in the correct
         order)
         problems are pre-stuffed with solutions
-        """
-        thread_posts = self.posts.all()
-        if askbot_settings.GROUPS_ENABLED:
-            if user is None or user.is_anonymous():
-                groups = (get_global_group(),)
-            else:
-                groups = user.get_groups()
-
-            thread_posts = thread_posts.filter(groups__in=groups)
-            thread_posts = thread_posts.distinct()#important for >1 group
 
-        thread_posts = thread_posts.order_by(
-                    {
-                        'latest':'-added_at',
-                        'oldest':'added_at',
-                        'votes':'-points'
-                    }[sort_method]
-                )
+        ``thread_posts`` - posts of the thread visible to the user,
+        in the order of ``sort_method``, may be given when already loaded
+        """
+        if thread_posts is None:
+            thread_posts = filter_visible_posts(self.posts.all(), user)
+            thread_posts = thread_posts.order_by(POST_SORT_ORDER[sort_method])
         #1) collect exercise, problem and comment posts and list of post id's
         problems = list()
         post_map = dict()
@@ -960,9 +1328,9 @@ class Thread(models.Model):
             except KeyError:
                 pass#solution to deleted problem - don't want it
 
-        if self.has_accepted_problem() and self.accepted_problem.deleted == False:
+        if self.has_accepted_problem():
             #Put the accepted problem to front
-            #the second check is for the case when accepted problem is deleted
+            #deleted problems are not in the post map
             if self.accepted_problem_id in post_map:
                 accepted_problem = post_map[self.accepted_problem_id]
                 problems.remove(accepted_problem)
@@ -980,17 +1348,14 @@ class Thread(models.Model):
                                     ).filter(
                                         deleted=False
                                     ).order_by(
-                                        {
-                                            'latest':'-added_at',
-                                            'oldest':'added_at',
-                                            'votes':'-points'
-                                        }[sort_method]
+                                        POST_SORT_ORDER[sort_method]
                                     ).values_list('id', flat=True)
 
-            published_problem_ids = reversed(published_problem_ids)
+            #a list, not an iterator - the result goes to the cache
+            published_problem_ids = list(published_problem_ids)
             #now put those problems first
             problem_map = dict([(problem.id, problem) for problem in problems])
-            for problem_id in published_problem_ids:
+            for problem_id in reversed(published_problem_ids):
                 problem = problem_map[problem_id]
                 problems.remove(problem)
                 problems.insert(0, problem)
@@ -1011,64 +1376,36 @@ class Thread(models.Model):
     def get_similar_threads(self):
         """
         Get 10 similar threads for given one.
-        Threads with the individual tags will be added to list if above exercises are not full.
 
-        This function has a limitation that it will
-        retrieve only 100 records then select 10 most similar
-        from that list as querying entire database may
-        be very expensive - this function will benefit from
-        some sort of optimization
+        The lists of similar threads are precomputed
+        by :class:`ThreadSimilarityManager` when tags change
+        so here they are just read, together with the exercises,
+        in one query
         """
 
         def get_data():
-            # todo: code in this function would be simpler if
-            # we had exercise post id denormalized on the thread
-            tags_list = self.get_tag_names()
-            similar_threads = Thread.objects.filter(
-                                        tags__name__in=tags_list
-                                    ).exclude(
-                                        id = self.id
-                                    ).exclude(
-                                        posts__post_type='exercise',
-                                        posts__deleted = True
-                                    ).distinct()[:100]
-            similar_threads = list(similar_threads)
-
-            for thread in similar_threads:
-                thread.similarity = self.get_similarity(other_thread=thread)
-
-            similar_threads.sort(key=operator.attrgetter('similarity'), reverse=True)
-            similar_threads = similar_threads[:10]
-
-            # Denormalize exercises to speed up template rendering
-            # todo: just denormalize exercise_post_id on the thread!
-            thread_map = dict([(thread.id, thread) for thread in similar_threads])
-            exercises = Post.objects.get_exercises()
-            exercises = exercises.select_related('thread').filter(thread__in=similar_threads)
-            for q in exercises:
-                thread_map[q.thread_id].exercise_denorm = q
-
-            # Postprocess data for the final output
+            threads = Thread.objects.filter(
+                                    similar_to_threads__thread = self,
+                                    deleted = False
+                                ).select_related(
+                                    'exercise_post'
+                                ).order_by(
+                                    '-similar_to_threads__score'
+                                )
             result = list()
-            for thread in similar_threads:
-                exercise_post = getattr(thread, 'exercise_denorm', None)
-                # unfortunately the if statement below is necessary due to
-                # a possible bug
-                # all this proves that it's wrong to reference threads by
-                # the exercise post id in the exercise page urls!!!
-                # this is a "legacy" problem inherited from the old models
-                if exercise_post:
-                    url = exercise_post.get_absolute_url()
-                    title = thread.get_title(exercise_post)
-                    result.append({'url': url, 'title': title})
-
+            for thread in threads:
+                if thread.exercise_post is None:
+                    continue
+                url = thread.exercise_post.get_absolute_url(thread = thread)
+                title = thread.get_title(thread.exercise_post)
+                result.append({'url': url, 'title': title})
             return result
 
         def get_cached_data():
             """similar thread data will expire
             with the default expiration delay
             """
-            key = 'similar-threads-%s' % self.id
+            key = self.SIMILAR_THREADS_CACHE_KEY_TPL % self.id
             data = cache.cache.get(key)
             if data is None:
                 data = get_data()
@@ -1124,6 +1461,7 @@ class Thread(models.Model):
                         post__id__in=post_ids,
                         tag__id__in=group_ids
                     ).delete()
+        self.invalidate_cached_post_data()
 
     def add_to_groups(
         self, groups, visibility=ThreadToGroup.SHOW_ALL_RESPONSES, recursive=False
@@ -1142,6 +1480,8 @@ class Thread(models.Model):
                 thread_group.visibility = visibility
                 thread_group.save()
 
+        self.invalidate_cached_post_data()
+
         if recursive == True:
             #comments are taken care of automatically
             #Not any more.  comments are not added to groups for now after solutions accommodated
@@ -1152,6 +1492,7 @@ class Thread(models.Model):
                                         thread=self, group__in=groups
                                     )
         thread_groups.delete()
+        self.invalidate_cached_post_data()
         if recursive == True:
             self.remove_child_posts_from_groups(groups)
 
@@ -1199,9 +1540,9 @@ class Thread(models.Model):
         removed_tags = list()
         for tag in self.tags.all():
             if tag.name in tagnames:
-                tag.used_count -= 1
                 removed_tags.append(tag)
         self.tags.remove(*removed_tags)
+        Tag.objects.add_to_use_counts(removed_tags, -1)
         return removed_tags
 
 
@@ -1237,8 +1578,7 @@ class Thread(models.Model):
         #used_count values are decremented on all tags
         removed_tags = self.remove_tags_by_names(removed_tagnames)
 
-        #modified tags go on to recounting their use
-        #todo - this can actually be done asynchronously - not so important
+        #tags which are no longer used are deleted
         modified_tags, unused_tags = separate_unused_tags(removed_tags)
         delete_tags(unused_tags)#tags with used_count == 0 are deleted
 
@@ -1260,7 +1600,15 @@ class Thread(models.Model):
 
             added_tags.extend(created_tags)
             #todo: not nice that assignment of added_tags is way above
+            linked_tag_ids = set(
+                self.tags.filter(
+                    id__in = [tag.id for tag in added_tags]
+                ).values_list('id', flat = True)
+            )
             self.tags.add(*added_tags)
+            Tag.objects.add_to_use_counts(
+                [tag for tag in added_tags if tag.id not in linked_tag_ids], 1
+            )
             modified_tags.extend(added_tags)
         else:
             added_tags = Tag.objects.none()
@@ -1299,9 +1647,8 @@ class Thread(models.Model):
         self.update_summary_html() # regenerate exercise/thread summary html
         ####################################################################
 
-        #if there are any modified tags, update their use counts
+        #use counts of the modified tags were adjusted above
         if modified_tags:
-            Tag.objects.update_use_counts(modified_tags)
             signals.tags_updated.send(None,
                                 thread = self,
                                 tags = modified_tags,
@@ -1381,7 +1728,11 @@ class Thread(models.Model):
         return last_updated_at, last_updated_by
 
     def get_summary_html(self, search_state=None, visitor = None):
-        html = self.get_cached_summary_html(visitor)
+        #the html may be preloaded for the whole page
+        #by ThreadManager.precache_summary_html()
+        html = getattr(self, '_summary_html_cache', None)
+        if not html:
+            html = self.get_cached_summary_html(visitor)
         if not html:
             html = self.update_summary_html(visitor)
 
@@ -1390,40 +1741,37 @@ class Thread(models.Model):
         # use `<<<` and `>>>` because they cannot be confused with user input
         # - if user accidentialy types <<<tag-name>>> into exercise title or body,
         # then in html it'll become escaped like this: &lt;&lt;&lt;tag-name&gt;&gt;&gt;
-        regex = re.compile(
-            r'<<<(%s)>>>' % const.TAG_REGEX_BARE,
-            re.UNICODE
-        )
-
         if search_state is None:
             search_state = DummySearchState()
 
-        while True:
-            match = regex.search(html)
-            if not match:
-                break
-            seq = match.group(0)  # e.g "<<<my-tag>>>"
-            tag = match.group(1)  # e.g "my-tag"
-            full_url = search_state.add_tag(tag).full_url()
-            html = html.replace(seq, full_url)
+        def get_tag_url(match):
+            return search_state.get_tag_url(match.group(1))
 
-        return html
+        return SUMMARY_TAG_PLACEHOLDER_RE.sub(get_tag_url, html)
+
+    def get_summary_cache_key(self, group_ids = None, version = None):
+        """key of the summary html cached for the visitors
+        who can see the posts of groups with ``group_ids``,
+        all variants expire when the summary is updated
+        without the visitor.
+        ``version`` may be given when it is already read from the cache
+        """
+        key = self.SUMMARY_CACHE_KEY_TPL % self.id
+        if group_ids is None:
+            return key
+        if version is None:
+            version = get_cache_version(self.SUMMARY_VERSION_KEY_TPL % self.id)
+        return '%s-%s-%s' % (key, version, get_group_ids_hash(group_ids))
 
     def get_cached_summary_html(self, visitor = None):
-        #todo: remove this plug by adding cached foreign user group
-        #parameter to the key. Now with groups on caching is turned off
-        #parameter visitor is there to get summary out by the user groups
-        if askbot_settings.GROUPS_ENABLED:
-            return None
-        return cache.cache.get(self.SUMMARY_CACHE_KEY_TPL % self.id)
+        """the summary is shared by the visitors
+        who see the same posts of the thread
+        """
+        group_ids = self.get_visible_post_group_ids(visitor)
+        return cache.cache.get(self.get_summary_cache_key(group_ids))
 
-    def update_summary_html(self, visitor = None):
-        #todo: it is quite wrong that visitor is an argument here
-        #because we do not include any visitor-related info in the cache key
-        #ideally cache should be shareable between users, so straight up
-        #using the user id for cache is wrong, we could use group
-        #memberships, but in that case we'd need to be more careful with 
-        #cache invalidation
+    def render_summary_html(self, visitor = None):
+        """renders the summary without the tag urls"""
         context = {
             'thread': self,
             #fetch new exercise post to make sure we're up-to-date
@@ -1431,21 +1779,270 @@ class Thread(models.Model):
             'search_state': DummySearchState(),
             'visitor': visitor
         }
-        html = get_template('widgets/exercise_summary.html').render(context)
+        return get_template('widgets/exercise_summary.html').render(context)
+
+    def update_summary_html(self, visitor = None):
+        """renders the summary for the visitor and puts it into the cache.
+
+        Without the visitor - as it is called when the thread
+        changes - the copies cached for all groups expire
+        """
+        if visitor is None:
+            bump_cache_version(self.SUMMARY_VERSION_KEY_TPL % self.id)
+        html = self.render_summary_html(visitor)
         # INFO: Timeout is set to 30 days:
         # * timeout=0/None is not a reliable cross-backend way to set infinite timeout
         # * We probably don't need to pollute the cache with threads older than 30 days
         # * Additionally, Memcached treats timeouts > 30day as dates (https://code.djangoproject.com/browser/django/tags/releases/1.3/django/core/cache/backends/memcached.py#L36),
         #   which probably doesn't break anything but if we can stick to 30 days then let's stick to it
         cache.cache.set(
-            self.SUMMARY_CACHE_KEY_TPL % self.id,
+            self.get_summary_cache_key(self.get_visible_post_group_ids(visitor)),
             html,
             timeout=const.LONG_TIME
         )
         return html
 
-    def summary_html_cached(self):
-        return cache.cache.has_key(self.SUMMARY_CACHE_KEY_TPL % self.id)
+    def summary_html_cached(self, visitor = None):
+        group_ids = self.get_visible_post_group_ids(visitor)
+        return cache.cache.has_key(self.get_summary_cache_key(group_ids))
+
+#number of similar threads kept per thread
+SIMILAR_THREADS_COUNT = 10
+#threads that share a tag with the given one are read in
+#up to this number per tag, most recently active first,
+#the frequent tags have low weight anyway
+SIMILAR_THREAD_CANDIDATES_PER_TAG = 200
+
+def get_tag_weight(thread_count, tag_use_count):
+    """inverse document frequency of the tag"""
+    return math.log(float(1 + thread_count) / (1 + tag_use_count)) + 1
+
+def calculate_similar_threads(thread_tags, tag_threads, weights, tag_ids):
+    """returns list of (score, thread id) tuples, best first,
+    for the thread with the ``tag_ids``
+
+    the score is the jaccard index of the two tag sets,
+    where each tag counts with its idf weight
+
+    * ``thread_tags`` - thread id --> set of tag ids, must
+      include all candidate threads
+    * ``tag_threads`` - tag id --> list of candidate thread ids
+    * ``weights`` - tag id --> weight
+    """
+    tag_ids = set(tag_ids)
+    own_weight = sum([weights.get(tag_id, 0) for tag_id in tag_ids])
+    shared_weights = dict()
+    for tag_id in tag_ids:
+        weight = weights.get(tag_id, 0)
+        for thread_id in tag_threads.get(tag_id, ()):
+            shared_weights[thread_id] = shared_weights.get(thread_id, 0) + weight
+
+    scores = list()
+    for thread_id, shared_weight in shared_weights.items():
+        other_weight = sum(
+            [weights.get(tag_id, 0) for tag_id in thread_tags[thread_id]]
+        )
+        union_weight = own_weight + other_weight - shared_weight
+        if union_weight > 0:
+            scores.append((shared_weight / union_weight, thread_id))
+    scores.sort(reverse = True)
+    return scores[:SIMILAR_THREADS_COUNT]
+
+
+class ThreadSimilarityManager(models.Manager):
+    """maintains the precomputed lists of similar threads"""
+
+    def get_excluded_thread_ids(self, thread_ids = None):
+        """ids of threads with deleted exercises,
+        these are not offered as similar"""
+        threads = Thread.objects.filter(deleted = True)
+        if thread_ids is not None:
+            threads = threads.filter(id__in = thread_ids)
+        return set(threads.values_list('id', flat = True))
+
+    def update_for_thread(self, thread):
+        """recalculates similar threads of the ``thread``
+        and updates its position in the lists of the threads
+        with common tags
+        """
+        from askbot.utils.db import bulk_create
+        ThreadToTag = Thread.tags.through
+        tag_ids = list(thread.tags.values_list('id', flat = True))
+        thread_count = Thread.objects.count()
+        weights = dict()
+
+        tag_threads = dict()
+        candidate_ids = set()
+        for tag_id in tag_ids:
+            thread_ids = ThreadToTag.objects.filter(
+                                    tag__id = tag_id
+                                ).exclude(
+                                    thread__id = thread.id
+                                ).order_by(
+                                    '-thread__last_activity_at'
+                                ).values_list(
+                                    'thread', flat = True
+                                )[:SIMILAR_THREAD_CANDIDATES_PER_TAG]
+            tag_threads[tag_id] = list(thread_ids)
+            candidate_ids.update(tag_threads[tag_id])
+
+        candidate_ids -= self.get_excluded_thread_ids(candidate_ids)
+        for tag_id, thread_ids in tag_threads.items():
+            tag_threads[tag_id] = [
+                thread_id for thread_id in thread_ids
+                if thread_id in candidate_ids
+            ]
+
+        thread_tags = dict([(thread_id, set()) for thread_id in candidate_ids])
+        tag_data = ThreadToTag.objects.filter(
+                                thread__id__in = candidate_ids
+                            ).values_list('thread', 'tag')
+        for thread_id, tag_id in tag_data:
+            thread_tags[thread_id].add(tag_id)
+
+        all_tag_ids = set(tag_ids)
+        for other_tag_ids in thread_tags.values():
+            all_tag_ids.update(other_tag_ids)
+        use_counts = Tag.objects.filter(
+                                id__in = all_tag_ids
+                            ).values_list('id', 'used_count')
+        for tag_id, used_count in use_counts:
+            weights[tag_id] = get_tag_weight(thread_count, used_count)
+
+        scores = calculate_similar_threads(
+                                thread_tags, tag_threads, weights, tag_ids
+                            )
+
+        #1) the list of the thread itself
+        self.filter(thread = thread).delete()
+        bulk_create([
+            ThreadSimilarity(
+                thread_id = thread.id,
+                similar_thread_id = other_id,
+                score = score
+            )
+            for score, other_id in scores
+        ])
+
+        #2) position of the thread in the lists of the other threads
+        affected_ids = set(
+            self.filter(similar_thread = thread).values_list('thread', flat = True)
+        )
+        self.filter(similar_thread = thread).delete()
+
+        lowest_scores = dict()
+        list_sizes = dict()
+        other_lists = self.filter(
+                            thread__id__in = candidate_ids
+                        ).values_list('thread', 'score')
+        for other_id, score in other_lists:
+            list_sizes[other_id] = list_sizes.get(other_id, 0) + 1
+            lowest_scores[other_id] = min(score, lowest_scores.get(other_id, score))
+
+        new_entries = list()
+        trimmed_ids = list()
+        own_tag_ids = set(tag_ids)
+        own_weight = sum([weights.get(tag_id, 0) for tag_id in own_tag_ids])
+        for other_id in candidate_ids:
+            other_tag_ids = thread_tags[other_id]
+            shared_weight = sum(
+                [weights.get(tag_id, 0) for tag_id in other_tag_ids & own_tag_ids]
+            )
+            other_weight = sum([weights.get(tag_id, 0) for tag_id in other_tag_ids])
+            union_weight = own_weight + other_weight - shared_weight
+            if shared_weight == 0 or union_weight <= 0:
+                continue
+            score = shared_weight / union_weight
+            list_size = list_sizes.get(other_id, 0)
+            if list_size >= SIMILAR_THREADS_COUNT:
+                if score <= lowest_scores[other_id]:
+                    continue
+                trimmed_ids.append(other_id)
+            new_entries.append(
+                ThreadSimilarity(
+                    thread_id = other_id,
+                    similar_thread_id = thread.id,
+                    score = score
+                )
+            )
+            affected_ids.add(other_id)
+        bulk_create(new_entries)
+
+        #drop the lowest scored entry from the lists that got too long
+        for other_id in trimmed_ids:
+            lowest = self.filter(thread__id = other_id).order_by('score')[:1]
+            self.filter(id__in = list(lowest.values_list('id', flat = True))).delete()
+
+        affected_ids.add(thread.id)
+        cache.cache.delete_many(
+            [Thread.SIMILAR_THREADS_CACHE_KEY_TPL % thread_id for thread_id in affected_ids]
+        )
+
+    def rebuild(self):
+        """recalculates all lists of similar threads,
+        the tag relations are read into memory once"""
+        from askbot.utils.db import bulk_create
+        ThreadToTag = Thread.tags.through
+        thread_count = Thread.objects.count()
+        weights = dict()
+        for tag_id, used_count in Tag.objects.values_list('id', 'used_count'):
+            weights[tag_id] = get_tag_weight(thread_count, used_count)
+
+        excluded_ids = self.get_excluded_thread_ids()
+        thread_tags = dict()
+        tag_threads = dict()
+        tag_data = ThreadToTag.objects.order_by(
+                                '-thread__last_activity_at'
+                            ).values_list('thread', 'tag')
+        for thread_id, tag_id in tag_data.iterator():
+            thread_tags.setdefault(thread_id, set()).add(tag_id)
+            if thread_id in excluded_ids:
+                continue
+            candidates = tag_threads.setdefault(tag_id, list())
+            if len(candidates) < SIMILAR_THREAD_CANDIDATES_PER_TAG + 1:
+                candidates.append(thread_id)
+
+        self.all().delete()
+        entries = list()
+        for thread_id, tag_ids in thread_tags.items():
+            candidate_threads = dict()
+            for tag_id in tag_ids:
+                candidate_threads[tag_id] = [
+                    other_id for other_id in tag_threads.get(tag_id, ())
+                    if other_id != thread_id
+                ]
+            scores = calculate_similar_threads(
+                                thread_tags, candidate_threads, weights, tag_ids
+                            )
+            for score, other_id in scores:
+                entries.append(
+                    ThreadSimilarity(
+                        thread_id = thread_id,
+                        similar_thread_id = other_id,
+                        score = score
+                    )
+                )
+        bulk_create(entries)
+        cache.cache.delete_many(
+            [Thread.SIMILAR_THREADS_CACHE_KEY_TPL % thread_id for thread_id in thread_tags]
+        )
+
+
+class ThreadSimilarity(models.Model):
+    """precomputed list of threads similar to the ``thread``,
+    by the idf weighted overlap of the tags,
+    see :func:`calculate_similar_threads`
+    """
+    thread = models.ForeignKey(Thread, related_name='similarities')
+    similar_thread = models.ForeignKey(Thread, related_name='similar_to_threads')
+    score = models.FloatField()
+
+    objects = ThreadSimilarityManager()
+
+    class Meta:
+        app_label = 'askbot'
+        ordering = ('-score',)
+
 
 class ExerciseView(models.Model):
     exercise = models.ForeignKey(Post, related_name='viewed')
@@ -1455,6 +2052,40 @@ class ExerciseView(models.Model):
     class Meta:
         app_label = 'askbot'
 
+def update_exercise_views(visits):
+    """records the exercise views of many users at once,
+    ``visits`` is a dictionary with keys - tuples (user id, exercise id)
+    and values - times of the visits
+    """
+    new_visits = dict(visits)
+    times_by_view_id = dict()
+    keys = visits.keys()
+    for start in xrange(0, len(keys), 250):
+        batch = keys[start:start + 250]
+        views = ExerciseView.objects.filter(
+                            who__id__in = set([key[0] for key in batch]),
+                            exercise__id__in = set([key[1] for key in batch])
+                        ).values_list('id', 'who', 'exercise')
+        for view_id, user_id, exercise_id in views:
+            key = (user_id, exercise_id)
+            if key in visits:
+                times_by_view_id[view_id] = visits[key]
+                new_visits.pop(key, None)
+
+    bulk_update(ExerciseView, 'when', times_by_view_id, only_greater = True)
+    bulk_create([
+        ExerciseView(who_id = user_id, exercise_id = exercise_id, when = when)
+        for (user_id, exercise_id), when in new_visits.items()
+    ])
+
+#views of the threads counted in this process
+thread_view_count_buffer = WriteBehindBuffer(
+                                Thread.objects.increase_view_counts,
+                                merge = operator.add
+                            )
+#latest exercise views of the users in this process
+exercise_view_buffer = WriteBehindBuffer(update_exercise_views, merge = max)
+
 class FavoriteExercise(models.Model):
     """A favorite Exercise of a User."""
     thread        = models.ForeignKey(Thread)
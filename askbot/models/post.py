@@ -29,8 +29,8 @@ from askbot.models.user import Activity
 from askbot.models.user import EmailFeedSetting
 from askbot.models.user import Group
 from askbot.models.user import GroupMembership
-from askbot.models.tag import Tag, MarkedTag
-from askbot.models.tag import get_groups, tags_match_some_wildcard
+from askbot.models.tag import Tag, TagSubscriberIndex
+from askbot.models.tag import get_groups
 from askbot.models.tag import get_global_group
 from askbot.conf import settings as askbot_settings
 from askbot import exceptions
@@ -610,6 +610,9 @@ class Post(models.Model):
         #because generic relation needs primary key of the related object
         super(self.__class__, self).save(**kwargs)
 
+        if self.is_exercise() and self.thread_id:
+            self.update_thread_exercise_data()
+
         if self.is_comment():
             #copy groups from the parent post into the comment
             groups = self.parent.groups.all()
@@ -683,6 +686,9 @@ class Post(models.Model):
         #todo: use bulk-creation
         for group in groups:
             PostToGroup.objects.get_or_create(post=self, group=group)
+        if self.thread_id:
+            self.thread.invalidate_cached_post_data()
+            self.thread.invalidate_cached_thread_content_fragment()
         #MAX: Error on this sequence because of comments.all()
         #commented out for now.  Disables adding comments to groups...not a big deal...
         #if self.is_problem() or self.is_exercise() or self.is_solution():
@@ -700,6 +706,9 @@ class Post(models.Model):
                                        post__id__in=comment_ids,
                                        group__in=groups
                                        ).delete()
+        if self.thread_id:
+            self.thread.invalidate_cached_post_data()
+            self.thread.invalidate_cached_thread_content_fragment()
 
 
     def issue_update_notifications(
@@ -736,8 +745,12 @@ class Post(models.Model):
         update_activity.save()
 
         update_activity.add_recipients(notify_sets['for_inbox'])
+        if activity_type in const.RESPONSE_ACTIVITY_TYPES_FOR_COUNTS:
+            from askbot.models import increment_new_response_counts
+            increment_new_response_counts(notify_sets['for_inbox'])
 
-        #create new mentions (barring the double-adds)
+        #create new mentions (barring the double-adds),
+        #response counts of the mentioned users are updated there
         for u in notify_sets['for_mentions'] - notify_sets['for_inbox']:
             Activity.objects.create_new_mention(
                                                 mentioned_whom = u,
@@ -746,9 +759,6 @@ class Post(models.Model):
                                                 mentioned_at = timestamp
                                                 )
 
-        for user in (notify_sets['for_inbox'] | notify_sets['for_mentions']):
-            user.update_response_counts()
-
         #shortcircuit if the email alerts are disabled
         if askbot_settings.ENABLE_EMAIL_ALERTS == False:
             return
@@ -912,8 +922,34 @@ class Post(models.Model):
             for user in recipients:
                 user.update_response_counts()
 
+        if self.is_exercise() and self.thread_id:
+            from askbot.models.exercise import Thread
+            Thread.objects.filter(
+                            id = self.thread_id
+                        ).update(
+                            exercise_post = None, deleted = True
+                        )
+
         super(Post, self).delete(**kwargs)
 
+    def update_thread_exercise_data(self):
+        """copies id and the deletion mark of the exercise post
+        to the denormalized fields of the thread"""
+        thread = getattr(self, '_thread_cache', None)
+        if thread is not None \
+            and thread.exercise_post_id == self.id \
+            and thread.deleted == self.deleted:
+            return
+        from askbot.models.exercise import Thread
+        Thread.objects.filter(
+                        id = self.thread_id
+                    ).update(
+                        exercise_post = self.id, deleted = self.deleted
+                    )
+        if thread is not None:
+            thread.exercise_post_id = self.id
+            thread.deleted = self.deleted
+
     def __unicode__(self):
         if self.is_exercise():
             return self.thread.title
@@ -930,6 +966,8 @@ class Post(models.Model):
         if self.is_solution() and self.is_anonymous:
             raise ValueError('Solution cannot be anonymous!')
         super(Post, self).save(*args, **kwargs)
+        if self.is_exercise() and self.thread_id:
+            self.update_thread_exercise_data()
         if self.is_problem() and 'postgres' in askbot.get_database_engine_name():
             #hit the database to trigger update of full text search vector
             self.thread._exercise_post().save()
@@ -1153,61 +1191,28 @@ class Post(models.Model):
             """
         if tag_mark_reason == 'good':
             email_tag_filter_strategy = const.INCLUDE_INTERESTING
-            user_set_getter = User.objects.filter
         elif tag_mark_reason == 'bad':
             email_tag_filter_strategy = const.EXCLUDE_IGNORED
-            user_set_getter = User.objects.exclude
         else:
             raise ValueError('Uknown value of tag mark reason %s' % tag_mark_reason)
 
-        #part 1 - find users who follow or not ignore the set of tags
+        #users who marked any of the tags with the reason,
+        #directly or via the wildcards
         tag_names = self.get_tag_names()
-        tag_selections = MarkedTag.objects.filter(
-                                                  tag__name__in = tag_names,
+        selector_ids = TagSubscriberIndex.objects.get_subscriber_ids(
+                                                  tag_names = tag_names,
                                                   reason = tag_mark_reason
                                                   )
-        subscribers = set(
-                          user_set_getter(
-                                          tag_selections__in = tag_selections
-                                          ).filter(
-                                                   email_tag_filter_strategy = email_tag_filter_strategy,
-                                                   notification_subscriptions__in = subscription_records
-                                                   )
-                          )
+        potential_subscribers = User.objects.filter(
+                                                  email_tag_filter_strategy = email_tag_filter_strategy,
+                                                  notification_subscriptions__in = subscription_records
+                                                  )
+        if tag_mark_reason == 'good':
+            subscribers = potential_subscribers.filter(id__in = selector_ids)
+        else:
+            subscribers = potential_subscribers.exclude(id__in = selector_ids)
 
-        #part 2 - find users who follow or not ignore tags via wildcard selections
-        #inside there is a potentially time consuming loop
-        if askbot_settings.USE_WILDCARD_TAGS:
-            #todo: fix this
-            #this branch will not scale well
-            #because we have to loop through the list of users
-            #in python
-            if tag_mark_reason == 'good':
-                empty_wildcard_filter = {'interesting_tags__exact': ''}
-                wildcard_tags_attribute = 'interesting_tags'
-                update_subscribers = lambda the_set, item: the_set.add(item)
-            elif tag_mark_reason == 'bad':
-                empty_wildcard_filter = {'ignored_tags__exact': ''}
-                wildcard_tags_attribute = 'ignored_tags'
-                update_subscribers = lambda the_set, item: the_set.discard(item)
-
-            potential_wildcard_subscribers = User.objects.filter(
-                                                                 notification_subscriptions__in = subscription_records
-                                                                 ).filter(
-                                                                          email_tag_filter_strategy = email_tag_filter_strategy
-                                                                          ).exclude(
-                                                                                    **empty_wildcard_filter #need this to limit size of the loop
-                                                                                    )
-            for potential_subscriber in potential_wildcard_subscribers:
-                wildcard_tags = getattr(
-                                        potential_subscriber,
-                                        wildcard_tags_attribute
-                                        ).split(' ')
-
-                if tags_match_some_wildcard(tag_names, wildcard_tags):
-                    update_subscribers(subscribers, potential_subscriber)
-
-        return subscribers
+        return set(subscribers)
 
     def get_global_instant_notification_subscribers(self):
         """returns a set of subscribers to post according to tag filters
@@ -2004,6 +2009,10 @@ class Post(models.Model):
                                     tagnames = tags, user = edited_by, timestamp = edited_at
                                     )
 
+        if self.thread.title != title:
+            from askbot.models import UserTimelineEntry
+            UserTimelineEntry.objects.update_title(self, title)
+
         self.thread.title = title
         self.thread.tagnames = tags
         self.thread.save()
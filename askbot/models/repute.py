@@ -1,16 +1,136 @@
 #TODO: Make work with new post_types
 
 import datetime
+import functools
+import threading
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
 from django.contrib.auth.models import User
+from django.core import cache
 from django.db import models
 from django.utils.translation import ugettext as _
 from django.utils.html import escape
 from askbot import const
 from django.core.urlresolvers import reverse
 
+#changes of the daily counters waiting for the commit, per thread
+_pending = threading.local()
+
+class DailyCounter(object):
+    """counter of something done by or to a user within a day,
+    kept in the cache and incremented along with the changes
+    of the database, when the cache does not have the counter,
+    it is computed with the function ``count_in_db(user_id, day)``
+
+    The counter is stored with an offset, so that it can
+    be atomically decremented by memcached, which does not
+    go below zero.
+    """
+    OFFSET = 1000000
+    #the counters are kept for a day after their day has passed
+    TIMEOUT = 2*24*60*60
+
+    def __init__(self, key_prefix, count_in_db):
+        self.key_prefix = key_prefix
+        self.count_in_db = count_in_db
+
+    def get_cache_key(self, user_id, day):
+        return '%s-%d-%s' % (self.key_prefix, user_id, day.isoformat())
+
+    def get(self, user_id, day = None):
+        """returns value of the counter for the user,
+        by default - for today"""
+        day = day or datetime.date.today()
+        key = self.get_cache_key(user_id, day)
+        value = cache.cache.get(key)
+        if value is None:
+            count = self.count_in_db(user_id, day)
+            cache.cache.add(key, count + self.OFFSET, self.TIMEOUT)
+            return count
+        return value - self.OFFSET
+
+    def add(self, user_id, delta, day = None):
+        """adds ``delta`` to the counter, must be called
+        after the change is saved to the database; within
+        a function decorated with :func:`update_counters_after_commit`
+        the change is applied when that function returns
+        """
+        day = day or datetime.date.today()
+        pending_changes = getattr(_pending, 'changes', None)
+        if pending_changes is not None:
+            pending_changes.append((self, user_id, delta, day))
+            return
+        key = self.get_cache_key(user_id, day)
+        try:
+            if delta > 0:
+                cache.cache.incr(key, delta)
+            elif delta < 0:
+                cache.cache.decr(key, -delta)
+        except ValueError:
+            #not in the cache - will be counted in the database when needed
+            pass
+
+
+def update_counters_after_commit(func):
+    """decorator, collects the changes of the daily counters
+    made by ``func`` and applies them after it returns,
+    or drops them if it raises - put it above
+    ``transaction.commit_on_success``, so that the counters
+    are not changed by the rolled back transactions
+    """
+    @functools.wraps(func)
+    def wrapped(*args, **kwargs):
+        if getattr(_pending, 'changes', None) is not None:
+            #the outermost decorated call applies the changes
+            return func(*args, **kwargs)
+        _pending.changes = list()
+        try:
+            result = func(*args, **kwargs)
+            changes = _pending.changes
+        finally:
+            _pending.changes = None
+        for counter, user_id, delta, day in changes:
+            counter.add(user_id, delta, day)
+        return result
+    return wrapped
+
+
+def get_day_range(day):
+    return (day, day + datetime.timedelta(1))
+
+def count_votes_in_db(user_id, day):
+    return Vote.objects.filter(
+                        user__id = user_id,
+                        voted_at__range = get_day_range(day)
+                    ).count()
+
+def count_upvote_reputation_in_db(user_id, day):
+    return Repute.objects.get_reputation_by_upvoted_on(user_id, day)
+
+#number of votes cast by the user on the day,
+#updated in the ``askbot.auth`` vote handlers
+votes_of_day = DailyCounter('votes-of-day', count_votes_in_db)
+#reputation gained by the user on the day for the upvotes of the posts
+upvote_reputation_of_day = DailyCounter(
+                                'upvote-reputation-of-day',
+                                count_upvote_reputation_in_db
+                            )
+
+
 class VoteManager(models.Manager):
+    def get_vote_counts_from_user(self, user):
+        """returns tuple of numbers of the up and down votes of the user"""
+        counts = dict(
+            self.filter(
+                user = user
+            ).values_list(
+                'vote'
+            ).annotate(
+                models.Count('id')
+            ).order_by()
+        )
+        return counts.get(Vote.VOTE_UP, 0), counts.get(Vote.VOTE_DOWN, 0)
+
     def get_up_vote_count_from_user(self, user):
         if user is not None:
             return self.filter(user=user, vote=1).count()
@@ -25,8 +145,7 @@ class VoteManager(models.Manager):
 
     def get_votes_count_today_from_user(self, user):
         if user is not None:
-            today = datetime.date.today()
-            return self.filter(user=user, voted_at__range=(today, today + datetime.timedelta(1))).count()
+            return votes_of_day.get(user.id)
         else:
             return 0
 
@@ -169,23 +288,26 @@ class ReputeManager(models.Manager):
         if user is None:
             return 0
         else:
-            today = datetime.date.today()
-            tomorrow = today + datetime.timedelta(1)
-            rep_types = (1,-8)
-            sums = self.filter(models.Q(reputation_type__in=rep_types),
-                                user=user,
-                                reputed_at__range=(today, tomorrow),
-                      ).aggregate(models.Sum('positive'), models.Sum('negative'))
-            if sums:
-                pos = sums['positive__sum']
-                neg = sums['negative__sum']
-                if pos is None:
-                    pos = 0
-                if neg is None:
-                    neg = 0
-                return pos + neg
-            else:
-                return 0
+            return upvote_reputation_of_day.get(user.id)
+
+    def get_reputation_by_upvoted_on(self, user_id, day):
+        """sums the reputation changes for the upvotes
+        and their cancelations of the user on the day"""
+        rep_types = (1,-8)
+        sums = self.filter(models.Q(reputation_type__in=rep_types),
+                            user__id=user_id,
+                            reputed_at__range=get_day_range(day),
+                  ).aggregate(models.Sum('positive'), models.Sum('negative'))
+        if sums:
+            pos = sums['positive__sum']
+            neg = sums['negative__sum']
+            if pos is None:
+                pos = 0
+            if neg is None:
+                neg = 0
+            return pos + neg
+        else:
+            return 0
 
 class Repute(models.Model):
     """The reputation histories for user"""
@@ -1,13 +1,18 @@
+import collections
 import re
 import logging
 from django.db import models
 from django.contrib.auth.models import User
+from django.core import cache
 from django.utils.translation import ugettext as _
 from django.conf import settings
 from askbot.models.base import BaseQuerySetManager
 from askbot import const
 from askbot.conf import settings as askbot_settings
 from askbot.utils import category_tree
+from askbot.utils.cache import get_cache_versions, bump_cache_version
+from askbot.utils.db import bulk_update, filter_in_chunks
+from askbot.search import tag_completion
 
 def get_global_group():
     """Returns the global group,
@@ -131,18 +136,65 @@ class TagQuerySet(models.query.QuerySet):
         return tags
 
     def update_use_counts(self, tags):
-        """Updates the given Tags with their current use counts."""
+        """Updates the given Tags with their current use counts.
+
+        The counts are calculated with one grouped query and
+        the changed ones are written with one bulk update
+        per chunk of tags, ``tags`` may be a list or a query set
+        """
+        if isinstance(tags, models.query.QuerySet):
+            tag_ids = list(tags.values_list('id', flat = True))
+            tags = list()
+        else:
+            tags = list(tags)
+            tag_ids = [tag.id for tag in tags]
+
+        use_counts = dict()
+        changed_counts = dict()
+        for chunk in filter_in_chunks(self.model.objects.all(), 'id', tag_ids):
+            counts = chunk.annotate(
+                            thread_count = models.Count('threads')
+                        ).values_list('id', 'used_count', 'thread_count')
+            for tag_id, used_count, thread_count in counts:
+                use_counts[tag_id] = thread_count
+                if used_count != thread_count:
+                    changed_counts[tag_id] = thread_count
+
+        bulk_update(self.model, 'used_count', changed_counts)
+        for tag in tags:
+            tag.used_count = use_counts.get(tag.id, tag.used_count)
+
+    def add_to_use_counts(self, tags, delta):
+        """adds ``delta`` to the use counts of the ``tags``
+        with one ``UPDATE``, instead of recounting them,
+        and loads the new counts into the tag objects
+        """
+        tags = list(tags)
+        if len(tags) == 0 or delta == 0:
+            return
+        tag_ids = [tag.id for tag in tags]
+        updated_tags = self.model.objects.filter(id__in = tag_ids)
+        if delta < 0:
+            updated_tags = updated_tags.filter(used_count__gte = -delta)
+        updated_tags.update(used_count = models.F('used_count') + delta)
+
+        use_counts = dict(
+            self.model.objects.filter(
+                id__in = tag_ids
+            ).values_list('id', 'used_count')
+        )
         for tag in tags:
-            tag.used_count = tag.threads.count()
-            tag.save()
+            tag.used_count = use_counts.get(tag.id, tag.used_count)
 
     def mark_undeleted(self):
         """removes deleted(+at/by) marks"""
-        self.update(#undelete them
+        undeleted_count = self.filter(deleted = True).update(#undelete them
             deleted = False,
             deleted_by = None,
             deleted_at = None
         )
+        if undeleted_count > 0:
+            tag_completion.expire_index()
 
     def tags_match_some_wildcard(self, wildcard_tags = None):
         """True if any one of the tags in the query set
@@ -172,6 +224,17 @@ class TagQuerySet(models.query.QuerySet):
             tag_filter |= models.Q(name__startswith = next_tag[:-1])
         return self.filter(tag_filter)
 
+    def filter_by_names_iexact(self, tag_names):
+        """returns query set of tags whose names match
+        any of the ``tag_names`` regardless of the case"""
+        tag_names = list(tag_names)
+        if len(tag_names) == 0:
+            return self.none()
+        tag_filter = models.Q(name__iexact = tag_names[0])
+        for tag_name in tag_names[1:]:
+            tag_filter |= models.Q(name__iexact = tag_name)
+        return self.filter(tag_filter)
+
     def get_related_to_search(self, threads, ignored_tag_names):
         """Returns at least tag names, along with use counts"""
         tags = self.filter(threads__in=threads).annotate(local_used_count=models.Count('id')).order_by('-local_used_count', 'name')
@@ -252,7 +315,11 @@ class TagManager(BaseQuerySetManager):
         #deal with suggested tags
         if user.can_create_tags():
             #turn previously suggested tags into accepted
-            pre_suggested_tags.update(status = Tag.STATUS_ACCEPTED)
+            accepted_count = pre_suggested_tags.update(
+                                    status = Tag.STATUS_ACCEPTED
+                                )
+            if accepted_count > 0:
+                tag_completion.expire_index()
         else:
             #increment use count and add user to "suggested_by"
             for tag in pre_suggested_tags:
@@ -333,6 +400,267 @@ class MarkedTag(models.Model):
     class Meta:
         app_label = 'askbot'
 
+#user fields with the space separated wildcard selections, per reason
+WILDCARD_TAG_FIELDS = (
+    ('good', 'interesting_tags'),
+    ('bad', 'ignored_tags'),
+    ('subscribed', 'subscribed_tags'),
+)
+
+class TagSubscriberIndexManager(models.Manager):
+    """maintains and queries the
+    :class:`~askbot.models.tag.TagSubscriberIndex`
+    """
+
+    def get_subscriber_ids(self, tag_names = None, reason = None):
+        """returns values query set of ids of users
+        who marked any of the ``tag_names`` with ``reason``,
+        directly or via wildcards
+
+        wildcard selections are found by walking down the
+        prefix path of each tag name, so the cost of the lookup
+        depends on the number and length of the tags,
+        not on the number of users
+        """
+        lookup = models.Q(is_wildcard = False, name__in = tag_names)
+        if askbot_settings.USE_WILDCARD_TAGS:
+            prefixes = set()
+            for tag_name in tag_names:
+                for length in range(1, len(tag_name) + 1):
+                    prefixes.add(tag_name[:length])
+            lookup |= models.Q(is_wildcard = True, name__in = prefixes)
+        return self.filter(
+                        lookup, reason = reason
+                    ).values_list('user', flat = True)
+
+    def get_index_entries(self, user_id, reason, wildcards):
+        """returns unsaved index entries for the
+        space separated wildcard tag string"""
+        entries = list()
+        for wildcard in set(wildcards.split()):
+            if wildcard.endswith('*') and len(wildcard) > 1:
+                entries.append(
+                    TagSubscriberIndex(
+                        user_id = user_id,
+                        reason = reason,
+                        name = wildcard[:-1],
+                        is_wildcard = True
+                    )
+                )
+        return entries
+
+    def update_user_tags(self, user):
+        """re-indexes the plain tag selections of the user"""
+        from askbot.utils.db import bulk_create
+        self.filter(user = user, is_wildcard = False).delete()
+        marks = MarkedTag.objects.filter(
+                                user = user
+                            ).values_list('reason', 'tag__name')
+        bulk_create([
+            TagSubscriberIndex(user_id = user.id, reason = reason, name = name)
+            for reason, name in marks
+        ])
+
+    def update_user_wildcards(self, user):
+        """re-indexes the wildcard tag selections of the user"""
+        from askbot.utils.db import bulk_create
+        self.filter(user = user, is_wildcard = True).delete()
+        entries = list()
+        for reason, field_name in WILDCARD_TAG_FIELDS:
+            wildcards = getattr(user, field_name)
+            entries.extend(self.get_index_entries(user.id, reason, wildcards))
+        bulk_create(entries)
+
+    def rename_tag(self, old_name, new_name):
+        """moves the plain selections of the renamed tag"""
+        self.filter(
+            name = old_name, is_wildcard = False
+        ).update(name = new_name)
+
+    def remove_tag(self, name):
+        """drops the plain selections of the deleted tag,
+        the wildcards do not depend on the existing tags"""
+        self.filter(name = name, is_wildcard = False).delete()
+
+    def rebuild(self):
+        """rebuilds the whole index from the
+        :class:`~askbot.models.tag.MarkedTag` records
+        and the wildcard selections stored with the users
+        """
+        from askbot.utils.db import bulk_create
+        self.all().delete()
+        marks = MarkedTag.objects.values_list('user', 'reason', 'tag__name')
+        bulk_create([
+            TagSubscriberIndex(user_id = user_id, reason = reason, name = name)
+            for user_id, reason, name in marks.iterator()
+        ])
+
+        entries = list()
+        field_names = [field_name for reason, field_name in WILDCARD_TAG_FIELDS]
+        has_wildcards = ~models.Q(**{field_names[0]: ''})
+        for field_name in field_names[1:]:
+            has_wildcards |= ~models.Q(**{field_name: ''})
+        wildcard_data = User.objects.filter(
+                                    has_wildcards
+                                ).values_list('id', *field_names)
+        for row in wildcard_data.iterator():
+            user_id = row[0]
+            for reason_info, wildcards in zip(WILDCARD_TAG_FIELDS, row[1:]):
+                entries.extend(
+                    self.get_index_entries(user_id, reason_info[0], wildcards)
+                )
+        bulk_create(entries)
+
+
+class TagSubscriberIndex(models.Model):
+    """denormalized index of the tag selections made by the users,
+    used to find subscribers to the tags of a post
+    without looping through the users
+
+    ``name`` is the tag name for the plain selections
+    (:class:`MarkedTag`) and the part before the asterisk
+    for the wildcard selections
+    """
+    user = models.ForeignKey(User, related_name='tag_subscriber_index')
+    reason = models.CharField(max_length=16, choices=MarkedTag.TAG_MARK_REASONS)
+    name = models.CharField(max_length=255, db_index=True)
+    is_wildcard = models.BooleanField(default=False)
+
+    objects = TagSubscriberIndexManager()
+
+    class Meta:
+        app_label = 'askbot'
+
+
+USER_TAG_FILTER_VERSION_KEY_TPL = 'user-tag-filter-version-%d'
+USER_TAG_FILTER_CACHE_KEY_TPL = 'user-tag-filter-%d-%s'
+
+class UserTagFilter(object):
+    """tag selections of a user resolved into ids of the
+    marked tags and the wildcards, per reason: good, bad or subscribed.
+
+    Instances are cached, use :func:`get_user_tag_filter`
+    """
+
+    def __init__(self, tag_ids, tag_names, wildcards):
+        """all parameters are dictionaries by the reason"""
+        self.tag_ids = tag_ids
+        self.tag_names = tag_names
+        self.wildcards = wildcards
+
+    @classmethod
+    def load(cls, user):
+        return cls.load_many([user])[user.id]
+
+    @classmethod
+    def load_many(cls, users):
+        """returns dictionary of the filters of the users
+        by the user id, the marked tags are read with one query"""
+        tag_ids = collections.defaultdict(dict)
+        tag_names = collections.defaultdict(dict)
+        marks = MarkedTag.objects.filter(
+                        user__in = [user.id for user in users]
+                    ).values_list('user', 'reason', 'tag', 'tag__name')
+        for user_id, reason, tag_id, tag_name in marks:
+            tag_ids[user_id].setdefault(reason, set()).add(tag_id)
+            tag_names[user_id].setdefault(reason, list()).append(tag_name)
+
+        filters = dict()
+        for user in users:
+            user_tag_ids = dict()
+            user_tag_names = dict()
+            wildcards = dict()
+            for reason, field_name in WILDCARD_TAG_FIELDS:
+                wildcards[reason] = tuple(getattr(user, field_name).split())
+                user_tag_ids[reason] = frozenset(
+                                    tag_ids[user.id].get(reason, ())
+                                )
+                user_tag_names[reason] = tuple(
+                                    sorted(tag_names[user.id].get(reason, ()))
+                                )
+            filters[user.id] = cls(user_tag_ids, user_tag_names, wildcards)
+        return filters
+
+    def get_tag_ids(self, reason):
+        return self.tag_ids.get(reason, frozenset())
+
+    def get_tag_names(self, reason):
+        """names of the marked tags, without the wildcards"""
+        return self.tag_names.get(reason, ())
+
+    def get_wildcards(self, reason):
+        return self.wildcards.get(reason, ())
+
+    def get_fingerprint(self):
+        """string which changes with the selections"""
+        return repr([
+            (reason, sorted(self.get_tag_ids(reason)), self.get_wildcards(reason))
+            for reason, field_name in WILDCARD_TAG_FIELDS
+        ])
+
+    def get_thread_filter(self, reason, use_wildcards = True):
+        """returns ``Q`` object selecting threads having any of the
+        tags selected for the ``reason``, or ``None`` if there are none.
+
+        To exclude the threads, filter the ids in a subquery -
+        ``exclude()`` with the ``Q`` object would join the tags
+        """
+        tag_filter = None
+        tag_ids = self.get_tag_ids(reason)
+        if tag_ids:
+            tag_filter = models.Q(tags__in = tag_ids)
+        if use_wildcards:
+            for wildcard in self.get_wildcards(reason):
+                wildcard_filter = models.Q(tags__name__startswith = wildcard[:-1])
+                if tag_filter is None:
+                    tag_filter = wildcard_filter
+                else:
+                    tag_filter |= wildcard_filter
+        return tag_filter
+
+
+def get_user_tag_filter(user):
+    """returns the :class:`UserTagFilter` of the user,
+    cached until the user changes the tag selections"""
+    return get_user_tag_filters([user])[user.id]
+
+def get_user_tag_filters(users):
+    """returns dictionary of the :class:`UserTagFilter` objects
+    of the users by the user id, the cached filters are read
+    at once and the missing ones are loaded with one query"""
+    version_keys = dict([
+        (user.id, USER_TAG_FILTER_VERSION_KEY_TPL % user.id) for user in users
+    ])
+    versions = get_cache_versions(version_keys.values())
+    keys = dict([
+        (user.id, USER_TAG_FILTER_CACHE_KEY_TPL % (user.id, versions[version_keys[user.id]]))
+        for user in users
+    ])
+    cached_filters = cache.cache.get_many(keys.values())
+
+    filters = dict()
+    missing_users = list()
+    for user in users:
+        if keys[user.id] in cached_filters:
+            filters[user.id] = cached_filters[keys[user.id]]
+        else:
+            missing_users.append(user)
+
+    if missing_users:
+        loaded_filters = UserTagFilter.load_many(missing_users)
+        cache.cache.set_many(
+            dict([
+                (keys[user_id], tag_filter)
+                for user_id, tag_filter in loaded_filters.items()
+            ]),
+            const.LONG_TIME
+        )
+        filters.update(loaded_filters)
+    return filters
+
+def expire_user_tag_filter(user):
+    bump_cache_version(USER_TAG_FILTER_VERSION_KEY_TPL % user.id)
+
 def get_groups():
     from askbot.models import Group
     return Group.objects.all()
@@ -10,12 +10,15 @@ from django.contrib.contenttypes import generic
 from django.contrib.auth.models import User
 from django.contrib.auth.models import Group as AuthGroup
 from django.core import exceptions
+from django.core.urlresolvers import reverse
 from django.forms import EmailField, URLField
 from django.utils.translation import ugettext as _
 from django.utils.html import strip_tags
 from askbot import const
 from askbot.conf import settings as askbot_settings
 from askbot.utils import functions
+from askbot.utils.slug import slugify
+from askbot.utils.db import bulk_create
 from askbot.models.base import BaseQuerySetManager
 from askbot.models.tag import Tag, get_global_group
 from askbot.models.tag import clean_group_name#todo - delete this
@@ -197,12 +200,14 @@ class Activity(models.Model):
 
     def add_recipients(self, recipients):
         """have to use a special method, because django does not allow
-        auto-adding to M2M with "through" model
+        auto-adding to M2M with "through" model,
+        the audit records are inserted with multi-row statements
         """
-        for recipient in recipients:
-            #todo: may optimize for bulk addition
-            aas = ActivityAuditStatus(user = recipient, activity = self)
-            aas.save()
+        recipient_ids = set([recipient.id for recipient in recipients])
+        bulk_create([
+            ActivityAuditStatus(user_id = recipient_id, activity = self)
+            for recipient_id in recipient_ids
+        ])
 
     def get_mentioned_user(self):
         assert(self.activity_type == const.TYPE_ACTIVITY_MENTION)
@@ -219,6 +224,127 @@ class Activity(models.Model):
     def get_absolute_url(self):
         return self.content_object.get_absolute_url()
 
+
+class UserTimelineEntryManager(models.Manager):
+    def build_for_activity(self, activity):
+        """returns unsaved timeline entry of the activity,
+        or ``None`` if the activity is not shown on the timeline
+        """
+        activity_type = activity.activity_type
+        if activity_type not in const.USER_TIMELINE_ACTIVITY_TYPES:
+            return None
+        content_object = activity.content_object
+        if content_object is None:
+            return None
+
+        entry = UserTimelineEntry(
+                        user_id = activity.user_id,
+                        activity = activity,
+                        activity_type = activity_type,
+                        active_at = activity.active_at
+                    )
+        if activity_type == const.TYPE_ACTIVITY_PRIZE:
+            entry.active_at = content_object.awarded_at
+            entry.badge_id = content_object.badge_id
+            post = content_object.content_object
+            if getattr(post, 'post_type', None) not in ('exercise', 'problem'):
+                #badges for the posts of other types and for the users
+                return entry
+        elif activity_type in (
+                        const.TYPE_ACTIVITY_COMMENT_EXERCISE,
+                        const.TYPE_ACTIVITY_COMMENT_PROBLEM
+                    ):
+            entry.active_at = content_object.added_at
+            post = content_object.parent
+        else:
+            post = content_object
+
+        if post.is_exercise():
+            exercise = post
+        elif post.is_problem():
+            exercise = post.thread._exercise_post()
+            entry.problem = post
+        else:
+            return None
+        entry.exercise = exercise
+        entry.title = post.thread.title
+
+        if activity_type in (
+                        const.TYPE_ACTIVITY_UPDATE_EXERCISE,
+                        const.TYPE_ACTIVITY_UPDATE_PROBLEM
+                    ):
+            entry.summary = post.summary or ''
+        elif activity_type == const.TYPE_ACTIVITY_PROBLEM:
+            entry.summary = exercise.summary or ''
+        elif activity_type == const.TYPE_ACTIVITY_PRIZE:
+            if post.is_exercise():
+                entry.summary = post.summary or ''
+            else:
+                entry.summary = post.text or ''
+        return entry
+
+    def create_for_activity(self, activity):
+        entry = self.build_for_activity(activity)
+        if entry is not None:
+            entry.save()
+        return entry
+
+    def get_for_user(self, user):
+        """entries of the user, the latest first, without the
+        ones about the deleted posts - read with one query"""
+        return self.filter(
+                    user = user
+                ).filter(
+                    models.Q(exercise__isnull = True) \
+                    | models.Q(exercise__deleted = False)
+                ).filter(
+                    models.Q(problem__isnull = True) \
+                    | models.Q(problem__deleted = False)
+                ).select_related(
+                    'badge'
+                ).order_by('-active_at')
+
+    def update_title(self, exercise, title):
+        """called when the title of the exercise is edited"""
+        self.filter(exercise = exercise).update(title = title)
+
+
+class UserTimelineEntry(models.Model):
+    """denormalized record of the activity shown on the
+    "recent" tab of the user profile, so that the tab
+    does not load the posts of each activity
+
+    Entries are created along with the activities,
+    for the old activities they are built with::
+
+        python manage.py rebuild_user_timeline
+    """
+    user = models.ForeignKey(User, related_name = 'timeline_entries')
+    activity = models.ForeignKey(Activity, related_name = 'timeline_entries')
+    activity_type = models.SmallIntegerField(choices = const.TYPE_ACTIVITY)
+    #indexed together with the user in the migration
+    active_at = models.DateTimeField()
+    title = models.CharField(max_length = 300, default = '')
+    summary = models.TextField(default = '')
+    exercise = models.ForeignKey('Post', null = True, related_name = '+')
+    problem = models.ForeignKey('Post', null = True, related_name = '+')
+    badge = models.ForeignKey('BadgeData', null = True, related_name = '+')
+
+    objects = UserTimelineEntryManager()
+
+    class Meta:
+        app_label = 'askbot'
+
+    def is_badge(self):
+        return self.activity_type == const.TYPE_ACTIVITY_PRIZE
+
+    def get_absolute_url(self):
+        url = reverse('exercise', kwargs = {'id': self.exercise_id})
+        url += slugify(self.title)
+        if self.problem_id:
+            url += '#%d' % self.problem_id
+        return url
+
 class EmailFeedSettingManager(models.Manager):
     def filter_subscribers(
                         self,
@@ -0,0 +1,213 @@
+"""Built-in full text search, for the databases without one.
+
+Text of the threads and of the user profiles is split into terms.
+The index keeps a document per thread or user, with its length
+in terms, and postings - numbers of occurrences of the terms
+in the documents. All terms of the query must be in the
+document, matching documents are ranked with the BM25 formula.
+
+The search is enabled with ``ENABLE_BUILTIN_SEARCH = True``
+in the ``settings.py``, the index is updated when posts and
+users change, and for the existing content it is built with::
+
+    python manage.py rebuild_search_index
+"""
+import math
+import re
+from django.conf import settings as django_settings
+from django.db import models
+from askbot.utils.db import bulk_create, filter_in_chunks
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = 64
+
+#parameters of the BM25 ranking
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def is_enabled():
+    return getattr(django_settings, 'ENABLE_BUILTIN_SEARCH', False)
+
+def get_terms(text):
+    """returns list of the terms in the text"""
+    return [
+        term[:MAX_TERM_LENGTH]
+        for term in TERM_RE.findall(text.lower())
+    ]
+
+
+class SearchDocument(models.Model):
+    """indexed thread or user"""
+    THREAD = 't'
+    USER = 'u'
+    KIND_CHOICES = (
+        (THREAD, 'thread'),
+        (USER, 'user'),
+    )
+    kind = models.CharField(max_length = 1, choices = KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    length = models.PositiveIntegerField(default = 0)
+
+    class Meta:
+        app_label = 'askbot'
+        unique_together = ('kind', 'object_id')
+
+
+class SearchPosting(models.Model):
+    """number of occurrences of the term in the document"""
+    document = models.ForeignKey(SearchDocument, related_name = 'postings')
+    term = models.CharField(max_length = MAX_TERM_LENGTH, db_index = True)
+    frequency = models.PositiveIntegerField()
+
+    class Meta:
+        app_label = 'askbot'
+        unique_together = ('document', 'term')
+
+
+def index_document(kind, object_id, text):
+    """updates the index with the new text of the document,
+    only postings of the terms with changed numbers
+    of occurrences are replaced
+    """
+    terms = get_terms(text)
+    frequencies = dict()
+    for term in terms:
+        frequencies[term] = frequencies.get(term, 0) + 1
+
+    document, created = SearchDocument.objects.get_or_create(
+                                    kind = kind, object_id = object_id
+                                )
+    if document.length != len(terms):
+        document.length = len(terms)
+        document.save()
+
+    old_frequencies = dict()
+    if not created:
+        old_frequencies = dict(
+            document.postings.values_list('term', 'frequency')
+        )
+
+    stale_terms = [
+        term for term, frequency in old_frequencies.items()
+        if frequencies.get(term) != frequency
+    ]
+    for postings in filter_in_chunks(document.postings.all(), 'term', stale_terms):
+        postings.delete()
+
+    bulk_create([
+        SearchPosting(document = document, term = term, frequency = frequency)
+        for term, frequency in frequencies.items()
+        if old_frequencies.get(term) != frequency
+    ])
+
+def remove_document(kind, object_id):
+    SearchPosting.objects.filter(
+        document__kind = kind, document__object_id = object_id
+    ).delete()
+    SearchDocument.objects.filter(kind = kind, object_id = object_id).delete()
+
+def get_thread_text(thread):
+    """title, tags and text of the posts of the thread"""
+    from askbot.models import Post
+    texts = [thread.title, thread.tagnames]
+    texts.extend(
+        Post.objects.filter(
+            thread = thread, deleted = False
+        ).values_list('text', flat = True)
+    )
+    return u' '.join([text for text in texts if text])
+
+def index_thread(thread):
+    index_document(SearchDocument.THREAD, thread.id, get_thread_text(thread))
+
+def index_user(user):
+    text = u' '.join([user.username, user.about or ''])
+    index_document(SearchDocument.USER, user.id, text)
+
+def get_term_weights(kind, terms):
+    """returns dictionary of the BM25 inverse document
+    frequencies of the terms and the average document length,
+    or ``(None, None)`` if some term is not in the index
+    """
+    postings = SearchPosting.objects.filter(
+                                    document__kind = kind,
+                                    term__in = terms
+                                )
+    document_frequencies = dict([
+        (item['term'], item['count'])
+        for item in postings.values('term').annotate(count = models.Count('id'))
+    ])
+    if len(document_frequencies) < len(terms):
+        return None, None
+
+    stats = SearchDocument.objects.filter(kind = kind).aggregate(
+                                        count = models.Count('id'),
+                                        average_length = models.Avg('length')
+                                    )
+    document_count = stats['count']
+    weights = dict()
+    for term, df in document_frequencies.items():
+        weights[term] = math.log(1 + (document_count - df + 0.5) / (df + 0.5))
+    return weights, stats['average_length'] or 1
+
+def run_full_text_search(query_set, kind, query_text):
+    """filters the query set by the search in the index,
+    like the postgresql search, adds the ``relevance``
+    column to the selected values
+
+    Matching and ranking run in subqueries, so the other
+    filters of the query set apply to all matching documents
+    and the size of the sql depends only on the number of terms.
+    """
+    terms = list(set(get_terms(query_text)))
+    weights = None
+    if terms:
+        weights, average_length = get_term_weights(kind, terms)
+    if weights is None:
+        return query_set.extra(select = {'relevance': '0'}, where = ['1 = 0'])
+
+    table_name = query_set.model._meta.db_table
+    tables = {
+        'document': SearchDocument._meta.db_table,
+        'posting': SearchPosting._meta.db_table,
+        'object_id': '%s.id' % table_name,
+        'terms': ', '.join(['%s'] * len(terms)),
+    }
+    #documents having the postings of all terms
+    where = \
+        '%(object_id)s IN (' \
+            'SELECT d.object_id FROM %(document)s d ' \
+            'INNER JOIN %(posting)s p ON p.document_id = d.id ' \
+            'WHERE d.kind = %%s AND p.term IN (%(terms)s) ' \
+            'GROUP BY d.object_id HAVING COUNT(*) = %(count)d' \
+        ')' % dict(tables, count = len(terms))
+
+    #the weights and the lengths are numbers,
+    #so they are put into the query as they are
+    weight = 'CASE p.term %s ELSE 0 END' % ' '.join(
+                            ['WHEN %s THEN %r' % ('%s', weights[term]) for term in terms]
+                        )
+    norm = '(%r + %r * d.length / %r)' % (
+                                    1 - BM25_B, BM25_B, float(average_length)
+                                )
+    relevance = \
+        '(SELECT SUM(' \
+                '%(weight)s * p.frequency * %(k1_plus_1)r ' \
+                '/ (p.frequency + %(k1)r * %(norm)s)' \
+            ') FROM %(document)s d ' \
+            'INNER JOIN %(posting)s p ON p.document_id = d.id ' \
+            'WHERE d.kind = %%s AND d.object_id = %(object_id)s ' \
+            'AND p.term IN (%(terms)s)' \
+        ')' % dict(
+                tables,
+                weight = weight,
+                norm = norm,
+                k1 = BM25_K1,
+                k1_plus_1 = BM25_K1 + 1
+            )
+    return query_set.extra(
+                select = {'relevance': relevance},
+                select_params = terms + [kind] + terms,
+                where = [where],
+                params = [kind] + terms
+            )
@@ -87,7 +87,9 @@ class SearchState(object):
     def get_empty(cls):
         return cls(scope=None, sort=None, query=None, tags=None, author=None, page=None, user_logged_in=None)
 
-    def __init__(self, scope, sort, query, tags, author, page, user_logged_in):
+    def __init__(
+        self, scope, sort, query, tags, author, page, user_logged_in, after = None
+    ):
         # INFO: zip(*[('a', 1), ('b', 2)])[0] == ('a', 'b')
 
         if (scope not in zip(*const.POST_SCOPE_LIST)[0]) or (scope == 'favorite' and not user_logged_in):
@@ -133,7 +135,12 @@ class SearchState(object):
         if self.page == 0:  # in case someone likes jokes :)
             self.page = 1
 
+        #keyset pagination cursor - position of the last thread
+        #of the previous page, meaningless on the first page
+        self.after = after if self.page > 1 else None
+
         self._exercises_url = urlresolvers.reverse('exercises')
+        self._tag_urls = dict()
 
     def __str__(self):
         return self.query_string()
@@ -182,6 +189,8 @@ class SearchState(object):
             lst.append('author:' + str(self.author))
         if self.page:
             lst.append('page:' + str(self.page))
+        if self.after:
+            lst.append('after:' + self.after)
         return '/'.join(lst) + '/'
 
     def deepcopy(self): # TODO: test me
@@ -205,6 +214,9 @@ class SearchState(object):
 
         #ss._exercises_url = self._exercises_url
 
+        ss._tag_urls = dict()#urls of the copy will be different
+        ss.after = None#cursor is valid only for the same search
+
         return ss
 
     def add_tag(self, tag):
@@ -214,6 +226,16 @@ class SearchState(object):
             ss.page = 1 # state change causes page reset
         return ss
 
+    def get_tag_url(self, tag):
+        """returns url of the search with the tag added,
+        the urls are memoized, because the same tags
+        repeat many times on one page"""
+        url = self._tag_urls.get(tag)
+        if url is None:
+            url = self.add_tag(tag).full_url()
+            self._tag_urls[tag] = url
+        return url
+
     def remove_author(self):
         ss = self.deepcopy()
         ss.author = None
@@ -248,6 +270,14 @@ class SearchState(object):
         ss.page = new_page
         return ss
 
+    def continue_after(self, cursor):
+        """returns state of the next page,
+        which starts after the position given by the ``cursor``"""
+        ss = self.deepcopy()
+        ss.page = self.page + 1
+        ss.after = cursor
+        return ss
+
 
 class DummySearchState(object): # Used for caching exercise/thread summaries
 
@@ -260,3 +290,6 @@ class DummySearchState(object): # Used for caching exercise/thread summaries
 
     def full_url(self):
         return '<<<%s>>>' % self.tag
+
+    def get_tag_url(self, tag):
+        return '<<<%s>>>' % tag
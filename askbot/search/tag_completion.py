@@ -0,0 +1,118 @@
+"""Completion of the tag names for the autocomplete inputs.
+
+Names of the accepted tags are kept in memory of the process,
+in an array sorted by the lower case name, so that all tags starting
+with a prefix are found with a binary search. The completions are
+the most used of those tags, the results for the recent prefixes
+are remembered.
+
+The array is rebuilt from the database when the tags are created,
+renamed or deleted - in any process, since the version of the
+tag list is stored in the cache - and otherwise every
+``REBUILD_INTERVAL`` seconds, to pick up the new use counts.
+"""
+import bisect
+import heapq
+import threading
+import time
+from askbot.utils.cache import get_cache_version, bump_cache_version
+
+TAG_COMPLETION_VERSION_KEY = 'tag-completion-version'
+REBUILD_INTERVAL = 60*10
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+#number of the remembered completions
+MAX_REMEMBERED_COMPLETIONS = 5000
+
+
+class TagCompletionIndex(object):
+    """sorted array of the tag names"""
+
+    def __init__(self, tags):
+        """``tags`` - iterable of tuples (name, use count)"""
+        entries = sorted([
+            (name.lower(), name, used_count) for name, used_count in tags
+        ])
+        self.keys = [entry[0] for entry in entries]
+        self.names = [entry[1] for entry in entries]
+        self.used_counts = [entry[2] for entry in entries]
+        self.completions = dict()
+
+    def get_range(self, prefix):
+        """returns start and end of the range of the
+        names starting with the prefix"""
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + u'\uffff', start)
+        return start, end
+
+    def complete(self, prefix, limit = DEFAULT_LIMIT):
+        """returns names of up to ``limit`` most used tags
+        starting with the ``prefix``, the prefix may end with
+        an asterisk, like the wildcard tags
+        """
+        if prefix.endswith('*'):
+            prefix = prefix[:-1]
+        key = (prefix.lower(), limit)
+        completions = self.completions.get(key)
+        if completions is None:
+            start, end = self.get_range(prefix)
+            best = heapq.nsmallest(
+                        limit,
+                        xrange(start, end),
+                        key = lambda idx: (-self.used_counts[idx], self.keys[idx])
+                    )
+            completions = [self.names[idx] for idx in best]
+            if len(self.completions) >= MAX_REMEMBERED_COMPLETIONS:
+                self.completions = dict()
+            self.completions[key] = completions
+        return completions
+
+    def get_names(self):
+        """all names, by the use counts"""
+        return self.complete('', len(self.names))
+
+
+_index = None
+_index_version = None
+_index_built_at = 0
+_lock = threading.Lock()
+
+def load_tags():
+    from askbot.models import Tag
+    return Tag.objects.filter(
+                        deleted = False,
+                        status = Tag.STATUS_ACCEPTED
+                    ).values_list('name', 'used_count')
+
+def get_index():
+    """returns the index, rebuilt if the tags have changed"""
+    global _index, _index_version, _index_built_at
+    version = get_cache_version(TAG_COMPLETION_VERSION_KEY)
+    if _index is None or _index_version != version \
+        or time.time() - _index_built_at > REBUILD_INTERVAL:
+        _lock.acquire()
+        try:
+            if _index is None or _index_version != version \
+                or time.time() - _index_built_at > REBUILD_INTERVAL:
+                _index = TagCompletionIndex(load_tags())
+                _index_version = version
+                _index_built_at = time.time()
+        finally:
+            _lock.release()
+    return _index
+
+def complete(prefix, limit = DEFAULT_LIMIT):
+    return get_index().complete(prefix, min(limit, MAX_LIMIT))
+
+def get_tag_state(tag):
+    """the tag properties seen in the completions"""
+    from askbot.models import Tag
+    is_listed = tag.status == Tag.STATUS_ACCEPTED and not tag.deleted
+    return (tag.name, is_listed)
+
+def expire_index():
+    """the indices in all processes are rebuilt on the next use"""
+    global _index
+    _index = None
+    bump_cache_version(TAG_COMPLETION_VERSION_KEY)
@@ -247,6 +247,10 @@ HAYSTACK_SITECONF = 'askbot.search.haystack'
 #http://django-haystack.readthedocs.org/en/v1.2.7/settings.html
 HAYSTACK_SEARCH_ENGINE = 'simple'
 
+#built-in full text search, for the databases other than postgresql,
+#build the index with: python manage.py rebuild_search_index
+ENABLE_BUILTIN_SEARCH = False
+
 TINYMCE_COMPRESSOR = True
 TINYMCE_SPELLCHECKER = False
 TINYMCE_JS_ROOT = os.path.join(STATIC_ROOT, 'default/media/js/tinymce/')
@@ -1,14 +1,16 @@
 from django.contrib.sitemaps import Sitemap
-from askbot.models import Post
+from askbot.models import Thread
 
 class ExercisesSitemap(Sitemap):
     changefreq = 'daily'
     priority = 0.5
     def items(self):
-        return Post.objects.get_exercises().exclude(deleted=True)
+        return Thread.objects.filter(
+                    deleted=False, exercise_post__isnull=False
+                ).select_related('exercise_post')
 
     def lastmod(self, obj):
-        return obj.thread.last_activity_at
+        return obj.last_activity_at
 
     def location(self, obj):
-        return obj.get_absolute_url()
+        return obj.exercise_post.get_absolute_url(thread=obj)
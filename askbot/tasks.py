@@ -17,6 +17,7 @@ That is the reason for having two types of methods here:
 * celery tasks - shells that reconstitute the necessary ORM
   objects and call the base methods
 """
+import datetime
 import sys
 import traceback
 import logging
@@ -30,7 +31,8 @@ from askbot.conf import settings as askbot_settings
 from askbot import const
 from askbot import mail
 from askbot.models import Post, Thread, User, ReplyAddress
-from askbot.models.badges import award_badges_signal
+from askbot.models.exercise import thread_view_count_buffer
+from askbot.models.badges import evaluate_badge_events
 from askbot.models import get_reply_to_addresses, format_instant_notification_email
 from askbot import exceptions as askbot_exceptions
 
@@ -135,6 +137,61 @@ def record_post_update_celery_task(
         print >>sys.stderr, traceback.format_exc()
         raise
 
+@task(ignore_result = True)
+def evaluate_badge_events_celery_task(events):
+    """evaluates the badges for the queued events,
+    ``events`` is a list of tuples
+    (event, actor id, content type id, object id, timestamp)
+    """
+    actors = User.objects.in_bulk(set([event[1] for event in events]))
+
+    object_ids = dict()
+    for event in events:
+        object_ids.setdefault(event[2], set()).add(event[3])
+    context_objects = dict()
+    for content_type_id, ids in object_ids.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        for object_id, obj in model._default_manager.in_bulk(ids).items():
+            context_objects[(content_type_id, object_id)] = obj
+
+    resolved_events = list()
+    for event, actor_id, content_type_id, object_id, timestamp in events:
+        actor = actors.get(actor_id)
+        context_object = context_objects.get((content_type_id, object_id))
+        if actor is None or context_object is None:
+            continue#deleted since the event
+        resolved_events.append((event, actor, context_object, timestamp))
+
+    evaluate_badge_events(resolved_events)
+
+@task(ignore_result = True)
+def export_exercises_celery_task(
+        job_id,
+        type,
+        exercise_ids,
+        user_id,
+        with_solutions = False,
+        base_url = None
+    ):
+    """renders the export of the exercises into the file of the job,
+    the exercises appear in the order of ``exercise_ids``
+    """
+    #reporter needs the pdf and rtf libraries, which
+    #are not loaded with the tasks
+    from askbot.views import reporter
+    user = User.objects.get(id = user_id)
+    posts = Post.objects.filter(
+                        id__in = exercise_ids
+                    ).select_related('thread')
+    post_map = dict([(post.id, post) for post in posts])
+    posts = [post_map[post_id] for post_id in exercise_ids if post_id in post_map]
+    try:
+        reporter.export(job_id, type, posts, user, with_solutions, base_url)
+    except Exception:
+        reporter.set_export_job_status(job_id, 'failed')
+        print >>sys.stderr, traceback.format_exc()
+        raise
+
 @task(ignore_result = True)
 def record_exercise_visit(
     exercise_post = None,
@@ -150,7 +207,13 @@ def record_exercise_visit(
     #    id = exercise_post_id
     #).select_related('thread')[0]
     if update_view_count:
-        exercise_post.thread.increase_view_count()
+        #the views are added to the database in bulk by the buffer,
+        #the count on the thread object, with the views still
+        #in the buffer, is for the badges below
+        thread = exercise_post.thread
+        buffered_count = thread_view_count_buffer.get(thread.id, 0)
+        thread_view_count_buffer.add(thread.id, 1)
+        thread.view_count += buffered_count + 1
 
     if user.is_anonymous():
         return
@@ -161,10 +224,9 @@ def record_exercise_visit(
         #get response notifications
         user.visit_exercise(exercise_post)
 
-    #3) send award badges signal for any badges
-    #that are awarded for exercise views
-    award_badges_signal.send(None,
-                    event = 'view_exercise',
-                    actor = user,
-                    context_object = exercise_post,
-                )
+    #3) consider the badges awarded for the exercise views here,
+    #a queued event would be evaluated with the view count
+    #read from the database, without the buffered views
+    evaluate_badge_events([
+        ('view_exercise', user, exercise_post, datetime.datetime.now())
+    ])
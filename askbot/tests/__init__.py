@@ -15,6 +15,7 @@ from askbot.tests.post_model_tests import *
 from askbot.tests.thread_model_tests import *
 from askbot.tests.reply_by_email_tests import *
 from askbot.tests.haystack_search_tests import *
+from askbot.tests.builtin_search_tests import *
 from askbot.tests.email_parsing_tests import *
 from askbot.tests.widget_tests import *
 from askbot.tests.category_tree_tests import CategoryTreeTests
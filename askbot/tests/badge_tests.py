@@ -4,6 +4,7 @@ from django.test.client import Client
 from askbot.tests.utils import AskbotTestCase
 from askbot.conf import settings
 from askbot import models
+from askbot.models import badges
 from askbot.models.badges import award_badges_signal
 
 class BadgeTests(AskbotTestCase):
@@ -190,6 +191,24 @@ class BadgeTests(AskbotTestCase):
         self.client.get(exercise2.get_absolute_url())
         self.assert_have_badge('popular-exercise', recipient = self.u1, expected_count = 2)
 
+    def test_popular_exercise_badge_counts_buffered_views(self):
+        from askbot import tasks
+        from askbot.models.exercise import thread_view_count_buffer
+        exercise = self.post_exercise(user = self.u1)
+        min_views = settings.POPULAR_EXERCISE_BADGE_MIN_VIEWS
+        exercise.thread.view_count = min_views - 2
+        exercise.thread.save()
+        #a view from another request, not written yet
+        thread_view_count_buffer.add(exercise.thread_id, 1)
+
+        exercise = models.Post.objects.get(id = exercise.id)
+        tasks.record_exercise_visit(
+                        exercise_post = exercise,
+                        user = self.u2,
+                        update_view_count = True
+                    )
+        self.assert_have_badge('popular-exercise', recipient = self.u1)
+
     def test_student_badge(self):
         exercise = self.post_exercise(user = self.u1)
         self.u2.upvote(exercise)
@@ -505,3 +524,44 @@ class BadgeTests(AskbotTestCase):
         self.client.get('/' + django_settings.ASKBOT_URL)
         self.assert_have_badge('enthusiast', self.u1, 1)
 
+
+
+class BadgeEventQueueTests(AskbotTestCase):
+
+    def setUp(self):
+        self.u1 = self.create_user(username = 'user1')
+
+    def test_repeated_events_are_evaluated_once(self):
+        exercise = self.post_exercise(user = self.u1)
+        exercise.points = settings.DISCIPLINED_BADGE_MIN_UPVOTES
+        exercise.save()
+
+        django_settings.CELERY_ALWAYS_EAGER = False
+        try:
+            for idx in range(2):
+                award_badges_signal.send(None,
+                    event = 'delete_post',
+                    actor = self.u1,
+                    context_object = exercise
+                )
+        finally:
+            django_settings.CELERY_ALWAYS_EAGER = True
+
+        self.assertEqual(len(badges.badge_event_queue.values), 1)
+        self.assertEqual(models.Award.objects.filter(user = self.u1).count(), 0)
+
+        badges.badge_event_queue.flush()
+        awards = models.Award.objects.filter(
+                                    user = self.u1,
+                                    badge__slug = 'disciplined'
+                                )
+        self.assertEqual(awards.count(), 1)
+        self.assertEqual(
+            models.BadgeData.objects.get(slug = 'disciplined').awarded_count,
+            1
+        )
+
+    def test_badge_data_is_loaded_once(self):
+        badge_data = badges.get_badge('disciplined').get_stored_data()
+        self.assertNumQueries(0, badges.get_badge_data, 'disciplined')
+        self.assertTrue(badges.get_badge_data('disciplined') is badge_data)
@@ -0,0 +1,153 @@
+"""Tests of the built-in full text search"""
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+from askbot.tests.utils import AskbotTestCase, with_settings
+from askbot.search import inverted_index
+from askbot.search.state_manager import SearchState
+from askbot import models
+
+class BuiltinSearchTests(AskbotTestCase):
+
+    def setUp(self):
+        self._old_value = getattr(settings, 'ENABLE_BUILTIN_SEARCH', False)
+        setattr(settings, 'ENABLE_BUILTIN_SEARCH', True)
+        self.user = self.create_user(username = 'gepeto')
+        self.other_user = self.create_user(username = 'pinocho')
+        self.other_user.about = "I'm made of wood, gepeto made me"
+        self.other_user.save()
+
+    def tearDown(self):
+        setattr(settings, 'ENABLE_BUILTIN_SEARCH', self._old_value)
+
+    def search_threads(self, query):
+        threads = models.Thread.objects.get_for_query(query)
+        return list(threads.extra(order_by = ['-relevance']))
+
+    def test_get_terms(self):
+        self.assertEqual(
+            inverted_index.get_terms(u'Baldy of Nome, baldy!'),
+            [u'baldy', u'of', u'nome', u'baldy']
+        )
+
+    def test_all_terms_must_match(self):
+        exercise1 = self.post_exercise(
+                            user = self.user,
+                            title = 'Snowy trail',
+                            body_text = 'the boy trudged along the trail'
+                        )
+        exercise2 = self.post_exercise(
+                            user = self.user,
+                            title = 'Golconda camp',
+                            body_text = 'the house of judgment'
+                        )
+        self.assertEqual(self.search_threads('TRAIL'), [exercise1.thread])
+        self.assertEqual(self.search_threads('trail judgment'), [])
+        self.assertEqual(self.search_threads('camp judgment'), [exercise2.thread])
+        self.assertEqual(self.search_threads('lorem'), [])
+
+    def test_ranking(self):
+        exercise1 = self.post_exercise(
+                            user = self.user,
+                            title = 'about dogs',
+                            body_text = 'dogs and cats, but mostly cats'
+                        )
+        exercise2 = self.post_exercise(
+                            user = self.user,
+                            title = 'about cats',
+                            body_text = 'cats and more cats'
+                        )
+        self.post_exercise(
+                            user = self.user,
+                            title = 'about birds',
+                            body_text = 'birds only'
+                        )
+        threads = self.search_threads('cats')
+        self.assertEqual(threads, [exercise2.thread, exercise1.thread])
+        self.assertTrue(threads[0].relevance > threads[1].relevance)
+
+        search_state = SearchState(
+                            scope = None, sort = 'relevance-desc',
+                            query = 'cats', tags = None, author = None,
+                            page = None, user_logged_in = False
+                        )
+        threads, meta_data = models.Thread.objects.run_advanced_search(
+                                            request_user = self.user,
+                                            search_state = search_state
+                                        )
+        self.assertEqual(
+            [thread.id for thread in threads],
+            [exercise2.thread.id, exercise1.thread.id]
+        )
+
+    def test_search_is_combined_with_other_filters(self):
+        for idx in range(3):
+            self.post_exercise(
+                        user = self.user,
+                        title = 'about cats %d' % idx,
+                        body_text = 'cats ' * (idx + 1)
+                    )
+        #the least relevant match is found by its author
+        exercise = self.post_exercise(
+                        user = self.other_user,
+                        title = 'about cats and dogs',
+                        body_text = 'dogs and dogs and one more dog'
+                    )
+        search_state = SearchState(
+                            scope = None, sort = 'relevance-desc',
+                            query = 'cats', tags = None,
+                            author = str(self.other_user.id),
+                            page = None, user_logged_in = False
+                        )
+        threads, meta_data = models.Thread.objects.run_advanced_search(
+                                            request_user = self.user,
+                                            search_state = search_state
+                                        )
+        self.assertEqual(threads.count(), 1)
+        self.assertEqual(threads[0].id, exercise.thread.id)
+        self.assertTrue(threads[0].relevance > 0)
+
+    def test_index_follows_the_posts(self):
+        exercise = self.post_exercise(user = self.user, title = 'first title')
+        problem = self.post_problem(
+                            user = self.user,
+                            exercise = exercise,
+                            body_text = 'a problem about tincidunt'
+                        )
+        self.assertEqual(self.search_threads('tincidunt'), [exercise.thread])
+
+        self.user.edit_problem(problem = problem, body_text = 'egestas instead')
+        self.assertEqual(self.search_threads('tincidunt'), [])
+        self.assertEqual(self.search_threads('egestas'), [exercise.thread])
+
+        self.user.delete_problem(problem)
+        self.assertEqual(self.search_threads('egestas'), [])
+
+        thread_id = exercise.thread.id
+        exercise.thread.delete()
+        self.assertEqual(
+            models.SearchDocument.objects.filter(
+                kind = models.SearchDocument.THREAD, object_id = thread_id
+            ).count(),
+            0
+        )
+
+    def test_user_search(self):
+        users = models.get_users_by_text_query('gepeto')
+        self.assertEqual(
+            set(users),
+            set([self.user, self.other_user])
+        )
+        users = models.get_users_by_text_query('wood')
+        self.assertEqual(list(users), [self.other_user])
+
+    @with_settings(GROUPS_ENABLED = False)
+    def test_api_get_exercises(self):
+        exercise = self.post_exercise(user = self.user, title = 'alibaba')
+        response = self.client.get(
+                            reverse('api_get_exercises'),
+                            {'query': 'Alibaba'}
+                        )
+        data = simplejson.loads(response.content)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['url'], exercise.thread.get_absolute_url())
@@ -3,7 +3,9 @@ functions that happen on behalf of users
 
 e.g. ``some_user.do_something(...)``
 """
+from django.core import cache
 from django.core import exceptions
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.urlresolvers import reverse
 from django.test.client import Client
 from django.conf import settings
@@ -15,7 +17,9 @@ from askbot.tests.utils import with_settings
 from askbot import models
 from askbot import const
 from askbot.conf import settings as askbot_settings
+from askbot.models import repute
 from askbot.models.tag import get_global_group
+from askbot.search import tag_completion
 import datetime
 
 class DBApiTests(AskbotTestCase):
@@ -409,6 +413,186 @@ class GlobalTagSubscriberGetterTests(AskbotTestCase):
             reason = 'bad'
         )
 
+    def test_deleted_tag_is_removed_from_index(self):
+        self.u1.mark_tags(tagnames = ('day',), reason = 'good', action = 'add')
+        models.Tag.objects.filter(name = 'day').delete()
+        index = models.TagSubscriberIndex.objects
+        self.assertEqual(index.filter(name = 'day').count(), 0)
+
+    def test_renamed_tag_keeps_its_selections(self):
+        self.u1.mark_tags(tagnames = ('day',), reason = 'good', action = 'add')
+        tag = models.Tag.objects.get(name = 'day')
+        tag.name = 'night'
+        tag.save()
+        index = models.TagSubscriberIndex.objects
+        subscriber_ids = index.get_subscriber_ids(
+                                    tag_names = ['night'], reason = 'good'
+                                )
+        self.assertEqual(list(subscriber_ids), [self.u1.id])
+        self.assertEqual(index.filter(name = 'day').count(), 0)
+
+class TagCompletionTests(AskbotTestCase):
+
+    def test_completions_are_most_used_tags_with_prefix(self):
+        index = tag_completion.TagCompletionIndex([
+            ('python', 5), ('Pylons', 9), ('perl', 3), ('ruby', 1)
+        ])
+        self.assertEqual(index.complete('py'), ['Pylons', 'python'])
+        self.assertEqual(index.complete('PY*', 1), ['Pylons'])
+        self.assertEqual(index.complete('p', 2), ['Pylons', 'python'])
+        self.assertEqual(index.complete('x'), [])
+
+    def get_completions(self, prefix):
+        response = self.client.get(reverse('get_tag_list'), {'q': prefix})
+        return sorted(response.content.split())
+
+    def test_completions_follow_tag_changes(self):
+        user = self.create_user()
+        exercise = self.post_exercise(user = user, tags = 'apple apricot banana')
+        self.assertEqual(self.get_completions('ap'), ['apple', 'apricot'])
+
+        user.retag_exercise(exercise = exercise, tags = 'apple banana apex')
+        self.assertEqual(self.get_completions('ap'), ['apex', 'apple'])
+        models.Tag.objects.filter(name = 'apple').delete()
+        self.assertEqual(self.get_completions('ap'), ['apex'])
+        self.assertEqual(self.get_completions('b*'), ['banana'])
+
+
+class UserTagFilterTests(AskbotTestCase):
+
+    def setUp(self):
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('', {})
+        cache.cache.clear()#the local memory caches share the storage
+        self.user = self.create_user()
+        self.post_exercise(user = self.user, tags = 'day night')
+
+    def tearDown(self):
+        cache.cache = self.old_cache
+
+    def test_tag_filter_is_cached_until_selections_change(self):
+        tag_filter = self.user.get_tag_filter()
+        self.assertEqual(tag_filter.get_tag_ids('good'), frozenset())
+        self.assertNumQueries(0, self.user.get_tag_filter)
+
+        self.user.mark_tags(tagnames = ('day',), reason = 'good', action = 'add')
+        tag_filter = self.user.get_tag_filter()
+        day = models.Tag.objects.get(name = 'day')
+        self.assertEqual(tag_filter.get_tag_ids('good'), frozenset([day.id]))
+        self.assertEqual(tag_filter.get_tag_names('good'), ('day',))
+
+        self.user.mark_tags(wildcards = ('ni*',), reason = 'bad', action = 'add')
+        tag_filter = self.user.get_tag_filter()
+        self.assertEqual(tag_filter.get_wildcards('bad'), ('ni*',))
+        self.assertEqual(tag_filter.get_tag_ids('good'), frozenset([day.id]))
+
+    def test_tag_filters_of_many_users_are_loaded_at_once(self):
+        other_user = self.create_user(username = 'other')
+        self.user.mark_tags(tagnames = ('day',), reason = 'good', action = 'add')
+        other_user.mark_tags(tagnames = ('night',), reason = 'bad', action = 'add')
+        users = [self.user, other_user]
+
+        self.assertNumQueries(1, models.get_user_tag_filters, users)
+        self.assertNumQueries(0, models.get_user_tag_filters, users)
+        tag_filters = models.get_user_tag_filters(users)
+        day = models.Tag.objects.get(name = 'day')
+        night = models.Tag.objects.get(name = 'night')
+        self.assertEqual(
+            tag_filters[self.user.id].get_tag_ids('good'), frozenset([day.id])
+        )
+        self.assertEqual(
+            tag_filters[other_user.id].get_tag_ids('bad'), frozenset([night.id])
+        )
+        self.assertEqual(tag_filters[other_user.id].get_tag_ids('good'), frozenset())
+
+    @with_settings(USE_WILDCARD_TAGS = True)
+    def test_exercise_list_excludes_ignored_tags(self):
+        from askbot.search.state_manager import SearchState
+        other = self.post_exercise(user = self.user, tags = 'sun')
+        self.user.display_tag_filter_strategy = const.EXCLUDE_IGNORED
+        self.user.save()
+        self.user.mark_tags(wildcards = ('ni*',), reason = 'bad', action = 'add')
+        threads, meta_data = models.Thread.objects.run_advanced_search(
+                                    request_user = self.user,
+                                    search_state = SearchState.get_empty()
+                                )
+        self.assertEqual([thread.id for thread in threads], [other.thread_id])
+        self.assertEqual(meta_data['ignored_tag_names'], ['ni*'])
+
+
+class UserTimelineTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.other_user = self.create_user('other_user')
+
+    def get_timeline(self):
+        return list(models.UserTimelineEntry.objects.get_for_user(self.user))
+
+    def test_entries_are_recorded_with_activities(self):
+        exercise = self.post_exercise(user = self.user, title = 'first title')
+        problem = self.post_problem(user = self.user, exercise = exercise)
+        self.post_comment(user = self.user, parent_post = problem)
+        self.post_problem(user = self.other_user, exercise = exercise)
+
+        timeline = self.get_timeline()
+        self.assertEqual(
+            set([entry.activity_type for entry in timeline]),
+            set([
+                const.TYPE_ACTIVITY_ASK_EXERCISE,
+                const.TYPE_ACTIVITY_PROBLEM,
+                const.TYPE_ACTIVITY_COMMENT_PROBLEM
+            ])
+        )
+        for entry in timeline:
+            self.assertEqual(entry.title, 'first title')
+            self.assertEqual(entry.exercise_id, exercise.id)
+
+        self.edit_exercise(user = self.user, exercise = exercise, title = 'new title')
+        self.assertEqual(
+            set([entry.title for entry in self.get_timeline()]),
+            set(['new title'])
+        )
+
+    def test_deleted_posts_are_hidden(self):
+        exercise = self.post_exercise(user = self.user)
+        problem = self.post_problem(user = self.user, exercise = exercise)
+        self.user.delete_problem(problem)
+        self.assertEqual(
+            [entry.activity_type for entry in self.get_timeline()],
+            [const.TYPE_ACTIVITY_ASK_EXERCISE]
+        )
+        self.user.delete_exercise(exercise)
+        self.assertEqual(self.get_timeline(), [])
+
+    def test_badge_award_is_shown(self):
+        exercise = self.post_exercise(user = self.user)
+        badge = models.BadgeData.objects.all()[0]
+        models.Award(
+            user = self.user, badge = badge, content_object = exercise
+        ).save()
+        entry = self.get_timeline()[0]
+        self.assertTrue(entry.is_badge())
+        self.assertEqual(entry.badge, badge)
+        self.assertEqual(entry.exercise_id, exercise.id)
+
+        response = self.client.get(
+            reverse(
+                'user_profile',
+                kwargs = {'id': self.user.id, 'slug': self.user.username}
+            ),
+            {'sort': 'recent'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, badge.get_absolute_url())
+        self.assertContains(response, entry.get_absolute_url())
+
+    def test_timeline_is_read_with_one_query(self):
+        for idx in range(3):
+            exercise = self.post_exercise(user = self.user)
+            self.post_problem(user = self.user, exercise = exercise)
+        self.assertNumQueries(1, self.get_timeline)
+
 class CommentTests(AskbotTestCase):
     """unfortunately, not very useful tests,
     as assertions of type "user can" are not inside
@@ -441,6 +625,73 @@ class CommentTests(AskbotTestCase):
         comment = models.Post.objects.get_comments().get(id = self.comment.id)
         self.assertEquals(comment.points, 0)
 
+class DailyVoteCounterTests(AskbotTestCase):
+
+    def setUp(self):
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('', {})
+        #locmem caches with the same name share the storage
+        cache.cache.clear()
+        self.author = self.create_user()
+        self.voter = self.create_user(username = 'voter')
+        self.exercise = self.post_exercise(user = self.author)
+        self.today = datetime.date.today()
+
+    def tearDown(self):
+        cache.cache = self.old_cache
+
+    def assert_counters_match_database(self):
+        self.assertEqual(
+            models.Vote.objects.get_votes_count_today_from_user(self.voter),
+            repute.count_votes_in_db(self.voter.id, self.today)
+        )
+        self.assertEqual(
+            models.Repute.objects.get_reputation_by_upvoted_today(self.author),
+            models.Repute.objects.get_reputation_by_upvoted_on(
+                                                self.author.id, self.today
+                                            )
+        )
+
+    def test_counters_follow_votes(self):
+        max_votes = askbot_settings.MAX_VOTES_PER_USER_PER_DAY
+        self.assert_counters_match_database()#puts the counters in the cache
+
+        self.voter.upvote(self.exercise)
+        self.assert_counters_match_database()
+        self.assertEqual(self.voter.get_unused_votes_today(), max_votes - 1)
+        self.assertEqual(
+            models.Repute.objects.get_reputation_by_upvoted_today(self.author),
+            askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE
+        )
+
+        self.voter.upvote(self.exercise, cancel = True)
+        self.assert_counters_match_database()
+        self.assertEqual(self.voter.get_unused_votes_today(), max_votes)
+
+        self.voter.downvote(self.exercise)
+        self.assert_counters_match_database()
+        self.assertEqual(self.voter.get_unused_votes_today(), max_votes - 1)
+
+    def test_counters_are_not_changed_by_failed_transactions(self):
+        count = repute.votes_of_day.get(self.voter.id)
+
+        @repute.update_counters_after_commit
+        def failed_vote():
+            repute.votes_of_day.add(self.voter.id, 1)
+            raise ValueError()
+
+        self.assertRaises(ValueError, failed_vote)
+        self.assertEqual(repute.votes_of_day.get(self.voter.id), count)
+
+        @repute.update_counters_after_commit
+        def vote():
+            repute.votes_of_day.add(self.voter.id, 1)
+            self.assertEqual(repute.votes_of_day.get(self.voter.id), count)
+
+        vote()
+        self.assertEqual(repute.votes_of_day.get(self.voter.id), count + 1)
+
+
 class GroupTests(AskbotTestCase):
     def setUp(self):
         self.u1 = self.create_user('u1')
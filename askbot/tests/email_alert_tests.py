@@ -17,6 +17,7 @@ from askbot import mail
 from askbot.conf import settings as askbot_settings
 from askbot import const
 from askbot.models.exercise import Thread
+from askbot.management.commands import send_email_alerts
 
 TO_JSON = functools.partial(serializers.serialize, 'json')
 
@@ -108,6 +109,23 @@ class SubjectLineTests(TestCase):
         subj = mail.prefix_the_subject_line('hahah')
         self.assertEquals(subj, 'hahah')
 
+class SendMessagesTests(TestCase):
+    def test_failures_do_not_stop_sending(self):
+        class BrokenMessage(django.core.mail.EmailMessage):
+            def send(self, fail_silently = False):
+                raise Exception('recipient refused')
+
+        messages = [
+            django.core.mail.EmailMessage('one', 'body', to = ['one@example.com']),
+            BrokenMessage('two', 'body', to = ['two@example.com']),
+            django.core.mail.EmailMessage('three', 'body', to = ['three@example.com']),
+        ]
+        django.core.mail.outbox = list()
+        failures = mail.send_messages(messages, chunk_size = 2)
+        self.assertEqual([message for message, error in failures], [messages[1]])
+        sent_subjects = [message.subject for message in django.core.mail.outbox]
+        self.assertEqual(sent_subjects, ['one', 'three'])
+
 class EmailAlertTests(TestCase):
     """Base class for testing delayed Email notifications
     that are triggered by the send_email_alerts
@@ -957,6 +975,47 @@ class EmailFeedSettingTests(utils.AskbotTestCase):
         self.assertEquals(data_before, data_after)
 
 
+class BatchedEmailAlertTests(utils.AskbotTestCase):
+    """digests must not depend on how the users
+    are split into batches by the send_email_alerts command"""
+
+    def setUp(self):
+        long_ago = datetime.datetime.now() - datetime.timedelta(30)
+        schedule = copy.deepcopy(models.EmailFeedSetting.NO_EMAIL_SCHEDULE)
+        schedule['q_all'] = 'd'
+        self.create_user('author', date_joined = long_ago)
+        self.readers = list()
+        for number in range(3):
+            reader = self.create_user(
+                            'reader%d' % number,
+                            notification_schedule = schedule,
+                            date_joined = long_ago
+                        )
+            self.readers.append(reader)
+        self.post_exercise(
+            user = self.author,
+            timestamp = datetime.datetime.now() - datetime.timedelta(2)
+        )
+
+    def send_alerts(self, batch_size):
+        django.core.mail.outbox = list()
+        management.call_command('send_email_alerts', batch_size = batch_size)
+        recipients = list()
+        for message in django.core.mail.outbox:
+            recipients.extend(message.recipients())
+        return sorted(recipients)
+
+    def test_small_batches(self):
+        expected = sorted([reader.email for reader in self.readers])
+        self.assertEqual(self.send_alerts(batch_size = 1), expected)
+        activity_count = models.Activity.objects.filter(
+                    activity_type = const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT
+                ).count()
+        self.assertEqual(activity_count, len(self.readers))
+        #the feeds have just been reported
+        self.assertEqual(self.send_alerts(batch_size = 2), [])
+
+
 class EmailAlertTestsWithGroupsEnabled(utils.AskbotTestCase):
 
     def setUp(self):
@@ -1074,3 +1133,85 @@ class MailMessagesTests(utils.AskbotTestCase):
         user = self.create_user('user')
         message = messages.ask_for_signature(user, footer_code = 'nothing')
         self.assertTrue(user.username in message)
+
+class TagFilteredExerciseScanTests(utils.AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user(
+                            username = 'user1',
+                            notification_schedule = {'q_all': 'd'},
+                            date_joined = datetime.datetime.now() - \
+                                            datetime.timedelta(10)
+                        )
+        self.other_user = self.create_user(username = 'user2')
+        self.old_chunk_size = send_email_alerts.EXERCISE_SCAN_CHUNK_SIZE
+        send_email_alerts.EXERCISE_SCAN_CHUNK_SIZE = 1
+
+    def tearDown(self):
+        send_email_alerts.EXERCISE_SCAN_CHUNK_SIZE = self.old_chunk_size
+
+    def test_scan_stops_at_previous_report(self):
+        exercises = list()
+        for idx in range(3):
+            exercises.append(self.post_exercise(user = self.other_user))
+        now = datetime.datetime.now()
+        models.Thread.objects.filter(
+                            id = exercises[0].thread_id
+                        ).update(last_activity_at = now - datetime.timedelta(3))
+        models.EmailFeedSetting.objects.filter(
+                            subscriber = self.user, feed_type = 'q_all'
+                        ).update(reported_at = now - datetime.timedelta(2))
+
+        batch = send_email_alerts.DigestBatch([self.user])
+        batch.load_feeds()
+        batch.load_views()
+        q_all_A, q_all_B = batch.scan_tag_filtered_exercises()[self.user.id]
+        self.assertEqual(
+            set(q_all_A),
+            set(exercises[1:])
+        )
+        self.assertEqual(q_all_B, [])
+
+
+class InstantNotificationSummaryTests(utils.AskbotTestCase):
+
+    def setUp(self):
+        self.groups_enabled = askbot_settings.GROUPS_ENABLED
+        askbot_settings.update('GROUPS_ENABLED', True)
+        self.author = self.create_user('author')
+        self.recipients = [
+            self.create_user('recipient1'),
+            self.create_user('recipient2')
+        ]
+
+    def tearDown(self):
+        askbot_settings.update('GROUPS_ENABLED', self.groups_enabled)
+
+    def test_thread_summary_is_shared_despite_personal_groups(self):
+        exercise = self.post_exercise(user = self.author)
+        activity = models.Activity(
+                        user = self.author,
+                        content_object = exercise,
+                        activity_type = const.TYPE_ACTIVITY_ASK_EXERCISE,
+                        exercise = exercise
+                    )
+        activity.save()
+
+        calls = list()
+        format_for_email = models.Thread.format_for_email
+        def counting_format_for_email(thread, user = None):
+            calls.append(user)
+            return format_for_email(thread, user = user)
+
+        models.Thread.format_for_email = counting_format_for_email
+        try:
+            django.core.mail.outbox = list()
+            models.send_instant_notifications_about_activity_in_post(
+                                            update_activity = activity,
+                                            post = exercise,
+                                            recipients = self.recipients
+                                        )
+        finally:
+            models.Thread.format_for_email = format_for_email
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(django.core.mail.outbox), 2)
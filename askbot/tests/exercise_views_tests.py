@@ -1,3 +1,5 @@
+import shutil
+import tempfile
 from bs4 import BeautifulSoup
 from askbot.conf import settings as askbot_settings
 from askbot import const
@@ -5,6 +7,7 @@ from askbot.tests.utils import AskbotTestCase
 from askbot import models
 from askbot.models.tag import get_global_group
 from django.core.urlresolvers import reverse
+from django.utils import simplejson
 
 
 class PrivateExerciseViewsTests(AskbotTestCase):
@@ -87,3 +90,82 @@ class PrivateExerciseViewsTests(AskbotTestCase):
 
     def test_privatize_public_problem(self):
         pass
+
+
+class ExportViewTests(AskbotTestCase):
+
+    def setUp(self):
+        from askbot.views import reporter
+        self.reporter = reporter
+        self._export_dir = reporter.EXPORT_DIR
+        reporter.EXPORT_DIR = tempfile.mkdtemp()
+        self.user = self.create_user('user')
+        self.client.login(user_id=self.user.id, method='force')
+
+    def tearDown(self):
+        shutil.rmtree(self.reporter.EXPORT_DIR)
+        self.reporter.EXPORT_DIR = self._export_dir
+
+    def test_export_exercises_to_text(self):
+        exercise1 = self.post_exercise(user=self.user, title='first exercise')
+        exercise2 = self.post_exercise(user=self.user, title='second exercise')
+        self.post_problem(user=self.user, exercise=exercise2, body_text='the problem')
+        ids = '%d,%d' % (exercise2.id, exercise1.id)
+        export_url = reverse('export', kwargs={'to': 'txt', 'ids': ids})
+
+        response = self.client.get(
+                            export_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+                        )
+        data = simplejson.loads(response.content)
+        self.assertEqual(data['status'], 'done')
+
+        response = self.client.get(data['download_url'])
+        self.assertEqual(response.status_code, 200)
+        text = response.content
+        self.assertTrue(text.index('second exercise') < text.index('first exercise'))
+        self.assertTrue('the problem' in text)
+
+        #the same export is not repeated
+        response = self.client.get(export_url)
+        self.assertRedirects(response, data['download_url'])
+
+        #but it is when the thread changes
+        self.post_problem(user=self.user, exercise=exercise1, body_text='another problem')
+        response = self.client.get(
+                            export_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+                        )
+        data2 = simplejson.loads(response.content)
+        self.assertNotEqual(data['job_id'], data2['job_id'])
+
+    def test_text_report_is_written_per_exercise(self):
+        from StringIO import StringIO
+        exercise1 = self.post_exercise(
+                            user=self.user,
+                            title='first exercise',
+                            body_text='formulas [[$y$]] and [[math]]x^2[[/math]]'
+                        )
+        exercise2 = self.post_exercise(user=self.user, title='second exercise')
+        exercises = [
+            {'post': exercise1, 'problems': []},
+            {'post': exercise2, 'problems': []}
+        ]
+        output = StringIO()
+        self.reporter.write_report('txt', exercises, output)
+        text = output.getvalue()
+        self.assertEqual(text.count(self.reporter.TXT_SEPARATOR), 1)
+        self.assertTrue(text.index('first exercise') < text.index('second exercise'))
+        self.assertTrue(' $y$ ' in text)
+        self.assertTrue('\\begin{equation}x^2\\end{equation}' in text)
+
+    def test_old_export_files_are_removed(self):
+        import os
+        import time
+        old_path = self.reporter.get_export_path('old', 'txt')
+        new_path = self.reporter.get_export_path('new', 'txt')
+        open(old_path, 'w').close()
+        open(new_path, 'w').close()
+        old_time = time.time() - self.reporter.EXPORT_FILE_MAX_AGE - 60
+        os.utime(old_path, (old_time, old_time))
+        self.reporter.remove_old_exports()
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(new_path))
@@ -1,6 +1,6 @@
 from django.core import management
 from django.contrib import auth
-from askbot.tests.utils import AskbotTestCase
+from askbot.tests.utils import AskbotTestCase, with_settings
 from askbot import models
 
 class ManagementCommandTests(AskbotTestCase):
@@ -51,3 +51,31 @@ class ManagementCommandTests(AskbotTestCase):
         user_two = models.User.objects.get(pk=2)
         self.assertEqual(user_two.gold, number_of_gold) 
         self.assertEqual(user_two.reputation, reputation)
+
+    @with_settings(USE_WILDCARD_TAGS=True)
+    def test_build_tag_subscriber_index(self):
+        user = self.create_user()
+        self.post_exercise(user=user, tags='day')
+        user.mark_tags(tagnames=('day',), reason='good', action='add')
+        user.mark_tags(wildcards=('ni*',), reason='bad', action='add')
+        models.TagSubscriberIndex.objects.all().delete()
+        management.call_command('build_tag_subscriber_index')
+        index = models.TagSubscriberIndex.objects
+        liked = index.get_subscriber_ids(tag_names=['day'], reason='good')
+        self.assertEqual(list(liked), [user.id])
+        ignored = index.get_subscriber_ids(tag_names=['night'], reason='bad')
+        self.assertEqual(list(ignored), [user.id])
+
+    def test_build_similar_threads(self):
+        user = self.create_user()
+        exercise = self.post_exercise(user=user, tags='one two three')
+        close = self.post_exercise(user=user, tags='one two')
+        far = self.post_exercise(user=user, tags='three four')
+        self.post_exercise(user=user, tags='five')
+        models.ThreadSimilarity.objects.all().delete()
+        management.call_command('build_similar_threads')
+        similar = models.ThreadSimilarity.objects.filter(
+                                                thread=exercise.thread
+                                            )
+        thread_ids = [item.similar_thread_id for item in similar]
+        self.assertEqual(thread_ids, [close.thread.id, far.thread.id])
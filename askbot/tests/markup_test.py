@@ -1,5 +1,5 @@
 from django.conf import settings as django_settings
-from askbot.tests.utils import AskbotTestCase
+from askbot.tests.utils import AskbotTestCase, with_settings
 from askbot.utils import markup
 
 class MarkupTest(AskbotTestCase):
@@ -22,3 +22,21 @@ class MarkupTest(AskbotTestCase):
         text = "oh hai @user1 how are you?"
         output = markup.extract_mentioned_name_seeds(text)
         self.assertEquals(output, set(['user1']))
+
+    def test_parser_is_reused(self):
+        self.assertTrue(markup.get_parser() is markup.get_parser())
+
+    def test_parser_follows_auto_link_settings(self):
+        link = 'href="http://example.com/bug/12"'
+        self.assertFalse(link in markup.get_parser().convert('see #bug12'))
+
+        @with_settings(
+            ENABLE_AUTO_LINKING = True,
+            AUTO_LINK_PATTERNS = '#bug(\\d+)',
+            AUTO_LINK_URLS = 'http://example.com/bug/\\1'
+        )
+        def convert(text):
+            return markup.get_parser().convert(text)
+
+        self.assertTrue(link in convert('see #bug12'))
+        self.assertFalse(link in markup.get_parser().convert('see #bug12'))
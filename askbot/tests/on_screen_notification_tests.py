@@ -622,3 +622,19 @@ class OnScreenUpdateNotificationTests(TestCase):
         )
 
 
+
+    def test_incremented_response_counts_match_recount(self):
+        self.reset_response_counts()
+        for text in ('problem3', 'problem4'):
+            models.Post.objects.create_new_problem(
+                                thread = self.thread,
+                                author = self.u11,
+                                added_at = datetime.datetime.now(),
+                                text = text
+                            )
+        self.reload_users()
+        counts = [user.new_response_count for user in self.users]
+        for user in self.users:
+            user.update_response_counts()
+        self.assertNewResponseCountsEqual(counts)
+        self.assertEqual(self.u12.new_response_count, 2)
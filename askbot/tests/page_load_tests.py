@@ -582,6 +582,36 @@ class ExerciseViewTests(AskbotTestCase):
         self.assertTrue(text in meta_descr.attrs['content'])
 
 
+class ExerciseListKeysetPaginationTests(AskbotTestCase):
+
+    @with_settings(
+        EXERCISE_LIST_KEYSET_PAGINATION=True,
+        DEFAULT_EXERCISES_PAGE_SIZE='10'
+    )
+    def test_next_page_continues_after_last_exercise(self):
+        user = self.create_user('user')
+        titles = list()
+        for idx in range(12):
+            title = 'keyset pagination exercise %02d' % idx
+            self.post_exercise(user=user, title=title)
+            titles.append(title)
+
+        url = SearchState.get_empty().change_sort('age-desc').full_url()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        soup = BeautifulSoup(response.content)
+        next_link = soup.find('span', attrs={'class': 'next'}).find('a')
+        next_url = next_link['href']
+        self.assertTrue('/page:2/after:' in next_url)
+        self.assertFalse(titles[1] in response.content)
+
+        response = self.client.get(next_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(titles[1] in response.content)
+        self.assertTrue(titles[0] in response.content)
+        self.assertFalse(titles[2] in response.content)
+
+
 class ExercisePageRedirectTests(AskbotTestCase):
 
     def setUp(self):
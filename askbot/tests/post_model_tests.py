@@ -10,12 +10,13 @@ from django.core.cache.backends.dummy import DummyCache
 from django.core.cache.backends.locmem import LocMemCache
 
 from django.core.exceptions import ValidationError
-from askbot.tests.utils import AskbotTestCase
+from askbot.tests.utils import AskbotTestCase, with_settings
 from askbot.models import Post
 from askbot.models import PostRevision
 from askbot.models import Thread
 from askbot.models import Tag
 from askbot.models import Group
+from askbot.models.exercise import thread_view_count_buffer
 from askbot.search.state_manager import DummySearchState
 from django.utils import simplejson
 from askbot.conf import settings as askbot_settings
@@ -211,6 +212,28 @@ class ThreadTagModelsTests(AskbotTestCase):
         self.assertListEqual([3, 2, 2, 2, 1], [t.local_used_count for t in tags])
         self.assertListEqual([3, 2, 2, 2, 2], [t.used_count for t in tags])
 
+    def test_retag_adjusts_use_counts(self):
+        self.user.retag_exercise(exercise=self.q1, tags='tag1 tag7')
+        use_counts = dict(Tag.objects.values_list('name', 'used_count'))
+        self.assertEqual(use_counts['tag1'], 2)
+        self.assertEqual(use_counts['tag2'], 1)
+        self.assertEqual(use_counts['tag3'], 2)
+        self.assertEqual(use_counts['tag7'], 1)
+
+    def test_update_use_counts(self):
+        Tag.objects.all().update(used_count=0)
+        tags = list(Tag.objects.filter(name__in=['tag1', 'tag6']))
+        #one grouped count and one update
+        self.assertNumQueries(2, Tag.objects.update_use_counts, tags)
+        self.assertEqual(
+            sorted([(tag.name, tag.used_count) for tag in tags]),
+            [('tag1', 2), ('tag6', 2)]
+        )
+        use_counts = dict(Tag.objects.values_list('name', 'used_count'))
+        self.assertEqual(use_counts['tag1'], 2)
+        self.assertEqual(use_counts['tag6'], 2)
+        self.assertEqual(use_counts['tag2'], 0)
+
     def test_run_adv_search_1(self):
         ss = SearchState.get_empty()
         qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
@@ -231,6 +254,24 @@ class ThreadTagModelsTests(AskbotTestCase):
         qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
         self.assertEqual(1, qs.count())
 
+    @with_settings(TAG_SEARCH_INPUT_ENABLED=True)
+    def test_run_adv_search_tags_case_insensitive(self):
+        ss = SearchState.get_empty().add_tag('TAG1').add_tag('Tag6')
+        qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
+        self.assertEqual([thread.id for thread in qs], [self.q4.thread_id])
+        self.assertEqual(meta_data['non_existing_tags'], [])
+
+        ss = ss.add_tag('tag9')
+        qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
+        self.assertEqual([thread.id for thread in qs], [self.q4.thread_id])
+        self.assertEqual(meta_data['non_existing_tags'], ['tag9'])
+
+    @with_settings(TAG_SEARCH_INPUT_ENABLED=False)
+    def test_run_adv_search_missing_tag(self):
+        ss = SearchState.get_empty().add_tag('tag1').add_tag('tag9')
+        qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
+        self.assertEqual(qs.count(), 0)
+
     def test_run_adv_search_query_author(self):
         ss = SearchState(scope=None, sort=None, query="@user", tags=None, author=None, page=None, user_logged_in=None)
         qs, meta_data = Thread.objects.run_advanced_search(request_user=self.user, search_state=ss)
@@ -419,6 +460,45 @@ class ThreadRenderLowLevelCachingTests(AskbotTestCase):
 
 
 
+    @with_settings(GROUPS_ENABLED=True)
+    def test_precache_summary_html_per_group_set(self):
+        cache.cache = LocMemCache('', {})
+        thread_ids = [
+            self.q.thread.id,
+            self.post_exercise(tags='tag4').thread.id
+        ]
+        rendered = list()
+        render_summary_html = Thread.render_summary_html
+        def counting_render(thread, visitor=None):
+            rendered.append(thread.id)
+            return render_summary_html(thread, visitor)
+        Thread.render_summary_html = counting_render
+        try:
+            user2 = self.create_user('user2')
+            cache.cache.clear()
+            threads = list(Thread.objects.filter(id__in=thread_ids))
+            Thread.objects.precache_summary_html(threads, visitor=user2)
+            self.assertEqual(len(rendered), 2)
+
+            #other user seeing the same posts - served from the cache
+            user3 = self.create_user('user3')
+            threads = list(Thread.objects.filter(id__in=thread_ids))
+            Thread.objects.precache_summary_html(threads, visitor=user3)
+            for thread in threads:
+                thread.get_summary_html(
+                    search_state=SearchState.get_empty(), visitor=user3
+                )
+            self.assertEqual(len(rendered), 2)
+
+            #invalidation expires the copies for all groups
+            threads[0].invalidate_cached_thread_content_fragment()
+            threads = list(Thread.objects.filter(id__in=thread_ids))
+            Thread.objects.precache_summary_html(threads, visitor=user3)
+            self.assertEqual(len(rendered), 3)
+        finally:
+            Thread.render_summary_html = render_summary_html
+
+
 class ThreadRenderCacheUpdateTests(AskbotTestCase):
     def setUp(self):
         self.create_user()
@@ -609,9 +689,14 @@ class ThreadRenderCacheUpdateTests(AskbotTestCase):
             HTTP_ACCEPT_LANGUAGE='en',
             HTTP_USER_AGENT='Mozilla Gecko'
         )
+        #view counts are written to the database in batches
+        thread_view_count_buffer.flush()
         thread = Thread.objects.all()[0]
         self.assertEqual(1, thread.view_count)
 
+        #the summary with the new view count is rendered when it is read
+        self.assertFalse(thread.summary_html_cached())
+        thread.get_summary_html()
         self.assertTrue(thread.summary_html_cached())  # <<< make sure that caching backend is set up properly (i.e. it's not dummy)
         html = self._html_for_exercise(thread._exercise_post())
         self.assertEqual(html, thread.get_cached_summary_html())
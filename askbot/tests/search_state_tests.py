@@ -291,3 +291,13 @@ class SearchStateTests(AskbotTestCase):
         )
 
 
+
+    def test_get_tag_url(self):
+        ss = SearchState.get_empty().add_tag('one')
+        url = ss.get_tag_url('two')
+        self.assertEqual(url, ss.add_tag('two').full_url())
+        self.assertTrue(ss.get_tag_url('two') is url)
+        #urls memoized by one state are not inherited by its copies
+        ss2 = ss.change_sort('age-asc')
+        self.assertEqual(ss2.get_tag_url('two'), ss2.add_tag('two').full_url())
+        self.assertNotEqual(ss2.get_tag_url('two'), url)
@@ -1,8 +1,13 @@
+import datetime
 from askbot.tests.utils import AskbotTestCase
 from askbot.conf import settings as askbot_settings
 from askbot import models
 from askbot.models.tag import get_global_group
+from askbot.search.state_manager import SearchState
 import django.core.mail
+from django.contrib.auth.models import AnonymousUser
+from django.core import cache
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.urlresolvers import reverse
 
 class ThreadModelTestsWithGroupsEnabled(AskbotTestCase):
@@ -60,6 +65,30 @@ class ThreadModelTestsWithGroupsEnabled(AskbotTestCase):
         user = self.reload_object(self.user)
         self.assertEqual(user.new_response_count, 1)
 
+    def test_cached_post_data_is_kept_per_group_set(self):
+        old_cache = cache.cache
+        cache.cache = LocMemCache('', {})
+        try:
+            exercise = self.post_exercise(self.user)
+            problem = self.post_problem(
+                user = self.admin,
+                exercise = exercise,
+                is_private = True
+            )
+            thread = exercise.thread
+
+            problems = thread.get_cached_post_data(user=self.admin)[1]
+            self.assertEqual(problems, [problem])
+            problems = thread.get_cached_post_data(user=self.user)[1]
+            self.assertEqual(problems, [])
+
+            #a change in the groups of the post expires all variants
+            problem.make_public()
+            problems = thread.get_cached_post_data(user=self.user)[1]
+            self.assertEqual(problems, [problem])
+        finally:
+            cache.cache = old_cache
+
     def test_problem_to_private_exercise_is_not_globally_visible(self):
         exercise = self.post_exercise(user=self.admin, is_private=True)
         problem = self.post_problem(exercise=exercise, user=self.admin, is_private=False)
@@ -127,3 +156,135 @@ class ThreadModelTestsWithGroupsEnabled(AskbotTestCase):
         problem_groups = set(problem.groups.all())
         user_groups = set(self.user.get_groups())
         self.assertEqual(len(problem_groups & user_groups), 1)
+
+
+class ThreadSimilarityTests(AskbotTestCase):
+
+    def test_similar_threads_follow_tag_updates(self):
+        user = self.create_user()
+        exercise = self.post_exercise(user=user, tags='one two')
+        other = self.post_exercise(user=user, tags='three')
+        self.assertEqual(exercise.thread.get_similar_threads().data(), [])
+
+        user.retag_exercise(exercise=other, tags='one two three')
+        similar = exercise.thread.get_similar_threads().data()
+        self.assertEqual(len(similar), 1)
+        self.assertEqual(similar[0]['url'], other.get_absolute_url())
+
+        user.retag_exercise(exercise=other, tags='three')
+        self.assertEqual(exercise.thread.get_similar_threads().data(), [])
+
+
+class ThreadExercisePostTests(AskbotTestCase):
+
+    def test_thread_follows_exercise_deletion(self):
+        user = self.create_user()
+        user.set_admin_status()
+        user.save()
+        exercise = self.post_exercise(user=user)
+        thread = models.Thread.objects.get(id=exercise.thread_id)
+        self.assertEqual(thread.exercise_post_id, exercise.id)
+        self.assertFalse(thread.deleted)
+
+        search_state = SearchState.get_empty()
+        threads, meta_data = models.Thread.objects.run_advanced_search(
+                                            request_user=user,
+                                            search_state=search_state
+                                        )
+        self.assertEqual([t.id for t in threads], [thread.id])
+
+        user.delete_post(exercise)
+        thread = models.Thread.objects.get(id=exercise.thread_id)
+        self.assertTrue(thread.deleted)
+        threads, meta_data = models.Thread.objects.run_advanced_search(
+                                            request_user=user,
+                                            search_state=search_state
+                                        )
+        self.assertEqual(list(threads), [])
+
+        exercise = models.Post.objects.get(id=exercise.id)
+        user.restore_post(exercise)
+        thread = models.Thread.objects.get(id=exercise.thread_id)
+        self.assertFalse(thread.deleted)
+
+
+class ThreadSearchCacheTests(AskbotTestCase):
+
+    def setUp(self):
+        self.old_cache = cache.cache
+        cache.cache = LocMemCache('', {})
+        self.user = self.create_user()
+        self.visitor = AnonymousUser()
+
+    def tearDown(self):
+        cache.cache = self.old_cache
+
+    def search(self):
+        search_state = SearchState.get_empty()
+        threads, meta_data = models.Thread.objects.run_cached_advanced_search(
+                                            request_user=self.visitor,
+                                            search_state=search_state
+                                        )
+        return list(threads[0:10])
+
+    def test_cached_results_load_only_the_page(self):
+        exercise1 = self.post_exercise(user=self.user, title='first')
+        exercise2 = self.post_exercise(user=self.user, title='second')
+        threads = self.search()
+        self.assertEqual(
+            [thread.id for thread in threads],
+            [exercise2.thread_id, exercise1.thread_id]
+        )
+        #just the threads of the page are read
+        self.assertNumQueries(1, self.search)
+
+    def test_new_post_expires_cached_results(self):
+        exercise1 = self.post_exercise(user=self.user, title='first')
+        self.assertEqual(
+            [thread.id for thread in self.search()],
+            [exercise1.thread_id]
+        )
+        exercise2 = self.post_exercise(user=self.user, title='second')
+        self.assertEqual(
+            [thread.id for thread in self.search()],
+            [exercise2.thread_id, exercise1.thread_id]
+        )
+        self.user.delete_post(exercise2)
+        self.assertEqual(
+            [thread.id for thread in self.search()],
+            [exercise1.thread_id]
+        )
+
+
+class ExerciseVisitBufferTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.exercise = self.post_exercise(user=self.user)
+        self.thread = self.exercise.thread
+
+    def test_view_counts_are_added_on_flush(self):
+        buffer = models.exercise.thread_view_count_buffer
+        buffer.flush()#start a new flush interval
+        for i in range(3):
+            buffer.add(self.thread.id, 1)
+        thread = models.Thread.objects.get(id=self.thread.id)
+        self.assertEqual(thread.view_count, 0)
+        buffer.flush()
+        thread = models.Thread.objects.get(id=self.thread.id)
+        self.assertEqual(thread.view_count, 3)
+
+    def test_exercise_views_are_written_on_flush(self):
+        visitor = self.create_user('visitor')
+        timestamp = datetime.datetime.now()
+        visitor.visit_exercise(self.exercise, timestamp=timestamp)
+        models.exercise.exercise_view_buffer.flush()
+        views = models.ExerciseView.objects.filter(who=visitor)
+        self.assertEqual([view.when for view in views], [timestamp])
+
+        later = timestamp + datetime.timedelta(0, 10)
+        visitor.visit_exercise(self.exercise, timestamp=later)
+        visitor.visit_exercise(self.exercise, timestamp=timestamp)
+        models.exercise.exercise_view_buffer.flush()
+        views = models.ExerciseView.objects.filter(who=visitor)
+        self.assertEqual([view.when for view in views], [later])
@@ -1,4 +1,5 @@
-from askbot.tests.utils import AskbotTestCase
+import datetime
+from askbot.tests.utils import AskbotTestCase, with_settings
 from django.contrib.auth.models import User
 from askbot import models
 from askbot.models.tag import format_personal_group_name
@@ -15,3 +16,51 @@ class UserModelTests(AskbotTestCase):
                                                 group=group, user=user
                                             )
         self.assertEqual(memberships.count(), 1)
+
+
+class UserVisitTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        #noon - so that the visits a few seconds later stay within the day
+        self.now = datetime.datetime.combine(
+                                    datetime.date.today(),
+                                    datetime.time(12)
+                                )
+        User.objects.filter(id = self.user.id).update(
+                                            last_seen = self.now - datetime.timedelta(1),
+                                            consecutive_days_visit_count = 3
+                                        )
+
+    def visit(self, timestamp):
+        user = User.objects.get(id = self.user.id)
+        models.record_user_visit(user, timestamp)
+        return User.objects.get(id = self.user.id)
+
+    def test_first_visit_of_the_day_counts_once(self):
+        now = self.now
+        user = self.visit(now)
+        self.assertEqual(user.consecutive_days_visit_count, 4)
+        self.assertEqual(user.last_seen, now)
+        user = self.visit(now + datetime.timedelta(0, 1))
+        self.assertEqual(user.consecutive_days_visit_count, 4)
+
+    @with_settings(LAST_SEEN_UPDATE_MODE = 'buffered')
+    def test_buffered_visits_are_written_on_flush(self):
+        models.last_seen_buffer.flush()#start a new flush interval
+        now = self.now
+        self.visit(now)#the first visit of the day is written
+        later = now + datetime.timedelta(0, 1)
+        user = self.visit(later)
+        self.assertEqual(user.last_seen, now)
+        models.last_seen_buffer.flush()
+        user = User.objects.get(id = self.user.id)
+        self.assertEqual(user.last_seen, later)
+        self.assertEqual(user.consecutive_days_visit_count, 4)
+
+    def test_older_visit_is_not_written(self):
+        now = self.now
+        self.visit(now)
+        models.update_last_seen({self.user.id: now - datetime.timedelta(0, 1)})
+        user = User.objects.get(id = self.user.id)
+        self.assertEqual(user.last_seen, now)
@@ -94,6 +94,17 @@ class AskbotTestCase(TestCase):
     to django TestCase class
     """
 
+    def _pre_setup(self):
+        """drops the values buffered in this process by the
+        earlier tests - they would be written to the rows
+        that reuse the ids in this test, runs before ``setUp``
+        so that the subclasses don't need to call it"""
+        super(AskbotTestCase, self)._pre_setup()
+        models.last_seen_buffer.clear()
+        models.exercise.thread_view_count_buffer.clear()
+        models.exercise.exercise_view_buffer.clear()
+        models.badges.badge_event_queue.clear()
+
     def create_user(
                 self,
                 username = 'user',
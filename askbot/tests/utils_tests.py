@@ -1,7 +1,14 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from django.conf import settings as django_settings
 from django.test import TestCase
 from askbot.tests.utils import with_settings
 from askbot.utils.url_utils import urls_equal
 from askbot.utils.html import absolutize_urls
+from askbot.utils import latex
 from askbot.conf import settings as askbot_settings
 
 class UrlUtilsTests(TestCase):
@@ -55,3 +62,51 @@ class HTMLUtilsTests(TestCase):
             absolutize_urls(text),
             '<a href="http://example.com/upfiles/13487909784287052.png"><img src="http://example.com/upfiles/13487909942351405.png" style="max-width:500px;" alt="" /></a><img src="http://i2.cdn.turner.com/cnn/dam/assets/120927033530-ryder-cup-captains-wall-4-tease.jpg" alt="" width="160" height="90" border="0" />and some text<br />aouaosutoaehut'
         )
+
+
+class LatexImageCacheTests(TestCase):
+
+    def setUp(self):
+        self.media_root = django_settings.MEDIA_ROOT
+        django_settings.MEDIA_ROOT = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(django_settings.MEDIA_ROOT)
+        django_settings.MEDIA_ROOT = self.media_root
+
+    def test_image_names_are_hashes_of_formulas(self):
+        name = latex.get_image_name(u'x^2')
+        self.assertEqual(name, latex.get_image_name(u'x^2'))
+        self.assertNotEqual(name, latex.get_image_name(u'x^3'))
+        self.assertTrue(name.endswith('.png'))
+
+    def test_cached_images_are_used(self):
+        os.makedirs(latex.get_cache_dir())
+        open(latex.get_image_path(u'x^2'), 'w').close()
+        urls = latex.get_image_urls([u'x^2', u'x^2'])
+        expected_url = django_settings.MEDIA_URL + 'latex/' \
+                        + latex.get_image_name(u'x^2')
+        self.assertEqual(urls, [expected_url, expected_url])
+
+    def test_missing_images(self):
+        urls = latex.get_image_urls([u'\\alpha + 1'])
+        if latex.can_render():
+            expected_url = latex.get_image_url(u'\\alpha + 1')
+        else:
+            expected_url = latex.get_remote_image_url(u'\\alpha + 1')
+        self.assertEqual(urls, [expected_url])
+
+    def test_slow_renderer_is_killed(self):
+        start = time.time()
+        self.assertRaises(
+            subprocess.CalledProcessError,
+            latex.run_with_timeout,
+            ['sleep', '10'],
+            timeout = 0.2
+        )
+        self.assertTrue(time.time() - start < 5)
+
+    def test_latex_may_not_open_outside_files(self):
+        environment = latex.get_latex_environment()
+        self.assertEqual(environment['openin_any'], 'p')
+        self.assertEqual(environment['openout_any'], 'p')
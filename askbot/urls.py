@@ -70,6 +70,7 @@ urlpatterns = patterns('',
             r'(%s)?' % r'/tags:(?P<tags>[\w+.#,-]+)' + # Should match: const.TAG_CHARS + ','; TODO: Is `#` char decoded by the time URLs are processed ??
             r'(%s)?' % r'/author:(?P<author>\d+)' +
             r'(%s)?' % r'/page:(?P<page>\d+)' +
+            r'(%s)?' % r'/after:(?P<after>-?\d+,\d+)' + # keyset pagination cursor, see askbot.utils.pagination
         r'/$'),
 
         views.readers.exercises,
@@ -507,6 +508,11 @@ urlpatterns = patterns('',
         'askbot.views.commands.export',
         name='export'
     ),
+    url(
+        r'^export/(?P<to>pdf|rtf|txt)/(?P<ids>[\d\,]+)/(?P<job_id>[0-9a-f]+)/$',
+        'askbot.views.commands.export_download',
+        name='export_download'
+    ),
     # end: add txt format
     #upload url is ajax only
     url( r'^%s$' % _('upload/'), views.writers.upload, name='upload'),
@@ -1,8 +1,12 @@
-"""Utilities for working with Django Models."""
+"""Utilities for working with Django Models
+and with the versioned items in the cache."""
 import itertools
+import time
 
 from django.contrib.contenttypes.models import ContentType
+from django.core import cache
 
+from askbot import const
 from askbot.utils.lists import flatten
 
 def fetch_model_dict(model, ids, fields=None):
@@ -90,3 +94,35 @@ def populate_content_object_caches(generic_related_objects, model_fields=None):
     for obj in generic_related_objects:
         obj._object_cache = objects[obj.content_type_id][obj.object_id]
         obj._content_type_cache = content_types[obj.content_type_id]
+
+def get_cache_version(key):
+    """returns value of the version counter stored in the cache
+    under the ``key``, the version is meant to be part of the keys
+    of cached items, so that they all expire when the counter is
+    bumped with :func:`bump_cache_version`
+    """
+    #when the counter is lost, restart it from the current time
+    #so that the items cached under the old numbers are not picked up again
+    cache.cache.add(key, int(time.time() * 1000), const.LONG_TIME)
+    version = cache.cache.get(key)
+    if version is None:#cache that does not store anything
+        return 0
+    return version
+
+def get_cache_versions(keys):
+    """returns dictionary of the version counters under the ``keys``,
+    like :func:`get_cache_version`, all existing counters
+    are read from the cache at once
+    """
+    versions = cache.cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = get_cache_version(key)
+    return versions
+
+def bump_cache_version(key):
+    """increments the version counter stored under the ``key``"""
+    try:
+        cache.cache.incr(key)
+    except ValueError:
+        pass#no counter - nothing is cached under it
@@ -0,0 +1,176 @@
+"""Utilities for set-based database writes"""
+import atexit
+import threading
+import time
+from django.db import connection, transaction
+from django.db import models
+
+#sqlite refuses statements with more than 999 parameters
+SQLITE_MAX_VARIABLES = 999
+
+def bulk_create(objects, batch_size = 500):
+    """inserts unsaved model instances of one model
+    with multi-row INSERT statements, ``batch_size`` rows at a time.
+
+    Uses ``Manager.bulk_create`` when django provides it,
+    otherwise builds the statement by hand.
+    Like the django version - does not send
+    signals, does not call ``save()`` and does not
+    set primary keys on the instances.
+
+    todo: remove the fallback when django 1.3 goes out of use
+    """
+    objects = list(objects)
+    if len(objects) == 0:
+        return
+    model = objects[0].__class__
+    manager = model._default_manager
+    if hasattr(manager, 'bulk_create'):
+        for start in xrange(0, len(objects), batch_size):
+            manager.bulk_create(objects[start:start + batch_size])
+        return
+
+    fields = [
+        field for field in model._meta.local_fields
+        if not isinstance(field, models.AutoField)
+    ]
+    if 'sqlite' in connection.settings_dict['ENGINE']:
+        batch_size = min(batch_size, SQLITE_MAX_VARIABLES // len(fields))
+
+    quote_name = connection.ops.quote_name
+    columns = ', '.join([quote_name(field.column) for field in fields])
+    row_placeholder = '(' + ', '.join(['%s'] * len(fields)) + ')'
+
+    cursor = connection.cursor()
+    for start in xrange(0, len(objects), batch_size):
+        batch = objects[start:start + batch_size]
+        params = list()
+        for obj in batch:
+            for field in fields:
+                value = field.pre_save(obj, True)
+                params.append(
+                    field.get_db_prep_save(value, connection = connection)
+                )
+        sql = 'INSERT INTO %s (%s) VALUES %s' % (
+                                quote_name(model._meta.db_table),
+                                columns,
+                                ', '.join([row_placeholder] * len(batch))
+                            )
+        cursor.execute(sql, params)
+    transaction.commit_unless_managed()
+
+def filter_in_chunks(queryset, lookup, values, chunk_size = 500):
+    """yields copies of the ``queryset`` filtered with
+    ``<lookup>__in`` on consecutive chunks of ``values``,
+    so that long id lists stay within the limits
+    some databases put on the number of query parameters
+    """
+    values = list(values)
+    for start in xrange(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        yield queryset.filter(**{lookup + '__in': chunk})
+
+def bulk_update(model, field_name, values, only_greater = False, batch_size = 200):
+    """sets the field ``field_name`` of many model instances
+    with one ``UPDATE ... CASE`` statement per ``batch_size`` rows,
+    ``values`` is a dictionary of primary keys and new values.
+
+    If ``only_greater`` is true, values not greater than
+    the ones already stored are not written.
+    """
+    quote_name = connection.ops.quote_name
+    field = model._meta.get_field(field_name)
+    column = quote_name(field.column)
+    pk_column = quote_name(model._meta.pk.column)
+    if only_greater:
+        case = 'WHEN %s = %%s AND (%s IS NULL OR %s < %%s) THEN %%s' \
+                                    % (pk_column, column, column)
+    else:
+        case = 'WHEN %s = %%s THEN %%s' % pk_column
+
+    items = values.items()
+    cursor = connection.cursor()
+    for start in xrange(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        params = list()
+        for pk, value in batch:
+            value = field.get_db_prep_save(value, connection = connection)
+            if only_greater:
+                params.extend([pk, value, value])
+            else:
+                params.extend([pk, value])
+        params.extend([pk for pk, value in batch])
+        sql = 'UPDATE %s SET %s = CASE %s ELSE %s END WHERE %s IN (%s)' % (
+                                    quote_name(model._meta.db_table),
+                                    column,
+                                    ' '.join([case] * len(batch)),
+                                    column,
+                                    pk_column,
+                                    ', '.join(['%s'] * len(batch))
+                                )
+        cursor.execute(sql, params)
+    transaction.commit_unless_managed()
+
+
+class WriteBehindBuffer(object):
+    """collects values under keys in this process and passes
+    them to the function ``write`` in one dictionary - once in
+    ``flush_interval`` seconds or when ``max_size`` keys are collected,
+    and at the exit of the process.
+
+    ``merge(old_value, new_value)`` combines values added
+    under the same key, by default the later value is kept.
+    """
+    def __init__(
+                self, write, merge = None,
+                flush_interval = 60, max_size = 500
+            ):
+        self.write = write
+        self.merge = merge
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.values = dict()
+        self.flushed_at = time.time()
+        atexit.register(self.flush)
+
+    def add(self, key, value):
+        self.lock.acquire()
+        try:
+            if self.merge and key in self.values:
+                value = self.merge(self.values[key], value)
+            self.values[key] = value
+            flush_due = len(self.values) >= self.max_size or \
+                time.time() - self.flushed_at >= self.flush_interval
+        finally:
+            self.lock.release()
+        if flush_due:
+            self.flush()
+
+    def get(self, key, default = None):
+        """returns the value waiting to be written under the key"""
+        self.lock.acquire()
+        try:
+            return self.values.get(key, default)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """drops the values waiting to be written"""
+        self.lock.acquire()
+        try:
+            self.values = dict()
+            self.flushed_at = time.time()
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        self.lock.acquire()
+        try:
+            values = self.values
+            self.values = dict()
+            self.flushed_at = time.time()
+        finally:
+            self.lock.release()
+        if values:
+            self.write(values)
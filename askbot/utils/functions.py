@@ -152,6 +152,7 @@ def setup_paginator(context):
             "has_previous": context["has_previous"],
             "next": context["next"],
             "has_next": context["has_next"],
+            "next_cursor": context.get("next_cursor"),
             "page": context["page"],
             "pages": context["pages"],
             "page_numbers": page_numbers,
@@ -0,0 +1,200 @@
+"""Rendering of the LaTeX formulas into png images
+for the exported documents.
+
+The images are stored under ``MEDIA_ROOT`` in files named
+by the hash of the formula source, so that each formula
+is rendered once. The formulas which are not in the cache yet
+are rendered in parallel in a pool of processes, with
+``latex`` and ``dvipng`` when both are installed, or with
+the ``mathtext`` module of matplotlib.
+
+When neither is available, the images are
+loaded from the remote ``mathtex`` service, as before.
+
+The formulas come from the posts, so ``latex`` runs without
+the shell escape, may not read or write files outside of its
+working directory, and is killed after ``RENDER_TIMEOUT`` seconds.
+"""
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import urllib
+from distutils.spawn import find_executable
+from django.conf import settings as django_settings
+from django.utils.hashcompat import sha_constructor
+
+try:
+    from matplotlib import mathtext
+except ImportError:
+    mathtext = None
+
+REMOTE_RENDERER_URL = 'http://www.forkosh.com/mathtex.cgi?%s'
+
+#subdirectory of the MEDIA_ROOT with the images of the formulas
+LATEX_CACHE_DIR = 'latex'
+
+#resolution of the images
+DPI = 120
+
+#seconds given to each of the rendering programs
+RENDER_TIMEOUT = 10
+
+LATEX_DOCUMENT_TEMPLATE = r"""\documentclass{article}
+\usepackage{amsmath}
+\usepackage{amssymb}
+\pagestyle{empty}
+\begin{document}
+%s
+\end{document}
+"""
+
+def get_cache_dir():
+    return os.path.join(django_settings.MEDIA_ROOT, LATEX_CACHE_DIR)
+
+def get_image_name(latex):
+    """name of the image file, by the hash of the formula"""
+    return sha_constructor(latex.encode('utf-8')).hexdigest() + '.png'
+
+def get_image_path(latex):
+    return os.path.join(get_cache_dir(), get_image_name(latex))
+
+def get_image_url(latex):
+    return '%s%s/%s' % (
+        django_settings.MEDIA_URL, LATEX_CACHE_DIR, get_image_name(latex)
+    )
+
+def get_remote_image_url(latex):
+    return REMOTE_RENDERER_URL % urllib.quote(latex.encode('utf-8'))
+
+def has_latex_toolchain():
+    return find_executable('latex') and find_executable('dvipng')
+
+def can_render():
+    return bool(has_latex_toolchain() or mathtext)
+
+def run_with_timeout(args, timeout = RENDER_TIMEOUT, **kwargs):
+    """runs the program, kills it if it does not finish
+    in ``timeout`` seconds; raises ``CalledProcessError``
+    if it fails or is killed
+    """
+    devnull = open(os.devnull, 'w')
+    try:
+        process = subprocess.Popen(
+                            args, stdin = devnull, stdout = devnull,
+                            stderr = devnull, **kwargs
+                        )
+        deadline = time.time() + timeout
+        while process.poll() is None:
+            if time.time() > deadline:
+                process.kill()
+                process.wait()
+                break
+            time.sleep(0.05)
+    finally:
+        devnull.close()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args[0])
+
+def get_latex_environment():
+    """environment of the ``latex`` process, in which
+    it may open files only in its working directory"""
+    environment = dict(os.environ)
+    environment['openin_any'] = 'p'
+    environment['openout_any'] = 'p'
+    return environment
+
+def render_with_latex(latex, image_path):
+    """typesets the formula with ``latex`` and
+    converts the dvi file into the png image with ``dvipng``
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        tex_file = open(os.path.join(work_dir, 'formula.tex'), 'w')
+        tex_file.write(
+            (LATEX_DOCUMENT_TEMPLATE % ('$%s$' % latex)).encode('utf-8')
+        )
+        tex_file.close()
+        run_with_timeout(
+            [
+                'latex', '-no-shell-escape', '-interaction=nonstopmode',
+                'formula.tex'
+            ],
+            cwd = work_dir, env = get_latex_environment()
+        )
+        run_with_timeout(
+            [
+                'dvipng', '-T', 'tight', '-D', str(DPI),
+                '-bg', 'Transparent', '-o', image_path,
+                os.path.join(work_dir, 'formula.dvi')
+            ]
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors = True)
+
+def render_with_mathtext(latex, image_path):
+    mathtext.math_to_image('$%s$' % latex, image_path, dpi = DPI)
+
+def render_formula(latex):
+    """renders the formula into its file in the cache,
+    returns ``True`` on success.
+
+    The image is written into a temporary file first,
+    so that a partially written image is never used.
+    """
+    image_path = get_image_path(latex)
+    handle, temp_path = tempfile.mkstemp(suffix = '.png', dir = get_cache_dir())
+    os.close(handle)
+    try:
+        try:
+            if has_latex_toolchain():
+                render_with_latex(latex, temp_path)
+            else:
+                render_with_mathtext(latex, temp_path)
+            os.rename(temp_path, image_path)
+            return True
+        except Exception:
+            return False
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def get_image_urls(formulas):
+    """returns list of urls of the images of the ``formulas``,
+    the formulas missing in the cache are rendered first
+    """
+    missing = list()
+    for latex in formulas:
+        if latex not in missing and not os.path.exists(get_image_path(latex)):
+            missing.append(latex)
+
+    if missing and can_render():
+        cache_dir = get_cache_dir()
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+    else:
+        missing = list()
+
+    #daemonic processes, like the celery workers,
+    #cannot start the pool
+    if len(missing) == 1 or multiprocessing.current_process().daemon:
+        for latex in missing:
+            render_formula(latex)
+    elif len(missing) > 1:
+        pool = multiprocessing.Pool(min(len(missing), multiprocessing.cpu_count()))
+        try:
+            pool.map(render_formula, missing)
+        finally:
+            pool.close()
+            pool.join()
+
+    urls = list()
+    for latex in formulas:
+        if os.path.exists(get_image_path(latex)):
+            urls.append(get_image_url(latex))
+        else:
+            #there is no local renderer or it failed
+            urls.append(get_remote_image_url(latex))
+    return urls
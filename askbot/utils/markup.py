@@ -5,15 +5,57 @@ Twitter-style @mentions"""
 
 import re
 import logging
+import threading
 from askbot import const
-from askbot.conf import settings as askbot_settings
+from askbot.utils.cache import get_cache_version, bump_cache_version
 from markdown2 import Markdown
 #url taken from http://regexlib.com/REDetails.aspx?regexp_id=501 by Brian Bothwell
 URL_RE = re.compile("((?<!(href|.src|data)=['\"])((http|https|ftp)\://([a-zA-Z0-9\.\-]+(\:[a-zA-Z0-9\.&amp;%\$\-]+)*@)*((25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9])\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9]|0)\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9]|0)\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[0-9])|localhost|([a-zA-Z0-9\-]+\.)*[a-zA-Z0-9\-]+\.(com|edu|gov|int|mil|net|org|biz|arpa|info|name|pro|aero|coop|museum|[a-zA-Z]{2}))(\:[0-9]+)*(/($|[a-zA-Z0-9\.\,\?\'\\\+&amp;%\$#\=~_\-]+))*))")
 
+#version of the livesettings used to configure the parser,
+#the version is shared between the processes via cache
+PARSER_SETTINGS_VERSION_KEY = 'markup-parser-settings-version'
+
+#changes of the parser settings made in this process - counted separately
+#so that they take effect even with a cache backend that stores nothing
+_local_parser_settings_version = 0
+
+#configured parser and its settings version, one per thread
+#because the ``markdown2`` parser keeps state during the conversion
+_parser_cache = threading.local()
+
+def update_parser_settings_callback(old_value, new_value):
+    """update callback for the livesettings that
+    affect the parser - makes :func:`get_parser` rebuild it
+    """
+    global _local_parser_settings_version
+    if old_value != new_value:
+        _local_parser_settings_version += 1
+        bump_cache_version(PARSER_SETTINGS_VERSION_KEY)
+    return new_value
+
+def get_parser_settings_version():
+    return (
+        _local_parser_settings_version,
+        get_cache_version(PARSER_SETTINGS_VERSION_KEY)
+    )
+
 def get_parser():
-    """returns an instance of configured ``markdown2`` parser
+    """returns configured ``markdown2`` parser,
+    the parser is reused within the thread until
+    the settings of markup change
+    """
+    version = get_parser_settings_version()
+    if getattr(_parser_cache, 'version', None) != version:
+        _parser_cache.parser = create_parser()
+        _parser_cache.version = version
+    return _parser_cache.parser
+
+def create_parser():
+    """returns a new instance of configured ``markdown2`` parser
     """
+    #the settings modules import the update callback from here
+    from askbot.conf import settings as askbot_settings # Avoid circular import
     extras = ['link-patterns', 'video']  
 
     if askbot_settings.ENABLE_MATHJAX or \
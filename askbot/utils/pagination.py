@@ -0,0 +1,136 @@
+"""Keyset (a.k.a. seek) pagination of the query sets.
+
+Instead of skipping ``(page - 1) * per_page`` rows with ``OFFSET``,
+the next page is selected with a condition on the position
+of the last row of the previous page - the value of the sort column
+and the id, which is passed between the requests as a "cursor" string.
+
+The total count, which is needed only to display
+the number of pages, is cached for a short time.
+"""
+import datetime
+from django.core import cache
+from django.core.paginator import Paginator, InvalidPage
+from django.db import models
+from django.utils.hashcompat import md5_constructor
+
+#for how long the total count of the paginated items is cached
+COUNT_CACHE_TIMEOUT = 300
+
+CURSOR_DATETIME_FORMAT = '%Y%m%d%H%M%S%f'
+
+class KeysetPage(object):
+    """quacks like the ``django.core.paginator.Page``"""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def get_next_cursor(self):
+        """cursor to continue after the last item of the page"""
+        if self.has_next():
+            return self.paginator.get_cursor(self.object_list[-1])
+        return None
+
+
+class KeysetPaginator(Paginator):
+    """paginator of a query set ordered by ``sort_field``
+    and then by id in the same direction.
+
+    Pages requested without the cursor are read
+    with the usual ``OFFSET`` - so that the page number links work.
+    """
+
+    def __init__(self, object_list, per_page, sort_field, descending = False):
+        self.sort_field = sort_field
+        self.descending = descending
+        direction = descending and '-' or ''
+        object_list = object_list.extra(
+                            order_by = [direction + sort_field, direction + 'id']
+                        )
+        super(KeysetPaginator, self).__init__(object_list, per_page)
+
+    def _get_count(self):
+        """the count is cached per query"""
+        if self._count is None:
+            query_hash = md5_constructor(str(self.object_list.query)).hexdigest()
+            key = 'keyset-paginator-count-' + query_hash
+            count = cache.cache.get(key)
+            if count is None:
+                count = self.object_list.count()
+                cache.cache.set(key, count, COUNT_CACHE_TIMEOUT)
+            self._count = count
+        return self._count
+    count = property(_get_count)
+
+    def get_cursor(self, obj):
+        value = getattr(obj, self.sort_field)
+        if isinstance(value, datetime.datetime):
+            value = value.strftime(CURSOR_DATETIME_FORMAT)
+        return '%s,%d' % (value, obj.id)
+
+    def parse_cursor(self, cursor):
+        """returns tuple (sort field value, id),
+        raises ``ValueError`` on a malformed cursor"""
+        value, obj_id = cursor.split(',')
+        field = self.object_list.model._meta.get_field(self.sort_field)
+        if isinstance(field, models.DateTimeField):
+            value = datetime.datetime.strptime(value, CURSOR_DATETIME_FORMAT)
+        else:
+            value = int(value)
+        return value, int(obj_id)
+
+    def page(self, number, after = None):
+        """returns page with the given ``number``,
+        if the ``after`` cursor is given, the page starts
+        right after the position in the cursor
+        """
+        if after is None:
+            page = super(KeysetPaginator, self).page(number)
+            return KeysetPage(
+                        list(page.object_list),
+                        page.number,
+                        self,
+                        page.has_next()
+                    )
+
+        try:
+            value, obj_id = self.parse_cursor(after)
+        except ValueError:
+            raise InvalidPage('malformed pagination cursor')
+
+        if self.descending:
+            lookup = '__lt'
+        else:
+            lookup = '__gt'
+        position_filter = models.Q(**{self.sort_field + lookup: value}) | \
+            models.Q(**{self.sort_field: value, 'id' + lookup: obj_id})
+
+        object_list = list(
+            self.object_list.filter(position_filter)[:self.per_page + 1]
+        )
+        has_next = len(object_list) > self.per_page
+        return KeysetPage(object_list[:self.per_page], number, self, has_next)
@@ -7,10 +7,12 @@ is not always very clean.
 """
 import datetime
 import logging
+import os
 from bs4 import BeautifulSoup
 from django.conf import settings as django_settings
 from django.core import exceptions
 #from django.core.management import call_command
+from django.core.servers.basehttp import FileWrapper
 from django.core.urlresolvers import reverse
 from django.contrib.auth.decorators import login_required
 from django.http import Http404
@@ -31,6 +33,7 @@ from askbot import forms
 from askbot.conf import should_show_sort_by_relevance
 from askbot.conf import settings as askbot_settings
 from askbot.models.tag import get_global_group
+from askbot.search import tag_completion
 from askbot.utils import category_tree
 from askbot.utils import decorators
 from askbot.utils import url_utils
@@ -540,16 +543,21 @@ def get_html_template(request):
 @decorators.get_only
 def get_tag_list(request):
     """returns tags to use in the autocomplete
-    function
-    """
-    tags = models.Tag.objects.filter(
-                        deleted = False,
-                        status = models.Tag.STATUS_ACCEPTED
-                    )
+    function - up to ``limit`` most used tags starting
+    with the text in the ``q`` parameter, which may end
+    with an asterisk, like the wildcard tags.
 
-    tag_names = tags.values_list(
-                        'name', flat = True
-                    )
+    Without the ``q`` all tags are returned
+    """
+    prefix = request.GET.get('q')
+    if prefix is None:
+        tag_names = tag_completion.get_index().get_names()
+    else:
+        try:
+            limit = int(request.GET.get('limit', tag_completion.DEFAULT_LIMIT))
+        except ValueError:
+            return HttpResponseBadRequest()
+        tag_names = tag_completion.complete(prefix.strip(), max(limit, 1))
 
     output = '\n'.join(map(escape, tag_names))
     return HttpResponse(output, mimetype = 'text/plain')
@@ -1149,8 +1157,7 @@ def moderate_suggested_tag(request):
             if tag.threads.count() > len(threads):
                 for thread in threads:
                     thread.tags.remove(tag)
-                tag.used_count = tag.threads.count()
-                tag.save()
+                models.Tag.objects.update_use_counts([tag])
             elif tag.status == models.Tag.STATUS_SUGGESTED:
                 tag.delete()
     else:
@@ -1412,13 +1419,10 @@ def publish_problem(request):
     return {'redirect_url': problem.get_absolute_url()}
 
 
-@csrf.csrf_exempt
-#@decorators.post_only
-@decorators.ajax_login_required
-def export(request, to, ids):
-    """ Export to pdf or rtf"""
-
-    exercises = []
+def get_export_posts(request, ids):
+    """returns exercise posts with the comma separated ``ids``
+    in the same order, raises ``Http404`` or
+    ``ExerciseHidden`` when the posts may not be exported"""
     try:
         ids = map(int, ids.split(','))
         posts = models.Post.objects.filter(
@@ -1426,36 +1430,99 @@ def export(request, to, ids):
             id__in=ids).select_related('thread')
         assert len(posts)
         [i.assert_is_visible_to(request.user) for i in posts]
-        p = []
-        for i in ids:
-            for j in posts:
-                if j.id == i:
-                    p.append(j)
-        posts = p
-    except askbot_exceptions.ExerciseHidden, error:
-        request.user.message_set.create(message = unicode(error))
-        return HttpResponseRedirect(reverse('index'))
+        post_map = dict([(post.id, post) for post in posts])
+        return [post_map[i] for i in ids if i in post_map]
+    except askbot_exceptions.ExerciseHidden:
+        raise
     except:
         raise Http404
 
-    for i in posts:
-        updated, problems, _, _ = i.thread.get_cached_post_data(user=request.user)
-        i.set_cached_comments(
-            updated.get_cached_comments()
-        )
-        exercises.append({
-            'post': i,
-            'problems': problems
-        })
+
+@csrf.csrf_exempt
+#@decorators.post_only
+@decorators.ajax_login_required
+def export(request, to, ids):
+    """ Export to pdf or rtf
+
+    The file is generated by the celery worker, the response
+    has id of the export job and the download url -
+    as json to the ajax requests, otherwise it redirects
+    to the download url
+    """
+    try:
+        posts = get_export_posts(request, ids)
+    except askbot_exceptions.ExerciseHidden, error:
+        request.user.message_set.create(message = unicode(error))
+        return HttpResponseRedirect(reverse('index'))
 
     # start: dynamic url
     base_url = request.META.get('HTTP_REFERER', 'http://localhost')
     if base_url.count('/') >= 3:
         path_pos = base_url.index('/', base_url.index('/', base_url.index('/') + 1) + 1)
         base_url = base_url[:path_pos]
-
-    data = reporter.report(to, exercises, bool(request.GET.get('all', 0)), base_url)
     # end: dynamic url
-    resp = HttpResponse(data, mimetype='application/octet-stream')
-    resp['Content-Disposition'] = 'attachment; filename="exercise.%s"' % to
-    return resp
+
+    with_solutions = bool(request.GET.get('all', 0))
+    job_id = reporter.get_export_job_id(
+                        to, posts, request.user, with_solutions, base_url
+                    )
+    status = reporter.get_export_job_status(job_id, to)
+    if status not in ('done', 'pending'):
+        #the same export is not started again while it is running
+        from askbot import tasks
+        reporter.set_export_job_status(job_id, 'pending')
+        tasks.export_exercises_celery_task.delay(
+                                job_id,
+                                to,
+                                [post.id for post in posts],
+                                request.user.id,
+                                with_solutions,
+                                base_url
+                            )
+        status = reporter.get_export_job_status(job_id, to)
+
+    download_url = reverse(
+                        'export_download',
+                        kwargs = {'to': to, 'ids': ids, 'job_id': job_id}
+                    )
+    if request.is_ajax():
+        data = {
+            'job_id': job_id,
+            'status': status,
+            'download_url': download_url
+        }
+        return HttpResponse(simplejson.dumps(data), mimetype='application/json')
+    return HttpResponseRedirect(download_url)
+
+
+@decorators.ajax_login_required
+def export_download(request, to, ids, job_id):
+    """sends the file of the export job,
+    while the job is running - asks to reload the page
+    """
+    try:
+        get_export_posts(request, ids)
+    except askbot_exceptions.ExerciseHidden, error:
+        request.user.message_set.create(message = unicode(error))
+        return HttpResponseRedirect(reverse('index'))
+
+    status = reporter.get_export_job_status(job_id, to)
+    if status == 'done':
+        #the file is sent in blocks, not read into memory
+        export_file = open(reporter.get_export_path(job_id, to), 'rb')
+        resp = HttpResponse(
+                    FileWrapper(export_file),
+                    mimetype='application/octet-stream'
+                )
+        resp['Content-Length'] = os.path.getsize(export_file.name)
+        resp['Content-Disposition'] = 'attachment; filename="exercise.%s"' % to
+        return resp
+    elif status == 'pending':
+        resp = HttpResponse(
+                    _('The file is being prepared, please wait...'),
+                    status = 202
+                )
+        resp['Refresh'] = '3'
+        return resp
+    else:
+        raise Http404
@@ -37,6 +37,7 @@ from askbot.models.tag import Tag
 from askbot import const
 from askbot.utils import functions
 from askbot.utils.html import sanitize_html
+from askbot.utils.pagination import KeysetPaginator
 from askbot.utils.decorators import anonymous_forbidden, ajax_only, get_only
 from askbot.search.state_manager import SearchState, DummySearchState
 from askbot.templatetags import extra_tags
@@ -54,6 +55,16 @@ INDEX_TAGS_SIZE = 25
 # used in tags list
 DEFAULT_PAGE_SIZE = 60
 # used in exercises
+#sort methods of the exercise list that allow keyset pagination:
+#sort method -> (thread field, descending)
+KEYSET_PAGINATION_SORTS = {
+    'age-desc': ('added_at', True),
+    'age-asc': ('added_at', False),
+    'activity-desc': ('last_activity_at', True),
+    'activity-asc': ('last_activity_at', False),
+    'votes-desc': ('points', True),
+    'votes-asc': ('points', False),
+}
 # used in problems
 
 #refactor? - we have these
@@ -82,21 +93,50 @@ def exercises(request, **kwargs):
                 )
     page_size = int(askbot_settings.DEFAULT_EXERCISES_PAGE_SIZE)
 
-    qs, meta_data = models.Thread.objects.run_advanced_search(
-                        request_user=request.user, search_state=search_state
-                    )
+    keyset_sort = KEYSET_PAGINATION_SORTS.get(search_state.sort)
+    use_keyset_pagination = bool(
+        askbot_settings.EXERCISE_LIST_KEYSET_PAGINATION and keyset_sort
+    )
+    if use_keyset_pagination:
+        qs, meta_data = models.Thread.objects.run_advanced_search(
+                            request_user=request.user, search_state=search_state
+                        )
+    else:
+        #the ids of the threads found are cached
+        qs, meta_data = models.Thread.objects.run_cached_advanced_search(
+                            request_user=request.user, search_state=search_state
+                        )
     if meta_data['non_existing_tags']:
         search_state = search_state.remove_tags(meta_data['non_existing_tags'])
 
-    paginator = Paginator(qs, page_size)
-    if paginator.num_pages < search_state.page:
-        search_state.page = 1
-    page = paginator.page(search_state.page)
-    page.object_list = list(page.object_list) # evaluate the queryset
+    if use_keyset_pagination:
+        sort_field, descending = keyset_sort
+        paginator = KeysetPaginator(qs, page_size, sort_field, descending)
+        try:
+            page = paginator.page(search_state.page, after=search_state.after)
+        except InvalidPage:
+            search_state.page = 1
+            search_state.after = None
+            page = paginator.page(1)
+        next_cursor = page.get_next_cursor()
+        #the count is approximate, the page may be past its end
+        page_count = max(paginator.num_pages, page.number + int(page.has_next()))
+    else:
+        paginator = Paginator(qs, page_size)
+        if paginator.num_pages < search_state.page:
+            search_state.page = 1
+        page = paginator.page(search_state.page)
+        page.object_list = list(page.object_list) # evaluate the queryset
+        next_cursor = None
+        page_count = paginator.num_pages
 
     # INFO: Because for the time being we need exercise posts and thread authors
     #       down the pipeline, we have to precache them in thread objects
     models.Thread.objects.precache_view_data_hack(threads=page.object_list)
+    models.Thread.objects.precache_summary_html(
+                                    threads=page.object_list,
+                                    visitor=request.user
+                                )
 
     related_tags = Tag.objects.get_related_to_search(
                         threads=page.object_list,
@@ -115,12 +155,13 @@ def exercises(request, **kwargs):
     paginator_context = {
         'is_paginated' : (paginator.count > page_size),
 
-        'pages': paginator.num_pages,
+        'pages': page_count,
         'page': search_state.page,
         'has_previous': page.has_previous(),
         'has_next': page.has_next(),
         'previous': page.previous_page_number(),
         'next': page.next_page_number(),
+        'next_cursor': next_cursor,
 
         'base_url' : search_state.query_string(),
         'page_size' : page_size,
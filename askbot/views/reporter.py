@@ -4,11 +4,30 @@ export to pdf or word
 
 import PyRTF, Image, htmlentitydefs
 from StringIO import StringIO
-import os, re, urllib, datetime
+import os, re, urllib, datetime, tempfile, time
 from HTMLParser import HTMLParser
 from xhtml2pdf.document import pisaDocument
+from askbot.models import Thread
 from askbot.skins.loaders import get_template
+from askbot.utils import latex as latex_renderer
 from django.conf import settings
+from django.core import cache
+from django.utils.hashcompat import sha_constructor
+
+#directory of the generated export files, it must not be
+#served by the web server - the files are sent by the views
+EXPORT_DIR = getattr(
+    settings,
+    'ASKBOT_EXPORT_DIR',
+    os.path.join(tempfile.gettempdir(), 'askbot_exports')
+)
+#the files are reused while their content is current, but a new
+#file is made each time the threads change, so files older
+#than this number of seconds are removed when a job runs
+EXPORT_FILE_MAX_AGE = getattr(settings, 'ASKBOT_EXPORT_FILE_MAX_AGE', 6*60*60)
+EXPORT_JOB_STATUS_KEY_TPL = 'export-job-status-%s'
+#for how long a job is considered running
+EXPORT_JOB_TIMEOUT = 600
 
 #RE_LATEX = re.compile(r'(\${1,2})[^\$]+\1')
 RE_LATEX = re.compile(r'(!!)[^!]+\1')
@@ -25,6 +44,21 @@ RE_LATEX_INLINE1 = re.compile(r'\[\[\$.+?\$\]\]', re.S)
 RE_LATEX_INLINE2 = re.compile(r'\\\(.+?\\\)', re.S)
 RE_LATEX_BLOCK1 = re.compile(r'\[\[math\]\].+?\[\[\/math\]\]', re.S)
 RE_LATEX_BLOCK2 = re.compile(r'\\\[.+?\\\]', re.S)
+#all four kinds of formulas, to find them in one pass
+RE_LATEX_ANY = re.compile(
+    '|'.join([
+        RE_LATEX_INLINE1.pattern,
+        RE_LATEX_INLINE2.pattern,
+        RE_LATEX_BLOCK1.pattern,
+        RE_LATEX_BLOCK2.pattern
+    ]),
+    re.S
+)
+
+#images of the formulas are put in place of these
+#after all formulas of the document are collected
+LATEX_IMG_PLACEHOLDER = '<<<latex-img-%d>>>'
+RE_LATEX_IMG_PLACEHOLDER = re.compile(r'<<<latex-img-(\d+)>>>')
 
 
 def report(type, exercises, with_solutions=True, base_url='http://localhost'):
@@ -57,6 +91,138 @@ def report(type, exercises, with_solutions=True, base_url='http://localhost'):
         return html2text(text)
 
 
+TXT_SEPARATOR = '\r\n' + '-' * 80 + '\r\n\r\n'
+
+def iter_report_html(type, exercises, with_solutions=True, base_url='http://localhost'):
+    '''
+    render the report template one exercise at a time
+    '''
+    now = datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S')
+    template = get_template('report/%s.html' % type)
+    for exercise in exercises:
+        yield template.render({
+            'exercises': [exercise],
+            'with_solutions': with_solutions,
+            'now': now,
+            'base_url': base_url,
+        })
+
+
+def write_report(type, exercises, output, with_solutions=True, base_url='http://localhost'):
+    '''
+    write pdf/rtf/txt report into the file object ``output``,
+    the txt and rtf reports are converted one exercise at a time,
+    without the html of all exercises in memory
+    '''
+    if type == 'pdf':
+        data = report(type, exercises, with_solutions, base_url)
+        if data is None:
+            raise ValueError('could not render the pdf report')
+        output.write(data)
+        return
+
+    chunks = iter_report_html(type, exercises, with_solutions, base_url)
+    if type == 'rtf':
+        convetor = HTML2RTF()
+        for text in chunks:
+            convetor.feed(latex2img(text))
+        convetor.write_rtf(output)
+    else:
+        for index, text in enumerate(chunks):
+            if index > 0:
+                output.write(TXT_SEPARATOR)
+            text = html2text(html_entity_decode(text))
+            output.write(text.encode('utf-8'))
+
+
+def get_export_job_id(type, posts, user, with_solutions, base_url):
+    """returns id of the export of the exercise ``posts``,
+    the same for the same selection while the threads are not
+    updated, and different for users who see different posts
+    of the threads
+    """
+    parts = [settings.SECRET_KEY, type, str(with_solutions), base_url]
+    for post in posts:
+        thread = post.thread
+        group_ids = thread.get_visible_post_group_ids(user)
+        parts.append(str(thread.last_activity_at))
+        parts.append(
+            thread.get_post_data_cache_key(
+                group_ids = group_ids,
+                is_author = (post.author_id == user.id)
+            )
+        )
+    return sha_constructor('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def get_export_path(job_id, type):
+    return os.path.join(EXPORT_DIR, '%s.%s' % (job_id, type))
+
+
+def get_export_job_status(job_id, type):
+    """returns 'done', 'pending', 'failed' or
+    ``None`` if the job has not been started
+    """
+    if os.path.exists(get_export_path(job_id, type)):
+        return 'done'
+    return cache.cache.get(EXPORT_JOB_STATUS_KEY_TPL % job_id)
+
+
+def set_export_job_status(job_id, status):
+    cache.cache.set(
+        EXPORT_JOB_STATUS_KEY_TPL % job_id, status, EXPORT_JOB_TIMEOUT
+    )
+
+
+def remove_old_exports(max_age = EXPORT_FILE_MAX_AGE):
+    """deletes the export files older than ``max_age`` seconds"""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    oldest_time = time.time() - max_age
+    for file_name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, file_name)
+        try:
+            if os.path.getmtime(path) < oldest_time:
+                os.remove(path)
+        except OSError:
+            #removed by another job
+            pass
+
+
+def export(job_id, type, posts, user, with_solutions, base_url):
+    """renders report of the exercise ``posts``
+    into the file of the job, posts of all the threads
+    are loaded with one query
+    """
+    threads = [post.thread for post in posts]
+    post_data = Thread.objects.get_post_data_for_threads(threads, user = user)
+
+    exercises = []
+    for post in posts:
+        exercise_post, problems, _, _ = post_data[post.thread_id]
+        if exercise_post is not None:
+            post.set_cached_comments(exercise_post.get_cached_comments())
+        exercises.append({
+            'post': post,
+            'problems': problems
+        })
+
+    remove_old_exports()
+    if not os.path.isdir(EXPORT_DIR):
+        os.makedirs(EXPORT_DIR)
+    #the file appears at once, when it is complete
+    handle, temp_path = tempfile.mkstemp(dir = EXPORT_DIR)
+    output = os.fdopen(handle, 'wb')
+    try:
+        write_report(type, exercises, output, with_solutions, base_url)
+        output.close()
+        os.rename(temp_path, get_export_path(job_id, type))
+    finally:
+        output.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
 # handle uploaded images
 def _upfile_path(path, _):
     if path.startswith(settings.MEDIA_URL):
@@ -70,7 +236,7 @@ def _repl(obj):
     return '<img src="http://www.forkosh.com/mathtex.cgi?%s" /><latex>(%s)</latex>' % (urllib.quote(latex), latex)
 
 
-def _repl_inline_block(obj):
+def _repl_inline_block(obj, formulas):
     latex = obj.group(0)
     inline = True
 
@@ -85,7 +251,9 @@ def _repl_inline_block(obj):
         latex = latex[2:-2]
         inline = False
 
-    ret = '<img src="http://www.forkosh.com/mathtex.cgi?%s" /><latex>(%s)</latex>' % (urllib.quote(latex), latex)
+    src = LATEX_IMG_PLACEHOLDER % len(formulas)
+    formulas.append(latex)
+    ret = '<img src="%s" /><latex>(%s)</latex>' % (src, latex)
     if not inline:
         ret = '<div><p class="center">%s</p></div>' % ret
     return ret
@@ -117,11 +285,15 @@ def latex2img(html):
     find and replace latex expr to html img
     '''
     #return RE_LATEX.sub(_repl, html)
-    ret = RE_LATEX_INLINE1.sub(_repl_inline_block, html)
-    ret = RE_LATEX_INLINE2.sub(_repl_inline_block, ret)
-    ret = RE_LATEX_BLOCK1.sub(_repl_inline_block, ret)
-    ret = RE_LATEX_BLOCK2.sub(_repl_inline_block, ret)
-    return ret
+    formulas = []
+    repl = lambda obj: _repl_inline_block(obj, formulas)
+    ret = RE_LATEX_ANY.sub(repl, html)
+
+    #formulas missing in the cache are rendered all at once
+    urls = latex_renderer.get_image_urls(formulas)
+    return RE_LATEX_IMG_PLACEHOLDER.sub(
+        lambda obj: urls[int(obj.group(1))], ret
+    )
 
 
 def _repl_code(obj):
@@ -157,10 +329,7 @@ def _repl_strip(obj):
     ret = RE_CODE.sub(_repl_code, obj.group(1))
     ret = RE_BLOCKQUOTE.sub(_repl_code, ret)
 
-    ret = RE_LATEX_INLINE1.sub(_repl_inline_block2, ret)
-    ret = RE_LATEX_INLINE2.sub(_repl_inline_block2, ret)
-    ret = RE_LATEX_BLOCK1.sub(_repl_inline_block2, ret)
-    ret = RE_LATEX_BLOCK2.sub(_repl_inline_block2, ret)
+    ret = RE_LATEX_ANY.sub(_repl_inline_block2, ret)
 
     ret = RE_OL.sub(_repl_ol, ret)
     ret = RE_UL.sub(_repl_ul, ret)
@@ -300,13 +469,16 @@ class HTML2RTF(HTMLParser):
             self._section.append(p)
 
     def get_rtf(self):
-        self._do_queue()
-        DR = PyRTF.Renderer()
         fp = StringIO()
         try:
-            DR.Write(self._doc, fp)
+            self.write_rtf(fp)
             return fp.getvalue()
         except:
             pass
         finally:
             fp.close()
+
+    def write_rtf(self, fp):
+        self._do_queue()
+        DR = PyRTF.Renderer()
+        DR.Write(self._doc, fp)
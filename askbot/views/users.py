@@ -418,8 +418,7 @@ def user_stats(request, user, context):
     #
     # Votes
     #
-    up_votes = models.Vote.objects.get_up_vote_count_from_user(user)
-    down_votes = models.Vote.objects.get_down_vote_count_from_user(user)
+    up_votes, down_votes = models.Vote.objects.get_vote_counts_from_user(user)
     votes_today = models.Vote.objects.get_votes_count_today_from_user(user)
     votes_total = askbot_settings.MAX_VOTES_PER_USER_PER_DAY
 
@@ -549,146 +548,28 @@ def user_stats(request, user, context):
 
 def user_recent(request, user, context):
 
-    def get_type_name(type_id):
-        for item in const.TYPE_ACTIVITY:
-            if type_id in item:
-                return item[1]
-
-    class Event(object):
-        is_badge = False
-        def __init__(self, time, type, title, summary, problem_id, exercise_id):
-            self.time = time
-            self.type = get_type_name(type)
-            self.type_id = type
-            self.title = title
-            self.summary = summary
-            slug_title = slugify(title)
-            self.title_link = reverse(
-                                'exercise',
-                                kwargs={'id':exercise_id}
-                            ) + u'%s' % slug_title
-            if int(problem_id) > 0:
-                self.title_link += '#%s' % problem_id
-
-    class AwardEvent(object):
-        is_badge = True
-        def __init__(self, time, type, content_object, badge):
-            self.time = time
-            self.type = get_type_name(type)
-            self.content_object = content_object
-            self.badge = badge
-
-    activities = []
-
-    # TODO: Don't process all activities here for the user, only a subset ([:const.USER_VIEW_DATA_SIZE])
-    for activity in models.Activity.objects.filter(user=user):
-
-        # TODO: multi-if means that we have here a construct for which a design pattern should be used
-
-        # ask exercises
-        if activity.activity_type == const.TYPE_ACTIVITY_ASK_EXERCISE:
-            q = activity.content_object
-            if q.deleted:
-                activities.append(Event(
-                    time=activity.active_at,
-                    type=activity.activity_type,
-                    title=q.thread.title,
-                    summary='', #q.summary,  # TODO: was set to '' before, but that was probably wrong
-                    problem_id=0,
-                    exercise_id=q.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_PROBLEM:
-            ans = activity.content_object
-            exercise = ans.thread._exercise_post()
-            if not ans.deleted and not exercise.deleted:
-                activities.append(Event(
-                    time=activity.active_at,
-                    type=activity.activity_type,
-                    title=ans.thread.title,
-                    summary=exercise.summary,
-                    problem_id=ans.id,
-                    exercise_id=exercise.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_COMMENT_EXERCISE:
-            cm = activity.content_object
-            q = cm.parent
-            assert q.is_exercise()
-            if not q.deleted:
-                activities.append(Event(
-                    time=cm.added_at,
-                    type=activity.activity_type,
-                    title=q.thread.title,
-                    summary='',
-                    problem_id=0,
-                    exercise_id=q.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_COMMENT_PROBLEM:
-            cm = activity.content_object
-            ans = cm.parent
-            assert ans.is_problem()
-            exercise = ans.thread._exercise_post()
-            if not ans.deleted and not exercise.deleted:
-                activities.append(Event(
-                    time=cm.added_at,
-                    type=activity.activity_type,
-                    title=ans.thread.title,
-                    summary='',
-                    problem_id=ans.id,
-                    exercise_id=exercise.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_UPDATE_EXERCISE:
-            q = activity.content_object
-            if not q.deleted:
-                activities.append(Event(
-                    time=activity.active_at,
-                    type=activity.activity_type,
-                    title=q.thread.title,
-                    summary=q.summary,
-                    problem_id=0,
-                    exercise_id=q.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_UPDATE_PROBLEM:
-            ans = activity.content_object
-            exercise = ans.thread._exercise_post()
-            if not ans.deleted and not exercise.deleted:
-                activities.append(Event(
-                    time=activity.active_at,
-                    type=activity.activity_type,
-                    title=ans.thread.title,
-                    summary=ans.summary,
-                    problem_id=ans.id,
-                    exercise_id=exercise.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_MARK_PROBLEM:
-            ans = activity.content_object
-            exercise = ans.thread._exercise_post()
-            if not ans.deleted and not exercise.deleted:
-                activities.append(Event(
-                    time=activity.active_at,
-                    type=activity.activity_type,
-                    title=ans.thread.title,
-                    summary='',
-                    problem_id=0,
-                    exercise_id=exercise.id
-                ))
-
-        elif activity.activity_type == const.TYPE_ACTIVITY_PRIZE:
-            award = activity.content_object
-            if award is not None:#todo: work around halfa$$ comment deletion
-                activities.append(AwardEvent(
-                    time=award.awarded_at,
-                    type=activity.activity_type,
-                    content_object=award.content_object,
-                    badge=award.badge,
-                ))
-
-    activities.sort(key=operator.attrgetter('time'), reverse=True)
+    try:
+        page = int(request.GET.get('page', '1'))
+    except ValueError:
+        page = 1
+
+    entries = models.UserTimelineEntry.objects.get_for_user(user)
+    objects_list = Paginator(entries, const.USER_VIEW_DATA_SIZE)
+    try:
+        activities_page = objects_list.page(page)
+    except (EmptyPage, InvalidPage):
+        activities_page = objects_list.page(objects_list.num_pages)
+
+    paginator_data = {
+        'is_paginated' : (objects_list.num_pages > 1),
+        'pages': objects_list.num_pages,
+        'page': activities_page.number,
+        'has_previous': activities_page.has_previous(),
+        'has_next': activities_page.has_next(),
+        'previous': activities_page.previous_page_number(),
+        'next': activities_page.next_page_number(),
+        'base_url' : request.path + '?sort=recent&amp;'
+    }
 
     data = {
         'active_tab': 'users',
@@ -696,7 +577,8 @@ def user_recent(request, user, context):
         'tab_name' : 'recent',
         'tab_description' : _('recent user activity'),
         'page_title' : _('profile - recent activity'),
-        'activities' : activities[:const.USER_VIEW_DATA_SIZE]
+        'activities' : activities_page.object_list,
+        'paginator_context': functions.setup_paginator(paginator_data)
     }
     context.update(data)
     return render_into_skin('user_profile/user_recent.html', context, request)